@@ -13,6 +13,7 @@
 # - Implementing custom pytest markers.
 
 import atexit
+import collections
 import configparser
 import errno
 import filelock
@@ -88,6 +89,15 @@ def pytest_addoption(parser):
     parser.addoption('--role', help='U-Boot board role (for Labgrid-sjg)')
     parser.addoption('--use-running-system', default=False, action='store_true',
         help="Assume that U-Boot is ready and don't wait for a prompt")
+    parser.addoption('--json-log', default=False, action='store_true',
+        help='Write the log as JSON lines while running, converting it to ' +
+        'HTML at the end')
+    parser.addoption('--ut-batch', default=False, action='store_true',
+        help='Run each suite of unit tests with a single ut command (not ' +
+        'used with pytest-xdist)')
+    parser.addoption('--sandbox-pool', default=False, action='store_true',
+        help='Keep a spare sandbox booting in the background, to use when ' +
+        'U-Boot is restarted')
 
 def run_build(config, source_dir, build_dir, board_type, log):
     """run_build: Build U-Boot
@@ -260,7 +270,10 @@ def pytest_configure(config):
         raise Exception('--gdbserver only supported with sandbox targets')
 
     import multiplexed_log
-    log = multiplexed_log.Logfile(result_dir + '/test-log.html')
+    json_fn = None
+    if config.getoption('json_log'):
+        json_fn = result_dir + '/test-log.jsonl'
+    log = multiplexed_log.Logfile(result_dir + '/test-log.html', json_fn)
 
     if config.getoption('build'):
         worker_id = os.environ.get("PYTEST_XDIST_WORKER")
@@ -312,6 +325,8 @@ def pytest_configure(config):
     ubconfig.board_identity = board_identity
     ubconfig.gdbserver = gdbserver
     ubconfig.use_running_system = config.getoption('use_running_system')
+    ubconfig.sandbox_pool = config.getoption('sandbox_pool')
+    ubconfig.ut_suite_tests = {}
     ubconfig.dtb = build_dir + '/arch/sandbox/dts/test.dtb'
     ubconfig.connection_ok = True
 
@@ -374,6 +389,10 @@ def generate_ut_subtest(metafunc, fixture_name, sym_path):
 
         vals.append(f'{suite} {name}')
 
+    # Record the number of tests in each suite, for use by --ut-batch
+    console.config.ut_suite_tests[fixture_name] = collections.Counter(
+        val.split()[0] for val in vals)
+
     ids = ['ut_' + s.replace(' ', '_') for s in vals]
     metafunc.parametrize(fixture_name, vals, ids=ids)
 
@@ -9,12 +9,21 @@ each represented in a well-delineated/-structured fashion.
 
 import datetime
 import html
+import json
 import os.path
 import shutil
 import subprocess
+import threading
+import time
 
 mod_dir = os.path.dirname(os.path.abspath(__file__))
 
+# Size of the buffer used for the log files
+BUFFER_SIZE = 1 << 20
+
+# Minimum time between flushes of the log files to disk, in seconds
+FLUSH_INTERVAL = 1
+
 class LogfileStream(object):
     """A file-like object used to write a single logical stream of data into
     a multiplexed log file. Objects of this type should be created by factory
@@ -215,17 +224,24 @@ class Logfile:
     """Generates an HTML-formatted log file containing multiple streams of
     data, each represented in a well-delineated/-structured fashion."""
 
-    def __init__(self, fn):
+    def __init__(self, fn, json_fn=None):
         """Initialize a new object.
 
         Args:
             fn: The filename to write to.
+            json_fn: If not None, the log is written to this file in a compact
+                JSON-lines format while running, then converted to HTML in
+                fn by close(). This gives a machine-readable record of the
+                run.
 
         Returns:
             Nothing.
         """
 
-        self.f = open(fn, 'wt', encoding='utf-8')
+        self.fn = fn
+        self.json_fn = json_fn
+        self.json = None
+        self.f = None
         self.last_stream = None
         self.blocks = []
         self.cur_evt = 1
@@ -234,7 +250,15 @@ class Logfile:
         self.timestamp_prev = self.timestamp_start
         self.timestamp_blocks = []
         self.seen_warning = False
+        self.last_flush = time.monotonic()
+        # Tests may run commands from more than one thread
+        self.lock = threading.Lock()
 
+        if json_fn:
+            self.json = open(json_fn, 'wt', encoding='utf-8',
+                             buffering=BUFFER_SIZE)
+            return
+        self.f = open(fn, 'wt', encoding='utf-8', buffering=BUFFER_SIZE)
         shutil.copy(mod_dir + '/multiplexed_log.css', os.path.dirname(fn))
         self.f.write('''\
 <html>
@@ -315,6 +339,11 @@ $(document).ready(function () {
             Nothing.
         """
 
+        if self.json:
+            self.json.close()
+            self.json = None
+            render_json(self.json_fn, self.fn)
+            return
         self.f.write('''\
 </tt>
 </body>
@@ -328,6 +357,13 @@ $(document).ready(function () {
     _nonprint.update(c for c in range(0, 32) if c not in (9, 10))
     _nonprint.update(range(127, 256))
 
+    # Translation table for _escape(), which drops carriage returns and shows
+    # the characters above as hexadecimal codes. The '%' character is handled
+    # separately, since it is common and str.translate() is much faster when
+    # few characters are replaced by strings
+    _escape_table = {c: '%%%02x' % c for c in _nonprint if c != ord('%')}
+    _escape_table[13] = None
+
     def _escape(self, data):
         """Render data format suitable for inclusion in an HTML document.
 
@@ -341,11 +377,39 @@ $(document).ready(function () {
             An escaped version of the data.
         """
 
-        data = data.replace(chr(13), '')
-        data = ''.join((ord(c) in self._nonprint) and ('%%%02x' % ord(c)) or
-                       c for c in data)
-        data = html.escape(data)
-        return data
+        data = data.replace('%', '%25').translate(self._escape_table)
+        return html.escape(data)
+
+    def _record(self, *event):
+        """Record an event in the JSON-lines log file.
+
+        Args:
+            event: Type of event followed by its arguments, as passed to
+                the matching _emit_...() function
+
+        Returns:
+            Nothing.
+        """
+
+        self.json.write(json.dumps(event, separators=(',', ':')) + '\n')
+
+    def _replay(self, event):
+        """Write an event from a JSON-lines log file to the HTML log file.
+
+        Args:
+            event: Event as recorded by _record()
+
+        Returns:
+            Nothing.
+        """
+
+        emit = {
+            'note': self._emit_note,
+            'start': self._emit_section_start,
+            'end': self._emit_section_end,
+            'write': self._emit_write,
+        }
+        emit[event[0]](*event[1:])
 
     def _terminate_stream(self):
         """Write HTML to the log file to terminate the current stream's data.
@@ -362,7 +426,7 @@ $(document).ready(function () {
             return
         self.f.write('</pre>\n')
         self.f.write('<div class="stream-trailer block-trailer">End stream: ' +
-                     self.last_stream.name + '</div>\n')
+                     self.last_stream[1] + '</div>\n')
         self.f.write('</div>\n')
         self.f.write('</div>\n')
         self.last_stream = None
@@ -380,6 +444,24 @@ $(document).ready(function () {
             Nothing.
         """
 
+        with self.lock:
+            self._emit_note(note_type, msg, anchor)
+
+    def _emit_note(self, note_type, msg, anchor):
+        """Write the HTML for a note, or record it in the JSON-lines log.
+
+        Args:
+            note_type: The type of note.
+            msg: The note/message to log.
+            anchor: Optional internal link target, or None.
+
+        Returns:
+            Nothing.
+        """
+
+        if self.json:
+            self._record('note', note_type, msg, anchor)
+            return
         self._terminate_stream()
         self.f.write('<div class="' + note_type + '">\n')
         self.f.write('<pre>')
@@ -403,20 +485,35 @@ $(document).ready(function () {
             Name of the HTML anchor emitted before section.
         """
 
-        self._terminate_stream()
         self.blocks.append(marker)
         self.timestamp_blocks.append(self._get_time())
         if not anchor:
             self.anchor += 1
             anchor = str(self.anchor)
-        blk_path = '/'.join(self.blocks)
+        self._emit_section_start(anchor, '/'.join(self.blocks))
+        self.timestamp()
+
+        return anchor
+
+    def _emit_section_start(self, anchor, blk_path):
+        """Write the HTML to start a section, or record it in the JSON log.
+
+        Args:
+            anchor: The value to use for the anchor.
+            blk_path: Full name of the section, including parent sections.
+
+        Returns:
+            Nothing.
+        """
+
+        if self.json:
+            self._record('start', anchor, blk_path)
+            return
+        self._terminate_stream()
         self.f.write('<div class="section block" id="' + anchor + '">\n')
         self.f.write('<div class="section-header block-header">Section: ' +
                      blk_path + '</div>\n')
         self.f.write('<div class="section-content block-content">\n')
-        self.timestamp()
-
-        return anchor
 
     def end_section(self, marker):
         """Terminate the current nested section in the log file.
@@ -434,18 +531,33 @@ $(document).ready(function () {
         if (not self.blocks) or (marker != self.blocks[-1]):
             raise Exception('Block nesting mismatch: "%s" "%s"' %
                             (marker, '/'.join(self.blocks)))
-        self._terminate_stream()
         timestamp_now = self._get_time()
         timestamp_section_start = self.timestamp_blocks.pop()
         delta_section = timestamp_now - timestamp_section_start
         self._note("timestamp",
             "TIME: SINCE-SECTION: " + str(delta_section))
-        blk_path = '/'.join(self.blocks)
+        self._emit_section_end('/'.join(self.blocks))
+        self.blocks.pop()
+        self.flush(force=True)
+
+    def _emit_section_end(self, blk_path):
+        """Write the HTML to end a section, or record it in the JSON log.
+
+        Args:
+            blk_path: Full name of the section, including parent sections.
+
+        Returns:
+            Nothing.
+        """
+
+        if self.json:
+            self._record('end', blk_path)
+            return
+        self._terminate_stream()
         self.f.write('<div class="section-trailer block-trailer">' +
                      'End section: ' + blk_path + '</div>\n')
         self.f.write('</div>\n')
         self.f.write('</div>\n')
-        self.blocks.pop()
 
     def section(self, marker, anchor=None):
         """Create a temporary section in the log file.
@@ -687,11 +799,30 @@ $(document).ready(function () {
             Nothing.
         """
 
-        if stream != self.last_stream:
+        with self.lock:
+            self._emit_write(id(stream), stream.name, data, implicit)
+
+    def _emit_write(self, stream_id, name, data, implicit):
+        """Write the HTML for stream data, or record it in the JSON log.
+
+        Args:
+            stream_id: Value which identifies the stream
+            name: The name of the stream.
+            data: The data to log.
+            implicit: Boolean indicating whether data was implicitly generated.
+
+        Returns:
+            Nothing.
+        """
+
+        if self.json:
+            self._record('write', stream_id, name, data, implicit)
+            return
+        if (stream_id, name) != self.last_stream:
             self._terminate_stream()
             self.f.write('<div class="stream block">\n')
             self.f.write('<div class="stream-header block-header">Stream: ' +
-                         stream.name + '</div>\n')
+                         name + '</div>\n')
             self.f.write('<div class="stream-content block-content">\n')
             self.f.write('<pre>')
         if implicit:
@@ -699,16 +830,42 @@ $(document).ready(function () {
         self.f.write(self._escape(data))
         if implicit:
             self.f.write('</span>')
-        self.last_stream = stream
+        self.last_stream = (stream_id, name)
 
-    def flush(self):
+    def flush(self, force=False):
         """Flush the log stream, to ensure correct log interleaving.
 
+        Since this is called after every read from the console, the data is
+        only actually written to disk every FLUSH_INTERVAL seconds, and at
+        the end of each section.
+
         Args:
-            None.
+            force: True to write the data to disk now
 
         Returns:
             Nothing.
         """
 
-        self.f.flush()
+        now = time.monotonic()
+        if not force and now - self.last_flush < FLUSH_INTERVAL:
+            return
+        self.last_flush = now
+        (self.json or self.f).flush()
+
+
+def render_json(json_fn, fn):
+    """Convert a JSON-lines log file into an HTML log file.
+
+    Args:
+        json_fn: The JSON-lines file written by a Logfile
+        fn: The HTML filename to write to.
+
+    Returns:
+        Nothing.
+    """
+
+    log = Logfile(fn)
+    with open(json_fn, encoding='utf-8') as inf:
+        for line in inf:
+            log._replay(json.loads(line))
+    log.close()
@@ -5,10 +5,147 @@
 
 """Helper functions for dealing with filesystems"""
 
+import fcntl
+import functools
+import glob
+import hashlib
 import re
 import os
+import shutil
 from subprocess import call, check_call, check_output, CalledProcessError
 
+# Subdirectory of the persistent-data directory which holds cached images
+CACHE_DIR = 'image-cache'
+
+# Number of hex digits of the hash to use in cached-image filenames
+KEY_LEN = 16
+
+def get_image_key(recipe, inputs):
+    """Work out the cache key for an image
+
+    Args:
+        recipe (str): Description of how the image is built, including any
+            parameters
+        inputs (list of str): Files which are used to build the image
+
+    Returns:
+        str: Hex digest identifying the image
+    """
+    digest = hashlib.sha256(recipe.encode('utf-8'))
+    for fname in inputs:
+        digest.update(b'\0' + fname.encode('utf-8') + b'\0')
+        if os.path.exists(fname):
+            with open(fname, 'rb') as inf:
+                digest.update(hashlib.sha256(inf.read()).digest())
+        else:
+            digest.update(b'missing')
+    return digest.hexdigest()[:KEY_LEN]
+
+@functools.lru_cache(maxsize=None)
+def get_tool_version(tool):
+    """Get a string which changes whenever a tool is upgraded
+
+    This uses a hash of the tool's executable rather than its version output,
+    since not all tools (e.g. cgpt) can report a version and locally built
+    tools such as mkimage may change without their version changing.
+
+    Args:
+        tool (str): Name of the tool, e.g. 'mkfs.ext4'
+
+    Returns:
+        str: Hex digest of the executable, or 'missing' if it is not found
+    """
+    path = os.pathsep.join([os.environ.get('PATH', ''), '/sbin', '/usr/sbin'])
+    fname = shutil.which(tool, path=path)
+    if not fname:
+        return 'missing'
+    with open(fname, 'rb') as inf:
+        return hashlib.sha256(inf.read()).hexdigest()[:KEY_LEN]
+
+def remove_stale_images(cache_dir, base, keep):
+    """Remove cached images with the same name but a different key
+
+    Each image is only removed if its lock can be taken without waiting, so
+    an image which another process is copying from is left alone. It will be
+    removed next time a new image is added.
+
+    Args:
+        cache_dir (str): Cache directory
+        base (str): Base filename of the image, e.g. 'mmc1.img'
+        keep (str): Path of the cached image to keep
+    """
+    for old in glob.glob(os.path.join(cache_dir, f'{base}-*')):
+        if old == keep or old.endswith('.lock') or '.tmp' in old:
+            continue
+        with open(f'{old}.lock', 'w', encoding='utf-8') as lockf:
+            try:
+                fcntl.flock(lockf, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                continue
+            if os.path.exists(old):
+                os.remove(old)
+            os.remove(f'{old}.lock')
+
+def copy_image(src, dst):
+    """Copy a disk image, keeping it sparse
+
+    The copy is written to a temporary file and then renamed, so that other
+    processes never see a partial image.
+
+    Args:
+        src (str): Filename to copy from
+        dst (str): Filename to copy to
+    """
+    tmp = f'{dst}.tmp{os.getpid()}'
+    check_call(['cp', '--sparse=always', '--reflink=auto', src, tmp])
+    os.replace(tmp, dst)
+
+def cached_image(config, fname, recipe, build, inputs=(), tools=()):
+    """Create an image, reusing a cached copy if one exists
+
+    Images are cached in the persistent-data directory, keyed on the recipe,
+    the contents of the inputs and the tools used, so they are shared between
+    test runs and between xdist workers. Each cached image has a lock file:
+    a process building the image holds it exclusively and processes copying
+    the image hold it shared. Older images with the same name are removed
+    when a new one is added, unless they are still in use.
+
+    Args:
+        config (u_boot_config): U-Boot configuration
+        fname (str): Filename of the image to create
+        recipe (str): Description of how the image is built, including any
+            parameters which affect the result
+        build (function): Function to call to build the image if it is not in
+            the cache. This is called with fname as its only argument and must
+            write the image to that file.
+        inputs (list of str): Files which are used to build the image
+        tools (list of str): Tools which are used to build the image, e.g.
+            'sfdisk'. The image is rebuilt if any of these changes.
+
+    Returns:
+        bool: True if the image came from the cache, False if it was built
+    """
+    cache_dir = os.path.join(config.persistent_data_dir, CACHE_DIR)
+    os.makedirs(cache_dir, exist_ok=True)
+    base = os.path.basename(fname)
+    for tool in tools:
+        recipe += f' {tool}={get_tool_version(tool)}'
+    key = get_image_key(recipe, inputs)
+    cached = os.path.join(cache_dir, f'{base}-{key}')
+    with open(f'{cached}.lock', 'w', encoding='utf-8') as lockf:
+        fcntl.flock(lockf, fcntl.LOCK_SH)
+        if not os.path.exists(cached):
+            # Converting to an exclusive lock is not atomic, so check again
+            fcntl.flock(lockf, fcntl.LOCK_EX)
+            if not os.path.exists(cached):
+                build(fname)
+                copy_image(fname, cached)
+                fcntl.flock(lockf, fcntl.LOCK_UN)
+                remove_stale_images(cache_dir, base, cached)
+                return False
+        copy_image(cached, fname)
+    return True
+
 def mk_fs(config, fs_type, size, prefix, size_gran = 0x100000):
     """Create a file system volume
 
@@ -19,6 +156,9 @@ def mk_fs(config, fs_type, size, prefix, size_gran = 0x100000):
         prefix (str): Prefix string of volume's file name
         size_gran (int): Size granularity of file system image in bytes
 
+    Returns:
+        str: Filename of the image
+
     Raises:
         CalledProcessError: if any error occurs when creating the filesystem
     """
@@ -45,20 +185,28 @@ def mk_fs(config, fs_type, size, prefix, size_gran = 0x100000):
     if '/sbin' not in os.environ["PATH"].split(os.pathsep):
         os.environ["PATH"] += os.pathsep + '/sbin'
 
-    try:
-        check_call(f'rm -f {fs_img}', shell=True)
-        check_call(f'dd if=/dev/zero of={fs_img} bs={size_gran} count={count}',
-                   shell=True)
-        check_call(f'mkfs.{fs_lnxtype} {mkfs_opt} {fs_img}', shell=True)
-        if fs_type == 'ext4':
-            sb_content = check_output(f'tune2fs -l {fs_img}',
-                                      shell=True).decode()
-            if 'metadata_csum' in sb_content:
-                check_call(f'tune2fs -O ^metadata_csum {fs_img}', shell=True)
-        return fs_img
-    except CalledProcessError:
-        call(f'rm -f {fs_img}', shell=True)
-        raise
+    def build(fs_img):
+        try:
+            check_call(f'rm -f {fs_img}', shell=True)
+            check_call(f'dd if=/dev/zero of={fs_img} bs={size_gran} '
+                       f'count={count}', shell=True)
+            check_call(f'mkfs.{fs_lnxtype} {mkfs_opt} {fs_img}', shell=True)
+            if fs_type == 'ext4':
+                sb_content = check_output(f'tune2fs -l {fs_img}',
+                                          shell=True).decode()
+                if 'metadata_csum' in sb_content:
+                    check_call(f'tune2fs -O ^metadata_csum {fs_img}',
+                               shell=True)
+        except CalledProcessError:
+            call(f'rm -f {fs_img}', shell=True)
+            raise
+
+    tools = ['dd', f'mkfs.{fs_lnxtype}']
+    if fs_type == 'ext4':
+        tools.append('tune2fs')
+    cached_image(config, fs_img, f'mk_fs {fs_type} {count} {size_gran}',
+                 build, [__file__], tools)
+    return fs_img
 
 # Just for trying out
 if __name__ == "__main__":
@@ -0,0 +1,65 @@
+# SPDX-License-Identifier: GPL-2.0+
+
+"""Test the helpers used by the --sandbox-pool option
+
+These tests use temporary files instead of U-Boot, so they do not need a
+board or a build.
+"""
+
+import os
+import time
+import types
+
+from u_boot_console_sandbox import ConsoleSandbox
+
+def make_console(tmp_path):
+    """Create a fake console with source and persistent-data directories
+
+    Args:
+        tmp_path (pathlib.Path): Directory to put the files in
+
+    Returns:
+        types.SimpleNamespace: Fake console with 'config' and 'log' attributes
+    """
+    for name in ['src', 'src/sub/dir', 'src/.git', 'data/mnt']:
+        os.makedirs(tmp_path / name, exist_ok=True)
+    (tmp_path / 'test.dtb').write_bytes(b'dtb')
+    config = types.SimpleNamespace(source_dir=str(tmp_path / 'src'),
+                                   persistent_data_dir=str(tmp_path / 'data'),
+                                   dtb=str(tmp_path / 'test.dtb'))
+    log = types.SimpleNamespace(fn=str(tmp_path / 'src' / 'test-log.html'),
+                                json_fn=None)
+    return types.SimpleNamespace(config=config, log=log)
+
+def age_files(tmp_path):
+    """Set the modification time of all files to an hour ago
+
+    Args:
+        tmp_path (pathlib.Path): Directory containing the files
+    """
+    old = time.time() - 3600
+    for root, _, files in os.walk(tmp_path):
+        for name in files:
+            os.utime(os.path.join(root, name), (old, old))
+
+def test_files_changed(tmp_path):
+    """Test detecting files changed since the spare was started"""
+    cons = make_console(tmp_path)
+    age_files(tmp_path)
+    since = time.time() - 60
+    assert not ConsoleSandbox.files_changed(cons, since)
+
+    for fname in ['src/mmc1.img', 'src/sub/dir/disk.img', 'data/mnt/file',
+                  'test.dtb']:
+        (tmp_path / fname).write_bytes(b'new')
+        assert ConsoleSandbox.files_changed(cons, since), fname
+        age_files(tmp_path)
+
+    # Files which sandbox does not read are ignored
+    for fname in ['src/test-log.html', 'src/.git/index']:
+        (tmp_path / fname).write_bytes(b'new')
+        assert not ConsoleSandbox.files_changed(cons, since), fname
+
+    # A broken symlink is ignored too
+    os.symlink(tmp_path / 'missing', tmp_path / 'src' / 'link')
+    assert not ConsoleSandbox.files_changed(cons, since)
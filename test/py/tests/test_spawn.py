@@ -0,0 +1,106 @@
+# SPDX-License-Identifier: GPL-2.0+
+
+"""Test the console-matching logic in u_boot_spawn
+
+These tests use a fake child process instead of U-Boot, so they do not need
+a board or a build.
+"""
+
+import re
+import sys
+
+import pytest
+
+import u_boot_spawn
+
+# Child process which prints a large amount of output in small pieces,
+# including escape sequences split across writes, then a prompt
+FAKE_CHILD = r'''
+import os, sys
+lines = int(sys.argv[1])
+os.write(1, b'start\n')
+for i in range(lines):
+    os.write(1, b'%08x: 00112233 44556677 8899aabb ccddeeff  \x1b[' % (i * 16))
+    os.write(1, b'0m....\n')
+os.write(1, b'## Err')
+os.write(1, b'or: none\n=> ')
+sys.stdin.read(1)
+'''
+
+def spawn_fake(lines):
+    """Start a fake child process
+
+    Args:
+        lines (int): Number of lines of output to produce
+
+    Returns:
+        Spawn: The child process
+    """
+    spawn = u_boot_spawn.Spawn([sys.executable, '-c', FAKE_CHILD, str(lines)])
+    spawn.timeout = 30000
+    return spawn
+
+def test_spawn_search_limits():
+    """Test working out which part of the output to search again"""
+    limits = u_boot_spawn.get_search_limits
+    assert limits(re.compile('^=> ', re.MULTILINE)) == (3, True)
+    assert limits(re.compile("Unknown command '.*'")) == (None, True)
+    assert limits(re.compile('a.*b', re.DOTALL)) is None
+    assert limits(re.compile(r'a\s+b')) is None
+    assert limits(re.compile(r'a[^x]b')) == (3, False)
+    assert limits(re.compile(r'a(?=b)')) is None
+
+    start = u_boot_spawn.get_search_start
+    assert start((3, True), 'abc\ndefg', 8) == 5
+    assert start((3, False), 'abc\ndefg', 8) == 5
+    assert start((10, True), 'abc\ndefg', 8) == 4
+    assert start((10, False), 'abc\ndefg', 8) == 0
+    assert start(None, 'abc\ndefg', 8) == 0
+
+def test_spawn_expect():
+    """Test that matches are found across reads and escapes are removed"""
+    spawn = spawn_fake(1000)
+    try:
+        assert spawn.expect(['start']) == 0
+        patterns = [re.compile('^=> ', re.MULTILINE),
+                    re.compile('## Error: '), 'never matches']
+        assert spawn.expect(patterns) == 1
+        assert spawn.after == '## Error: '
+        lines = spawn.before.strip().splitlines()
+        assert len(lines) == 1000
+        assert lines[-1] == ('00003e70: 00112233 44556677 8899aabb ccddeeff  '
+                             '....')
+        assert spawn.expect(patterns) == 0
+        assert spawn.before == 'none\r\n'
+        assert spawn.get_expect_output().startswith('start\r\n00000000: ')
+        assert spawn.get_expect_output().endswith('none\r\n=> ')
+        assert '\x1b' not in spawn.get_expect_output()
+    finally:
+        spawn.close()
+
+def test_spawn_timeout():
+    """Test that output is kept for the next expect() after a timeout"""
+    spawn = spawn_fake(100)
+    try:
+        spawn.timeout = 500
+        with pytest.raises(u_boot_spawn.Timeout):
+            spawn.expect(['not there'])
+        assert spawn.expect(['start']) == 0
+        assert spawn.before == ''
+        assert spawn.expect(['=> ']) == 0
+        assert len(spawn.before.splitlines()) == 102
+    finally:
+        spawn.close()
+
+def test_spawn_large_output():
+    """Test that expect() handles a large amount of output"""
+    lines = 100000
+    spawn = spawn_fake(lines)
+    try:
+        spawn.expect([re.compile('^=> ', re.MULTILINE),
+                      re.compile("Unknown command '.*' - try 'help'"),
+                      re.compile('### ERROR ### Please RESET the board ###')])
+        assert len(spawn.before.splitlines()) == lines + 2
+        assert spawn.before.endswith('## Error: none\r\n')
+    finally:
+        spawn.close()
@@ -8,12 +8,17 @@ test one at a time, as well setting up some files needed by the tests.
 # Copyright (c) 2016, NVIDIA CORPORATION. All rights reserved.
 """
 import collections
+import concurrent.futures
+import functools
 import getpass
 import gzip
 import os
 import os.path
+import re
+import time
 import pytest
 
+import u_boot_console_base
 import u_boot_utils
 # pylint: disable=E0611
 from tests import fs_helper
@@ -28,6 +33,189 @@ def mkdir_cond(dirname):
     if not os.path.exists(dirname):
         os.mkdir(dirname)
 
+# Line printed by ut before running each test, e.g. 'Test: dm_test_x: x.c'
+RE_UT_TEST = re.compile(r'^Test: (\S+): ', re.MULTILINE)
+
+# Line printed by ut after a test fails
+RE_UT_FAILED = re.compile(r"^Test '\S+' failed \d+ times", re.MULTILINE)
+
+# Summary line printed by ut after running all the tests
+RE_UT_SUMMARY = re.compile(r'^(Skipped: \d+, )?Failures: \d+', re.MULTILINE)
+
+# Test which prints "Unknown command" on purpose
+UT_UNKNOWN_COMMAND = 'hush hush_test_simple_dollar'
+
+# Output from each test run with --ut-batch, which has not yet been used:
+#    key: suite name
+#    value: dict:
+#        key: test name
+#        value: output from that test
+batch_output = {}
+
+# Statistics for --ut-batch
+batch_stats = collections.Counter()
+
+def split_ut_output(output):
+    """Split the output of a ut suite into the output from each test
+
+    ut prints a line before running each test, so this is used to find the
+    start of each test's output. The summary which ut prints at the end is
+    not included in the output of the last test. Tests which did not run (e.g.
+    because an earlier test failed) are not included.
+
+    Args:
+        output (str): Output from the ut command
+
+    Returns:
+        dict:
+            key: test name
+            value: output from that test
+    """
+    result = collections.defaultdict(str)
+    matches = list(RE_UT_TEST.finditer(output))
+    summary = None
+    if matches:
+        summary = RE_UT_SUMMARY.search(output, matches[-1].end())
+    for i, match in enumerate(matches):
+        if i + 1 < len(matches):
+            end = matches[i + 1].start()
+        else:
+            end = summary.start() if summary else len(output)
+
+        # Tests may run twice, with live and flat trees, so keep both
+        result[match.group(1)] += output[match.start():end]
+    return result
+
+def batch_enabled(config):
+    """Check whether the tests in each suite should be run with one command
+
+    With pytest-xdist, each worker collects every test but only runs those
+    which are scheduled to it, so it cannot tell whether all of a suite's tests
+    will run there. Batching is therefore not used in xdist workers.
+
+    Args:
+        config (pytest.Config): pytest configuration
+
+    Returns:
+        bool: True if --ut-batch is given and this is not an xdist worker
+    """
+    return (config.getoption('ut_batch') and
+            'PYTEST_XDIST_WORKER' not in os.environ)
+
+def count_selected(session, suite):
+    """Count the number of tests in a suite which are selected to run
+
+    Args:
+        session (pytest.Session): Test session
+        suite (str): Name of the suite, e.g. 'dm'
+
+    Returns:
+        int: Number of selected tests from that suite
+    """
+    count = 0
+    for item in session.items:
+        callspec = getattr(item, 'callspec', None)
+        subtest = callspec.params.get('ut_subtest') if callspec else None
+        if subtest and subtest.split()[0] == suite:
+            count += 1
+    return count
+
+def get_batch_output(cons, session, ut_subtest):
+    """Get the output of a test by running its whole suite at once
+
+    The first time a suite is seen, all of its tests are run with a single
+    'ut' command. This avoids sending a command and waiting for the prompt
+    for each test, along with the set-up which ut does on each run.
+
+    Since 'ut <suite>' runs every test in the suite, this is only done if all
+    of the suite's tests are selected. Otherwise the tests are run one at a
+    time as usual.
+
+    Args:
+        cons (ConsoleBase): U-Boot console
+        session (pytest.Session): Test session
+        ut_subtest (str): Test to get the output for, e.g. 'dm dm_test_x'
+
+    Returns:
+        str: Output from the test, or None if the test must be run by itself
+    """
+    suite, name = ut_subtest.split()
+    if suite not in batch_output:
+        batch_output[suite] = {}
+        selected = count_selected(session, suite)
+        total = cons.config.ut_suite_tests['ut_subtest'][suite]
+        if selected < 2 or selected != total:
+            return None
+
+        start = time.monotonic()
+        with cons.temporary_timeout(u_boot_console_base.TIMEOUT_MS * selected):
+            with cons.disable_check('unknown_command'):
+                output = cons.run_command(f'ut {suite}')
+        elapsed = time.monotonic() - start
+
+        tests = split_ut_output(output)
+        batch_output[suite] = tests
+        batch_stats['suites'] += 1
+        batch_stats['tests'] += min(selected, len(tests))
+        batch_stats['time'] += elapsed
+    return batch_output[suite].pop(name, None)
+
+@pytest.fixture(scope='module', autouse=True)
+def ut_batch_report(request, u_boot_log):
+    """Report the time taken by --ut-batch at the end of the tests
+
+    Args:
+        request (pytest.FixtureRequest): Request for this fixture
+        u_boot_log (Logfile): Log to write to
+    """
+    yield
+    if not batch_stats['suites']:
+        return
+    msg = (f"ut batch: {batch_stats['tests']} tests from "
+           f"{batch_stats['suites']} suites in {batch_stats['time']:.1f}s")
+
+    # Estimate the saving using the tests which were run one at a time
+    if batch_stats['single_tests']:
+        per_test = batch_stats['single_time'] / batch_stats['single_tests']
+        saved = per_test * batch_stats['tests'] - batch_stats['time']
+        msg += f', saving about {saved:.1f}s'
+    u_boot_log.info(msg)
+    reporter = request.config.pluginmanager.get_plugin('terminalreporter')
+    if reporter:
+        reporter.write_line(msg)
+
+def cache_image(basename, *inputs, tools=()):
+    """Decorator which reuses a previously built disk image where possible
+
+    The image is rebuilt when this file, any of the inputs or any of the tools
+    changes. See fs_helper.cached_image() for details.
+
+    Args:
+        basename (str): Filename of the image within the source directory
+        inputs (list of str): Other files used to build the image. Each is
+            formatted with 'config' set to the U-Boot configuration, then
+            taken as relative to the source directory
+        tools (list of str): Tools used to build the image, e.g. 'sfdisk'
+
+    Returns:
+        function: Decorator to apply to a function which builds the image.
+            The resulting function returns the image's filename
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(cons):
+            config = cons.config
+            fname = os.path.join(config.source_dir, basename)
+            fnames = [__file__] + [
+                os.path.join(config.source_dir, inp.format(config=config))
+                for inp in inputs]
+            if fs_helper.cached_image(config, fname, func.__name__,
+                                      lambda _: func(cons), fnames, tools):
+                cons.log.action(f'Using cached image {fname}')
+            return fname
+        return wrapper
+    return decorator
+
 def setup_image(cons, devnum, part_type, second_part=False, basename='mmc'):
     """Create a 20MB disk image with a single partition
 
@@ -44,7 +232,8 @@ def setup_image(cons, devnum, part_type, second_part=False, basename='mmc'):
             str: Directory name of 'mnt' directory
     """
     fname = os.path.join(cons.config.source_dir, f'{basename}{devnum}.img')
-    mnt = os.path.join(cons.config.persistent_data_dir, 'mnt')
+    # Use a separate mount point for each image, so they can be built at once
+    mnt = os.path.join(cons.config.persistent_data_dir, f'mnt-{basename}{devnum}')
     mkdir_cond(mnt)
 
     spec = f'type={part_type:x}, size=18M, bootable'
@@ -92,6 +281,9 @@ def copy_prepared_image(cons, devnum, fname, basename='mmc'):
                            f'test/py/tests/bootstd/{basename}{devnum}.img.xz')
     u_boot_utils.run_and_log(cons, ['sh', '-c', f'xz -dc {infname} >{fname}'])
 
+@cache_image('mmc4.img', 'test/py/tests/bootstd/armbian.bmp.xz',
+             'test/py/tests/bootstd/mmc4.img.xz',
+             tools=['qemu-img', 'sfdisk', 'mkfs.ext4', 'xz', 'mkimage'])
 def setup_bootmenu_image(cons):
     """Create a 20MB disk image with a single ext4 partition
 
@@ -223,6 +415,8 @@ booti ${kernel_addr_r} ${ramdisk_addr_r} ${fdt_addr_r}
     if not complete:
         copy_prepared_image(cons, mmc_dev, fname)
 
+@cache_image('mmc1.img', 'test/py/tests/bootstd/mmc1.img.xz',
+             tools=['qemu-img', 'sfdisk', 'mkfs.vfat', 'xz', 'mkimage'])
 def setup_bootflow_image(cons):
     """Create a 20MB disk image with a single FAT partition"""
     mmc_dev = 1
@@ -285,6 +479,9 @@ label Fedora-Workstation-armhfp-31-1.9 (5.3.7-301.fc31.armv7hl)
         copy_prepared_image(cons, mmc_dev, fname)
 
 
+@cache_image('mmc5.img', 'doc/chromium/files/devkeys/kernel.keyblock',
+             'doc/chromium/files/devkeys/kernel_data_key.vbprivk',
+             tools=['qemu-img', 'cgpt', 'futility'])
 def setup_cros_image(cons):
     """Create a 20MB disk image with ChromiumOS partitions"""
     Partition = collections.namedtuple('part', 'start,size,name')
@@ -425,6 +622,8 @@ def setup_cros_image(cons):
 
     return fname
 
+@cache_image('mmc7.img', 'test/py/tests/test_android/test_abootimg.py',
+             tools=['qemu-img', 'cgpt'])
 def setup_android_image(cons):
     """Create a 20MB disk image with Android partitions"""
     Partition = collections.namedtuple('part', 'start,size,name')
@@ -550,6 +749,9 @@ def test_ut_dm_init(u_boot_console):
         fh.write(data)
 
 
+@cache_image('flash1.img', '{config.build_dir}/lib/efi_loader/testapp.efi',
+             'test/py/tests/bootstd/flash1.img.xz',
+             tools=['qemu-img', 'sfdisk', 'mkfs.ext4', 'xz'])
 def setup_efi_image(cons):
     """Create a 20MB disk image with an EFI app on it"""
     devnum = 1
@@ -592,18 +794,20 @@ def setup_efi_image(cons):
 def test_ut_dm_init_bootstd(u_boot_console):
     """Initialise data for bootflow tests"""
 
-    setup_bootflow_image(u_boot_console)
-    setup_bootmenu_image(u_boot_console)
+    # Images which are not in the cache are built at the same time
+    setups = [setup_bootflow_image, setup_bootmenu_image, setup_cros_image,
+              setup_android_image, setup_efi_image]
+    with concurrent.futures.ThreadPoolExecutor(len(setups)) as executor:
+        for future in [executor.submit(func, u_boot_console)
+                       for func in setups]:
+            future.result()
     setup_cedit_file(u_boot_console)
-    setup_cros_image(u_boot_console)
-    setup_android_image(u_boot_console)
-    setup_efi_image(u_boot_console)
 
     # Restart so that the new mmc1.img is picked up
     u_boot_console.restart_uboot()
 
 
-def test_ut(u_boot_console, ut_subtest):
+def test_ut(u_boot_console, ut_subtest, request):
     """Execute a "ut" subtest.
 
     The subtests are collected in function generate_ut_subtest() from linker
@@ -619,13 +823,28 @@ def test_ut(u_boot_console, ut_subtest):
         u_boot_console (ConsoleBase): U-Boot console
         ut_subtest (str): test to be executed via command ut, e.g 'foo bar' to
             execute command 'ut foo bar'
+        request (pytest.FixtureRequest): Request for this test
     """
 
-    if ut_subtest == 'hush hush_test_simple_dollar':
-        # ut hush hush_test_simple_dollar prints "Unknown command" on purpose.
+    output = None
+    if batch_enabled(request.config):
+        output = get_batch_output(u_boot_console, request.session, ut_subtest)
+    if output is not None:
+        u_boot_console.log.info(output)
+
+        # The whole suite runs with this check disabled, so check each test
+        unknown = u_boot_console_base.pattern_unknown_command.search(output)
+        assert bool(unknown) == (ut_subtest == UT_UNKNOWN_COMMAND)
+        assert not RE_UT_FAILED.search(output)
+        return
+
+    start = time.monotonic()
+    if ut_subtest == UT_UNKNOWN_COMMAND:
         with u_boot_console.disable_check('unknown_command'):
             output = u_boot_console.run_command('ut ' + ut_subtest)
         assert 'Unknown command \'quux\' - try \'help\'' in output
     else:
         output = u_boot_console.run_command('ut ' + ut_subtest)
+    batch_stats['single_tests'] += 1
+    batch_stats['single_time'] += time.monotonic() - start
     assert output.endswith('Failures: 0')
@@ -0,0 +1,106 @@
+# SPDX-License-Identifier: GPL-2.0+
+
+"""Test the helpers used by the --ut-batch option of test_ut
+
+These tests use canned ut output instead of U-Boot, so they do not need a
+board or a build.
+"""
+
+import types
+
+from test_ut import batch_enabled, count_selected, split_ut_output
+
+def make_session(*subtests):
+    """Create a fake pytest session containing some tests
+
+    Args:
+        subtests (list of str or None): ut_subtest parameter for each test,
+            e.g. 'dm dm_test_x', or None for a test which does not have one
+
+    Returns:
+        types.SimpleNamespace: Fake session with an 'items' attribute
+    """
+    items = []
+    for subtest in subtests:
+        callspec = None
+        if subtest:
+            callspec = types.SimpleNamespace(params={'ut_subtest': subtest})
+        items.append(types.SimpleNamespace(callspec=callspec))
+    return types.SimpleNamespace(items=items)
+
+def test_split_live_flat():
+    """Test that both runs of a test, with live and flat trees, are kept"""
+    output = '''Running 2 dm tests
+Test: dm_test_a: a.c
+a live
+Test: dm_test_a: a.c (flat tree)
+a flat
+Test: dm_test_b: b.c
+b live
+Test: dm_test_b: b.c (flat tree)
+b flat
+Failures: 0
+'''
+    tests = split_ut_output(output)
+    assert list(tests) == ['dm_test_a', 'dm_test_b']
+    assert tests['dm_test_a'] == ('Test: dm_test_a: a.c\na live\n'
+                                  'Test: dm_test_a: a.c (flat tree)\n'
+                                  'a flat\n')
+    assert tests['dm_test_b'] == ('Test: dm_test_b: b.c\nb live\n'
+                                  'Test: dm_test_b: b.c (flat tree)\n'
+                                  'b flat\n')
+
+def test_split_summary():
+    """Test that the summary is not included in the last test's output"""
+    output = '''Running 2 lib tests
+Test: lib_test_a: a.c
+Test: lib_test_b: b.c
+b.c:10, lib_test_b(): 1 == 2: Expected 0x1 (1), got 0x2 (2)
+Test 'lib_test_b' failed 1 times
+Skipped: 1, Failures: 1
+'''
+    tests = split_ut_output(output)
+    assert tests['lib_test_a'] == 'Test: lib_test_a: a.c\n'
+    assert tests['lib_test_b'] == (
+        'Test: lib_test_b: b.c\n'
+        'b.c:10, lib_test_b(): 1 == 2: Expected 0x1 (1), got 0x2 (2)\n'
+        "Test 'lib_test_b' failed 1 times\n")
+    assert 'Failures' not in ''.join(tests.values())
+
+def test_split_early_stop():
+    """Test that a test which did not run is missing from the output"""
+    output = '''Running 3 bootstd tests
+Test: bootstd_test_a: a.c
+Test: bootstd_test_b: b.c
+b.c:20, bootstd_test_b(): ret: Expected 0x0 (0), got 0xffffffea (-22)
+Test 'bootstd_test_b' failed 1 times
+Failures: 1
+'''
+    tests = split_ut_output(output)
+    assert list(tests) == ['bootstd_test_a', 'bootstd_test_b']
+    assert 'bootstd_test_c' not in tests
+
+def test_split_empty():
+    """Test splitting output in which no tests ran"""
+    assert not split_ut_output("Test 'x' not found\n")
+
+def test_count_selected():
+    """Test counting the selected tests in a suite"""
+    session = make_session('dm dm_test_a', 'dm dm_test_b', 'lib lib_test_a',
+                           None, 'dmx dmx_test_a')
+    assert count_selected(session, 'dm') == 2
+    assert count_selected(session, 'lib') == 1
+    assert count_selected(session, 'dmx') == 1
+    assert count_selected(session, 'bootstd') == 0
+
+def test_batch_xdist(monkeypatch):
+    """Test that batching is not used in a pytest-xdist worker"""
+    config = types.SimpleNamespace(getoption=lambda name: name == 'ut_batch')
+    monkeypatch.delenv('PYTEST_XDIST_WORKER', raising=False)
+    assert batch_enabled(config)
+    monkeypatch.setenv('PYTEST_XDIST_WORKER', 'gw0')
+    assert not batch_enabled(config)
+
+    config = types.SimpleNamespace(getoption=lambda name: False)
+    monkeypatch.delenv('PYTEST_XDIST_WORKER')
+    assert not batch_enabled(config)
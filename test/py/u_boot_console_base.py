@@ -13,6 +13,7 @@ import os
 import pytest
 import re
 import sys
+import time
 import u_boot_spawn
 from u_boot_spawn import BootFail, Timeout, Unexpected, handle_exception
 
@@ -154,6 +155,9 @@ class ConsoleBase(object):
         self.at_prompt_logevt = None
         self.lab_mode = False
 
+        # Time taken by each boot, in seconds
+        self.boot_times = []
+
     def get_spawn(self):
         # This is not called, ssubclass must define this.
         # Return a value to avoid:
@@ -246,7 +250,8 @@ class ConsoleBase(object):
                     break
                 if m == 2:
                     self.log.info(f'Found autoboot prompt {m}')
-                    self.p.send(' ')
+                    if not self.p.autoboot_stopped:
+                        self.p.send(' ')
                     continue
                 if not self.lab_mode:
                     raise BootFail('Missing prompt / ready message on console: ' +
@@ -481,6 +486,7 @@ class ConsoleBase(object):
         try:
             self.log.start_section('Starting U-Boot')
             self.at_prompt = False
+            start = time.monotonic()
             self.p = self.get_spawn()
             # Real targets can take a long time to scroll large amounts of
             # text if LCD is enabled. This value may need tweaking in the
@@ -502,6 +508,8 @@ class ConsoleBase(object):
                 self.wait_for_boot_prompt(loop_num = loop_num)
             self.at_prompt = True
             self.at_prompt_logevt = self.logstream.logfile.cur_evt
+            self.boot_times.append(time.monotonic() - start)
+            self.log.info(f'Boot took {self.boot_times[-1]:.2f}s')
         except Exception as ex:
             self.log.error(str(ex))
             self.cleanup_spawn()
@@ -6,6 +6,8 @@
 Logic to interact with the sandbox port of U-Boot, running as a sub-process.
 """
 
+import collections
+import os
 import time
 from u_boot_spawn import Spawn
 from u_boot_console_base import ConsoleBase
@@ -29,17 +31,22 @@ class ConsoleSandbox(ConsoleBase):
         self.sandbox_flags = []
         self.use_dtb = True
 
-    def get_spawn(self):
-        """Connect to a fresh U-Boot instance.
+        # Spare sandbox which is booting in the background, if any:
+        #    list: command used to start it
+        #    Spawn: the sandbox process
+        #    float: time when it was started
+        self.spare = None
+        self.pool_stats = collections.Counter()
 
-        A new sandbox process is created, so that U-Boot begins running from
-        scratch.
+    def get_cmd(self, flags, use_dtb):
+        """Get the command used to start sandbox
 
         Args:
-            None.
+            flags: List of flags to pass, each a string
+            use_dtb: True to use a device tree file, False to run without one
 
         Returns:
-            A u_boot_spawn.Spawn object that is attached to U-Boot.
+            List of strings: The command and its arguments
         """
 
         bcfg = self.config.buildconfig
@@ -55,10 +62,128 @@ class ConsoleSandbox(ConsoleBase):
         if self.config.gdbserver:
             cmd += ['gdbserver', self.config.gdbserver]
         cmd += [self.config.build_dir + fname, '-v']
-        if self.use_dtb:
+        if use_dtb:
             cmd += ['-d', self.config.dtb]
-        cmd += self.sandbox_flags
-        return Spawn(cmd, cwd=self.config.source_dir, decode_signal=True)
+        cmd += flags
+        return cmd
+
+    def start_spare(self):
+        """Start a spare sandbox with the default flags
+
+        The sandbox boots in the background, so it is ready at the prompt by
+        the time it is needed.
+        """
+
+        cmd = self.get_cmd([], True)
+        started = time.time()
+        spawn = Spawn(cmd, cwd=self.config.source_dir, decode_signal=True)
+
+        # Nothing is watching for the autoboot prompt yet, so stop it now.
+        # The key must not be sent again when the prompt is seen later.
+        spawn.send(' ')
+        spawn.autoboot_stopped = True
+        self.spare = (cmd, spawn, started)
+
+    def files_changed(self, since):
+        """Check whether any files which sandbox may use have changed
+
+        This looks through the source and persistent-data directories, where
+        tests create the disk images that sandbox uses, as well as at the
+        device tree. The log files and any .git directory are ignored, since
+        sandbox does not read them.
+
+        Args:
+            since: Time to check against, as returned by time.time()
+
+        Returns:
+            True if any file was modified at or after that time
+        """
+
+        ignore = {os.path.realpath(fname)
+                  for fname in (self.log.fn, self.log.json_fn) if fname}
+        for dirname in (self.config.source_dir,
+                        self.config.persistent_data_dir):
+            for root, dirs, files in os.walk(dirname):
+                dirs[:] = [name for name in dirs if name != '.git']
+                for name in files:
+                    fname = os.path.join(root, name)
+                    try:
+                        mtime = os.stat(fname).st_mtime
+                    except OSError:
+                        # e.g. a broken symlink
+                        continue
+                    if mtime >= since and os.path.realpath(fname) not in ignore:
+                        return True
+        return os.stat(self.config.dtb).st_mtime >= since
+
+    def take_spare(self, cmd):
+        """Take the spare sandbox, if it is suitable
+
+        Args:
+            cmd: Command which the sandbox must have been started with
+
+        Returns:
+            A u_boot_spawn.Spawn object, or None if there is no suitable spare
+        """
+
+        if not self.spare:
+            self.pool_stats['miss'] += 1
+            return None
+        spare_cmd, spawn, started = self.spare
+        self.spare = None
+        if (spare_cmd != cmd or not spawn.isalive() or
+                self.files_changed(started)):
+            self.pool_stats['stale'] += 1
+            spawn.close()
+            return None
+        self.pool_stats['hit'] += 1
+        self.log.info('Using sandbox from the pool')
+        return spawn
+
+    def get_spawn(self):
+        """Connect to a fresh U-Boot instance.
+
+        A new sandbox process is created, so that U-Boot begins running from
+        scratch. With --sandbox-pool, a sandbox which was started earlier is
+        used if possible, and another is started in its place.
+
+        Args:
+            None.
+
+        Returns:
+            A u_boot_spawn.Spawn object that is attached to U-Boot.
+        """
+
+        cmd = self.get_cmd(self.sandbox_flags, self.use_dtb)
+        if not self.config.sandbox_pool or self.config.gdbserver:
+            return Spawn(cmd, cwd=self.config.source_dir, decode_signal=True)
+        spawn = self.take_spare(cmd)
+        self.start_spare()
+        if not spawn:
+            spawn = Spawn(cmd, cwd=self.config.source_dir, decode_signal=True)
+        return spawn
+
+    def close(self):
+        """Terminate the connection to U-Boot and any spare sandbox
+
+        Args:
+            None.
+
+        Returns:
+            Nothing.
+        """
+
+        if self.spare:
+            self.spare[1].close()
+            self.spare = None
+        if self.boot_times:
+            stats = self.pool_stats
+            self.log.info(
+                f'Boots: {len(self.boot_times)}, average '
+                f'{sum(self.boot_times) / len(self.boot_times):.2f}s; '
+                f"pool: {stats['hit']} hits, {stats['miss']} misses, "
+                f"{stats['stale']} stale")
+        super().close()
 
     def restart_uboot_with_flags(self, flags, expect_reset=False, use_dtb=True):
         """Run U-Boot with the given command-line flags
@@ -5,6 +5,7 @@
 Logic to spawn a sub-process and interact with its stdio.
 """
 
+import functools
 import io
 import os
 import re
@@ -17,9 +18,29 @@ import termios
 import time
 import traceback
 
+try:
+    from re import _constants as sre_constants
+    from re import _parser as sre_parse
+except ImportError:
+    # Python < 3.11
+    import sre_constants
+    import sre_parse
+
 # Character to send (twice) to exit the terminal
 EXIT_CHAR = 0x1d    # FS (Ctrl + ])
 
+# Number of bytes to read from the sub-process at a time
+READ_SIZE = 4096
+
+# An escape sequence which has not been completely received yet
+RE_VT100_PARTIAL = re.compile(r'(\x1b|(\x1b\[|\x9b)[^@-_]{0,32})\Z', re.I)
+
+# Character-class categories which include a newline
+NEWLINE_CATEGORIES = (sre_constants.CATEGORY_SPACE,
+                      sre_constants.CATEGORY_NOT_DIGIT,
+                      sre_constants.CATEGORY_NOT_WORD,
+                      sre_constants.CATEGORY_LINEBREAK)
+
 class Timeout(Exception):
     """An exception sub-class that indicates that a timeout occurred."""
 
@@ -71,12 +92,138 @@ def handle_exception(ubconfig, console, log, err, name, fatal, output=''):
         pytest.exit(msg)
 
 
+def _class_has_newline(items):
+    """Check whether a parsed character class can match a newline
+
+    Args:
+        items (list): Items in the class, from sre_parse
+
+    Returns:
+        bool: True if the class matches a newline
+    """
+    negate = False
+    found = False
+    for op, arg in items:
+        if op == sre_constants.NEGATE:
+            negate = True
+        elif op == sre_constants.LITERAL:
+            found |= arg == ord('\n')
+        elif op == sre_constants.RANGE:
+            found |= arg[0] <= ord('\n') <= arg[1]
+        elif op == sre_constants.CATEGORY:
+            found |= arg in NEWLINE_CATEGORIES
+        else:
+            return True
+    return found != negate
+
+def _check_single_line(items, dotall):
+    """Check whether a parsed regex can only match text within a line
+
+    Args:
+        items (list): Parsed regex, from sre_parse
+        dotall (bool): True if '.' matches a newline
+
+    Returns:
+        bool: True if no match can contain a newline, False if it can, or None
+            if the regex looks around its match, so that the text on either
+            side matters
+    """
+    single = True
+    for op, arg in items:
+        if op == sre_constants.LITERAL:
+            ok = arg != ord('\n')
+        elif op == sre_constants.NOT_LITERAL:
+            ok = arg == ord('\n')
+        elif op == sre_constants.ANY:
+            ok = not dotall
+        elif op == sre_constants.IN:
+            ok = not _class_has_newline(arg)
+        elif op == sre_constants.AT:
+            ok = True
+        elif op == sre_constants.SUBPATTERN:
+            ok = _check_single_line(
+                arg[-1], dotall or bool(arg[1] & sre_constants.SRE_FLAG_DOTALL))
+        elif op == sre_constants.BRANCH:
+            results = [_check_single_line(branch, dotall) for branch in arg[1]]
+            ok = None if None in results else all(results)
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+            ok = _check_single_line(arg[2], dotall)
+        else:
+            # Look-around assertions, back-references and anything new
+            return None
+        if ok is None:
+            return None
+        single &= ok
+    return single
+
+@functools.lru_cache(maxsize=256)
+def get_search_limits(pattern):
+    """Work out how much earlier output a pattern needs to search again
+
+    When new output arrives, expect() only needs to look for matches which
+    include at least some of the new output, since it has already searched
+    the older output. For most patterns a match has a maximum length or
+    cannot contain a newline, so only a small part of the older output can
+    be involved.
+
+    Args:
+        pattern (re.Pattern): Pattern to check
+
+    Returns:
+        tuple:
+            int: Maximum length of a match, or None if unbounded
+            bool: True if a match cannot include a newline
+        or None if the whole output must be searched each time
+    """
+    try:
+        parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+    except Exception:
+        return None
+    dotall = bool(parsed.state.flags & sre_constants.SRE_FLAG_DOTALL)
+    single = _check_single_line(parsed, dotall)
+    if single is None:
+        return None
+    max_len = parsed.getwidth()[1]
+    if max_len >= sre_constants.MAXREPEAT:
+        if not single:
+            return None
+        max_len = None
+    return max_len, single
+
+def get_search_start(limits, buf, end):
+    """Get the position from which to search for new matches of a pattern
+
+    This assumes that the pattern has already been searched for in buf[:end]
+    without success. Since a pattern may look at one character after the
+    match, e.g. with '\\b' or '$', that character is included in the
+    search.
+
+    Args:
+        limits (tuple): Search limits of the pattern, from get_search_limits()
+        buf (str): Output received so far
+        end (int): Length of the output that has already been searched
+
+    Returns:
+        int: Position in buf from which to search
+    """
+    if not limits:
+        return 0
+    max_len, single = limits
+    start = 0
+    if max_len is not None:
+        start = end - max_len
+    if single:
+        start = max(start, buf.rfind('\n', 0, end) + 1)
+    return max(start, 0)
+
+
 class Spawn:
     """Represents the stdio of a freshly created sub-process. Commands may be
     sent to the process, and responses waited for.
 
     Members:
         output: accumulated output from expect()
+        buf: output received but not yet consumed by expect()
     """
 
     def __init__(self, args, cwd=None, decode_signal=False):
@@ -97,11 +244,15 @@ class Spawn:
         self.exit_code = 0
         self.exit_info = ''
         self.buf = ''
-        self.output = ''
+        self._output = []
+        self._pending = ''
         self.logfile_read = None
         self.before = ''
         self.after = ''
         self.timeout = None
+        # True if a key has already been sent to stop autoboot
+        self.autoboot_stopped = False
+
         # http://stackoverflow.com/questions/7857352/python-regex-to-match-vt100-escape-sequences
         self.re_vt100 = re.compile(r'(\x1b\[|\x9b)[^@-_]*[@-_]|\x1b[@-_]', re.I)
 
@@ -259,7 +410,11 @@ class Spawn:
         for pi in range(len(patterns)):
             if type(patterns[pi]) == type(''):
                 patterns[pi] = re.compile(patterns[pi])
+        limits = [get_search_limits(pattern) for pattern in patterns]
 
+        # Output which is too old to be part of any match
+        settled = []
+        starts = [0] * len(patterns)
         tstart_s = time.time()
         try:
             while True:
@@ -267,7 +422,7 @@ class Spawn:
                 earliest_pi = None
                 for pi in range(len(patterns)):
                     pattern = patterns[pi]
-                    m = pattern.search(self.buf)
+                    m = pattern.search(self.buf, starts[pi])
                     if not m:
                         continue
                     if earliest_m and m.start() >= earliest_m.start():
@@ -277,11 +432,27 @@ class Spawn:
                 if earliest_m:
                     pos = earliest_m.start()
                     posafter = earliest_m.end()
-                    self.before = self.buf[:pos]
+                    settled.append(self.buf[:pos])
+                    self.before = ''.join(settled)
                     self.after = self.buf[pos:posafter]
-                    self.output += self.buf[:posafter]
+                    self._output += [self.before, self.after]
                     self.buf = self.buf[posafter:]
+                    settled = []
                     return earliest_pi
+
+                # Only search the new output next time, along with any older
+                # output which could be part of a match
+                end = len(self.buf)
+                starts = [get_search_start(limit, self.buf, end)
+                          for limit in limits]
+
+                # Keep one character before the search, for '^' and '\\b'
+                keep = min(starts) - 1
+                if keep > 0:
+                    settled.append(self.buf[:keep])
+                    self.buf = self.buf[keep:]
+                    starts = [start - keep for start in starts]
+
                 tnow_s = time.time()
                 if self.timeout:
                     tdelta_ms = (tnow_s - tstart_s) * 1000
@@ -293,15 +464,24 @@ class Spawn:
                 events = self.poll.poll(poll_maxwait)
                 if not events:
                     raise Timeout()
-                c = self.receive(1024)
+                c = self.receive(READ_SIZE)
                 if self.logfile_read:
                     self.logfile_read.write(c)
-                self.buf += c
+
+                # Strip escape sequences as they arrive, holding back any
+                # which are incomplete.
                 # count=0 is supposed to be the default, which indicates
                 # unlimited substitutions, but in practice the version of
                 # Python in Ubuntu 14.04 appears to default to count=2!
-                self.buf = self.re_vt100.sub('', self.buf, count=1000000)
+                c = self._pending + c
+                m = RE_VT100_PARTIAL.search(c)
+                self._pending = c[m.start():] if m else ''
+                if m:
+                    c = c[:m.start()]
+                self.buf += self.re_vt100.sub('', c, count=1000000)
         finally:
+            if settled:
+                self.buf = ''.join(settled) + self.buf
             if self.logfile_read:
                 self.logfile_read.flush()
 
@@ -343,3 +523,10 @@ class Spawn:
             The output processed by expect(), as a string.
         """
         return self.output
+
+    @property
+    def output(self):
+        """The output processed by expect(), as a string"""
+        if len(self._output) > 1:
+            self._output = [''.join(self._output)]
+        return ''.join(self._output)
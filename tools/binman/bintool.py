@@ -11,11 +11,13 @@ the tool, checking its version and fetching it if needed.
 
 import collections
 import glob
+import hashlib
 import importlib
 import multiprocessing
 import os
 import shutil
 import tempfile
+import threading
 import urllib.error
 
 from u_boot_pylib import command
@@ -55,11 +57,27 @@ class Bintool:
     # must be called before this class is used.
     tooldir = ''
 
+    # Results of cached invocations, see run_cmd_result():
+    #    key: str hash of the tool version, arguments and input files
+    #    value: tuple:
+    #        CommandResult: Result of running the tool
+    #        list of bytes: Contents of each output file
+    result_cache = {}
+
+    # Number of cache hits and misses for each tool:
+    #    key: str tool name
+    #    value: collections.Counter with 'hits' and 'misses'
+    cache_stats = collections.defaultdict(collections.Counter)
+
+    # Lock for result_cache and cache_stats, since tools run in threads
+    cache_lock = threading.Lock()
+
     def __init__(self, name, desc, version_regex=None, version_args='-V'):
         self.name = name
         self.desc = desc
         self.version_regex = version_regex
         self.version_args = version_args
+        self._version = None
 
     @staticmethod
     def find_bintool_class(btype):
@@ -132,6 +150,20 @@ class Bintool:
     def set_missing_list(cls, missing_list):
         cls.missing_list = missing_list or []
 
+    @classmethod
+    def reset_cache(cls):
+        """Drop all cached results and statistics"""
+        with cls.cache_lock:
+            cls.result_cache.clear()
+            cls.cache_stats.clear()
+
+    @classmethod
+    def show_cache_stats(cls):
+        """Show the number of cache hits and misses for each tool"""
+        for name, stats in sorted(cls.cache_stats.items()):
+            tout.notice(f"bintool '{name}': {stats['hits']} cache hits, "
+                        f"{stats['misses']} misses")
+
     @staticmethod
     def get_tool_list(include_testing=False):
         """Get a list of the known tools
@@ -269,15 +301,59 @@ class Bintool:
                 show_status(col.RED, 'Failures', status[FAIL])
         return not status[FAIL]
 
-    def run_cmd_result(self, *args, binary=False, raise_on_error=True):
+    def _get_cache_key(self, args, binary, outputs):
+        """Get the key to use for caching a tool invocation
+
+        Arguments which name an existing file, directly or after an '=', are
+        replaced by a hash of the file's contents. Output files are replaced by
+        their position in the outputs list, so that temporary filenames do not
+        prevent a match. Output files which already exist are hashed too, since
+        some tools update them.
+
+        Args:
+            args (list of str): Arguments to provide to the bintool
+            binary (bool): True to return output as bytes instead of str
+            outputs (list of str): Filenames of files written by the tool
+
+        Returns:
+            str: Key to use, or None if the invocation cannot be cached, since
+                it refers to a directory
+        """
+        if self._version is None:
+            self._version = self.version() if self.is_present() else ''
+        hsh = hashlib.sha256(repr((self.name, self._version, binary)).encode())
+        for arg in args:
+            arg = str(arg)
+            if arg in outputs:
+                hsh.update(f'output {outputs.index(arg)}'.encode())
+            _, sep, value = arg.partition('=')
+            fname = value if sep and not os.path.exists(arg) else arg
+            if os.path.isdir(fname):
+                return None
+            if os.path.isfile(fname):
+                hsh.update(arg[:len(arg) - len(fname)].encode())
+                hsh.update(hashlib.sha256(tools.read_file(fname)).digest())
+            elif arg not in outputs:
+                hsh.update(repr(arg).encode())
+        return hsh.hexdigest()
+
+    def run_cmd_result(self, *args, binary=False, raise_on_error=True,
+                       outputs=None):
         """Run the bintool using command-line arguments
 
+        If outputs is provided, the result is cached. When the tool is run again
+        with the same version, arguments and input files, the output files are
+        restored from the cache instead. This must only be used if the tool
+        reads no files other than those named in its arguments.
+
         Args:
             args (list of str): Arguments to provide, in addition to the bintool
                 name
             binary (bool): True to return output as bytes instead of str
             raise_on_error (bool): True to raise a ValueError exception if the
                 tool returns a non-zero return code
+            outputs (list of str): Filenames of all files written by the tool,
+                or None to run the tool without caching
 
         Returns:
             CommandResult: Resulting output from the bintool, or None if the
@@ -285,6 +361,37 @@ class Bintool:
         """
         if self.name in self.missing_list:
             return None
+        key = None
+        if outputs is not None:
+            key = self._get_cache_key(args, binary, outputs)
+        if key:
+            with self.cache_lock:
+                cached = self.result_cache.get(key)
+                self.cache_stats[self.name]['hits' if cached else 'misses'] += 1
+            if cached:
+                result, contents = cached
+                tout.debug(f"bintool: {self.name}: using cached result")
+                for fname, data in zip(outputs, contents):
+                    tools.write_file(fname, data)
+                return result
+        # Imported here since state needs libfdt, which is not needed to list
+        # or fetch tools
+        from binman import state
+
+        with state.Profile(f'bintool:{self.name}'):
+            result = self._run_cmd_result(*args, binary=binary,
+                                          raise_on_error=raise_on_error)
+        if key and result and not result.return_code:
+            contents = [tools.read_file(fname) for fname in outputs]
+            with self.cache_lock:
+                self.result_cache[key] = result, contents
+        return result
+
+    def _run_cmd_result(self, *args, binary, raise_on_error):
+        """Run the bintool, without using the cache
+
+        See run_cmd_result() for the arguments and return value
+        """
         name = os.path.expanduser(self.name)  # Expand paths containing ~
         all_args = (name,) + args
         env = tools.get_env_with_path()
@@ -312,18 +419,20 @@ class Bintool:
             tout.debug(result.stderr)
         return result
 
-    def run_cmd(self, *args, binary=False):
+    def run_cmd(self, *args, binary=False, outputs=None):
         """Run the bintool using command-line arguments
 
         Args:
             args (list of str): Arguments to provide, in addition to the bintool
                 name
             binary (bool): True to return output as bytes instead of str
+            outputs (list of str): Filenames of all files written by the tool,
+                to cache the result (see run_cmd_result()), or None
 
         Returns:
             str or bytes: Resulting stdout from the bintool
         """
-        result = self.run_cmd_result(*args, binary=binary)
+        result = self.run_cmd_result(*args, binary=binary, outputs=outputs)
         if result:
             return result.stdout
 
@@ -20,6 +20,7 @@ from u_boot_pylib import command
 from u_boot_pylib import terminal
 from u_boot_pylib import test_util
 from u_boot_pylib import tools
+from u_boot_pylib import tout
 
 # pylint: disable=R0904
 class TestBintool(unittest.TestCase):
@@ -353,6 +354,60 @@ class TestBintool(unittest.TestCase):
             result = btool.run_cmd_result('fred')
         self.assertIsNone(result)
 
+    def test_result_cache(self):
+        """Test caching the results of running a bintool"""
+        btool = Bintool.create('_testing')
+        btool.present = True
+        infile = os.path.join(self._indir, 'infile')
+        outfile = os.path.join(self._indir, 'outfile')
+        tools.write_file(infile, b'abc')
+        calls = []
+
+        def fake_run(*args, binary, raise_on_error):
+            calls.append(args)
+            tools.write_file(outfile, tools.read_file(infile) + b'!')
+            return command.CommandResult(stdout='done', return_code=0)
+
+        Bintool.set_missing_list(None)
+        Bintool.reset_cache()
+        with unittest.mock.patch.object(btool, '_run_cmd_result',
+                                        side_effect=fake_run):
+            self.assertEqual('done', btool.run_cmd(infile, '-o', outfile,
+                                                   outputs=[outfile]))
+            self.assertEqual(1, len(calls))
+
+            # The output file should be restored from the cache
+            os.remove(outfile)
+            self.assertEqual('done', btool.run_cmd(infile, '-o', outfile,
+                                                   outputs=[outfile]))
+            self.assertEqual(1, len(calls))
+            self.assertEqual(b'abc!', tools.read_file(outfile))
+
+            # Changing the input should run the tool again
+            tools.write_file(infile, b'def')
+            btool.run_cmd(infile, '-o', outfile, outputs=[outfile])
+            self.assertEqual(2, len(calls))
+            self.assertEqual(b'def!', tools.read_file(outfile))
+
+            # Without outputs, or with a directory argument, there is no cache
+            btool.run_cmd(infile, '-o', outfile)
+            btool.run_cmd(self._indir, '-o', outfile, outputs=[outfile])
+            btool.run_cmd(self._indir, '-o', outfile, outputs=[outfile])
+            self.assertEqual(5, len(calls))
+
+        self.assertEqual({'hits': 1, 'misses': 2},
+                         dict(Bintool.cache_stats['_testing']))
+        with test_util.capture_sys_output() as (stdout, _):
+            tout.init(tout.NOTICE)
+            try:
+                Bintool.show_cache_stats()
+            finally:
+                tout.init(tout.WARNING)
+        self.assertEqual("bintool '_testing': 1 cache hits, 2 misses\n",
+                         stdout.getvalue())
+        Bintool.reset_cache()
+        self.assertFalse(Bintool.cache_stats)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -141,7 +141,7 @@ class Bintoolcbfstool(bintool.Bintool):
             str: Tool output
         """
         args = [cbfs_fname, 'create', '-s', f'{size:#x}', '-m', arch]
-        return self.run_cmd(*args)
+        return self.run_cmd(*args, outputs=[cbfs_fname])
 
     # pylint: disable=R0913
     def add_raw(self, cbfs_fname, name, fname, compress=None, base=None):
@@ -166,7 +166,7 @@ class Bintoolcbfstool(bintool.Bintool):
                 '-c', compress or 'none']
         if base:
             args += ['-b', f'{base:#x}']
-        return self.run_cmd(*args)
+        return self.run_cmd(*args, outputs=[cbfs_fname])
 
     def add_stage(self, cbfs_fname, name, fname):
         """Add a stage file to the CBFS
@@ -184,7 +184,7 @@ class Bintoolcbfstool(bintool.Bintool):
                 '-n', name,
                 '-f', fname
             ]
-        return self.run_cmd(*args)
+        return self.run_cmd(*args, outputs=[cbfs_fname])
 
     def fail(self):
         """Run cbfstool with invalid arguments to check it reports failure
@@ -100,7 +100,7 @@ class Bintoolfdtgrep(bintool.Bintool):
                  '-n', '/config',
                  '-O', 'dtb',
                 ]
-            self.run_cmd(*args)
+            self.run_cmd(*args, outputs=[tmp.name])
             args = [
                     tmp.name,
                     '-o', outfile,
@@ -113,7 +113,7 @@ class Bintoolfdtgrep(bintool.Bintool):
                     ]
             for prop_name in remove_props:
                 args += ['-P', prop_name]
-            return self.run_cmd(*args)
+            return self.run_cmd(*args, outputs=[outfile])
 
     def fetch(self, method):
         """Fetch handler for fdtgrep
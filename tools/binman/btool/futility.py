@@ -88,7 +88,7 @@ class Bintoolfutility(bintool.Bintool):
             ','.join(['%#x' % size for size in sizes]),
             fname
             ]
-        return self.run_cmd(*args)
+        return self.run_cmd(*args, outputs=[fname])
 
     # pylint: disable=R0913
     def gbb_set(self, fname, hwid, rootkey, recoverykey, flags, bmpfv):
@@ -115,7 +115,7 @@ class Bintoolfutility(bintool.Bintool):
             f'--bmpfv={bmpfv}',
             fname
             ]
-        return self.run_cmd(*args)
+        return self.run_cmd(*args, outputs=[fname])
 
     def sign_firmware(self, vblock, keyblock, signprivate, version, firmware,
                       kernelkey, flags):
@@ -143,7 +143,7 @@ class Bintoolfutility(bintool.Bintool):
             '--kernelkey', kernelkey,
             '--flags', flags
             ]
-        return self.run_cmd(*args)
+        return self.run_cmd(*args, outputs=[vblock])
 
     def fetch(self, method):
         """Fetch handler for futility
@@ -50,7 +50,8 @@ class Bintoolmkimage(bintool.Bintool):
             args += ['-k', f'{priv_keys_dir}']
         if output_fname:
             args += ['-F', output_fname]
-        return self.run_cmd(*args)
+        return self.run_cmd(*args,
+                            outputs=[output_fname] if output_fname else None)
 
     def fetch(self, method):
         """Fetch handler for mkimage
@@ -196,7 +196,7 @@ class CbfsFile(object):
     """Class to represent a single CBFS file
 
     This is used to hold the information about a file, including its contents.
-    Use the get_data_and_offset() method to obtain the raw output for writing to
+    Use the get_hdr_and_data() method to obtain the raw output for writing to
     CBFS.
 
     Properties:
@@ -204,7 +204,8 @@ class CbfsFile(object):
         offset: Offset of file data from start of file header
         cbfs_offset: Offset of file data in bytes from start of CBFS, or None to
             place this file anyway
-        data: Contents of file, uncompressed
+        data: Contents of file, uncompressed. When reading a CBFS this is
+            decompressed on first use
         orig_data: Original data added to the file, possibly compressed
         data_len: Length of (possibly compressed) data in bytes
         ftype: File type (TYPE_...)
@@ -223,7 +224,8 @@ class CbfsFile(object):
         self.name = name
         self.offset = None
         self.cbfs_offset = cbfs_offset
-        self.data = data
+        self._data = data
+        self._decomp_pending = False
         self.orig_data = data
         self.ftype = ftype
         self.compress = compress
@@ -241,16 +243,34 @@ class CbfsFile(object):
         else:
             self.comp_bintool = None
 
-    def decompress(self):
-        """Handle decompressing data if necessary"""
-        indata = self.data
+    @property
+    def data(self):
+        if self._decomp_pending:
+            self._decomp_pending = False
+            self._data = self.comp_bintool.decompress(self._data)
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        self._data = data
+        self._decomp_pending = False
+
+    def decompress(self, memlen):
+        """Handle decompressing data if necessary
+
+        The data is not decompressed until it is used, since this can be slow
+        and callers often only need the file information.
+
+        Args:
+            memlen: Uncompressed length of the data, from the compression
+                attribute. This is not used if the data is not compressed
+        """
+        self.data_len = len(self._data)
         if self.comp_bintool:
-            data = self.comp_bintool.decompress(indata)
+            self.memlen = memlen
+            self._decomp_pending = True
         else:
-            data = indata
-        self.memlen = len(data)
-        self.data = data
-        self.data_len = len(indata)
+            self.memlen = self.data_len
 
     @classmethod
     def stage(cls, base_address, name, data, cbfs_offset):
@@ -339,15 +359,23 @@ class CbfsFile(object):
             raise ValueError('Unknown file type %#x\n' % self.ftype)
         return hdr_len
 
-    def get_data_and_offset(self, offset=None, pad_byte=None):
-        """Obtain the contents of the file, in CBFS format and the offset of
-        the data within the file
+    def get_hdr_and_data(self, offset, pad_byte):
+        """Obtain the headers and data of the file, in CBFS format
+
+        This avoids building the data for empty files, which can be large and
+        consist only of the erase byte.
+
+        Args:
+            offset: Current output position in the CBFS, used for files with a
+                fixed cbfs_offset
+            pad_byte: Byte to use to pad between the headers and the data
 
         Returns:
             tuple:
-                bytes representing the contents of this file, packed and aligned
-                    for directly inserting into the final CBFS output
-                offset to the file data from the start of the returned data.
+                bytes containing the headers, including padding and attributes
+                bytes containing the data, or None for an empty file, which
+                    contains self.size copies of self.erase_byte
+                offset to the file data from the start of the headers
         """
         name = _pack_string(self.name)
         hdr_len = len(name) + FILE_HEADER_LEN
@@ -374,7 +402,7 @@ class CbfsFile(object):
                                    ATTR_COMPRESSION_LEN, self.compress,
                                    self.memlen)
         elif self.ftype == TYPE_EMPTY:
-            data = tools.get_bytes(self.erase_byte, self.size)
+            data = None
         else:
             raise ValueError('Unknown type %#x when writing\n' % self.ftype)
         if attr:
@@ -397,7 +425,7 @@ class CbfsFile(object):
             hdr_len += pad_len
 
         # This is the offset of the start of the file's data,
-        size = len(content) + len(data)
+        size = len(content) + (self.size if data is None else len(data))
         hdr = struct.pack(FILE_HEADER_FORMAT, FILE_MAGIC, size,
                           self.ftype, attr_pos, hdr_len)
 
@@ -410,7 +438,7 @@ class CbfsFile(object):
             # happen. It probably indicates that get_header_len() is broken.
             raise ValueError("Internal error: CBFS file '%s': Expected headers of %#x bytes, got %#x" %
                              (self.name, expected_len, actual_len))
-        return hdr + name + pad + attr + content + data, hdr_len
+        return hdr + name + pad + attr + content, data, hdr_len
 
 
 class CbfsWriter(object):
@@ -421,7 +449,7 @@ class CbfsWriter(object):
         cbw = CbfsWriter(size)
         cbw.add_file_raw('u-boot', tools.read_file('u-boot.bin'))
         ...
-        data, cbfs_offset = cbw.get_data_and_offset()
+        data = cbw.get_data()
 
     Attributes:
         _master_name: Name of the file containing the master header
@@ -483,6 +511,9 @@ class CbfsWriter(object):
     def _skip_to(self, fd, offset, pad_byte):
         """Write out pad bytes until a given offset
 
+        The output starts out filled with the erase byte, so there is no need
+        to write that.
+
         Args:
             fd: File objext to write to
             offset: Offset to write to
@@ -490,7 +521,32 @@ class CbfsWriter(object):
         if fd.tell() > offset:
             raise ValueError('No space for data before offset %#x (current offset %#x)' %
                              (offset, fd.tell()))
-        fd.write(tools.get_bytes(pad_byte, offset - fd.tell()))
+        if pad_byte == self._erase_byte:
+            fd.seek(offset)
+        else:
+            fd.write(tools.get_bytes(pad_byte, offset - fd.tell()))
+
+    def _write_file(self, fd, cbf, pad_byte):
+        """Write out a file at the current position
+
+        The contents of an empty file are skipped, since the output starts out
+        filled with the erase byte, which is also used for empty files.
+
+        Args:
+            fd: File object to write to
+            cbf: CbfsFile to write
+            pad_byte: Byte to use to pad between the headers and the data
+
+        Returns:
+            Offset to the file data from the start of the file
+        """
+        hdr, data, data_offset = cbf.get_hdr_and_data(fd.tell(), pad_byte)
+        fd.write(hdr)
+        if data is None:
+            fd.seek(cbf.size, io.SEEK_CUR)
+        else:
+            fd.write(data)
+        return data_offset
 
     def _pad_to(self, fd, offset, pad_byte):
         """Write out pad bytes and/or an empty file until a given offset
@@ -507,7 +563,7 @@ class CbfsWriter(object):
         todo = align_int_down(offset - upto, self._align)
         if todo:
             cbf = CbfsFile.empty(todo, self._erase_byte)
-            fd.write(cbf.get_data_and_offset()[0])
+            self._write_file(fd, cbf, None)
         self._skip_to(fd, offset, pad_byte)
 
     def _align_to(self, fd, align, pad_byte):
@@ -598,7 +654,9 @@ class CbfsWriter(object):
         Returns:
             'bytes' type containing the data
         """
-        fd = io.BytesIO()
+        # Start with the whole CBFS erased, to avoid writing padding and empty
+        # files
+        fd = io.BytesIO(tools.get_bytes(self._erase_byte, self._size))
 
         # THe header can go at the start in some cases
         if self._hdr_at_start:
@@ -613,9 +671,7 @@ class CbfsWriter(object):
                 self._pad_to(fd, align_int_down(offset, self._align),
                              self._erase_byte)
             pos = fd.tell()
-            data, data_offset = cbf.get_data_and_offset(pos,
-                                                        self._small_pad_byte)
-            fd.write(data)
+            data_offset = self._write_file(fd, cbf, self._small_pad_byte)
             self._align_to(fd, self._align, self._erase_byte)
             cbf.calced_cbfs_offset = pos + data_offset
         if not self._hdr_at_start:
@@ -704,11 +760,19 @@ class CbfsReader(object):
         found = self._read_header(fd)
         if not found:
             print('Relative offset seems wrong, scanning whole image')
-            for pos in range(0, size - HEADER_LEN, 4):
-                fd.seek(pos)
-                found = self._read_header(fd)
-                if found:
-                    break
+
+            # Search for the magic number rather than trying every offset.
+            # This uses the underlying bytes, so does not copy the data
+            data = fd.getvalue()
+            magic = struct.pack('>I', HEADER_MAGIC)
+            pos = data.find(magic, 0, size)
+            while 0 <= pos < size - HEADER_LEN:
+                if not pos % 4:
+                    fd.seek(pos)
+                    found = self._read_header(fd)
+                    if found:
+                        break
+                pos = data.find(magic, pos + 1, size)
         fd.seek(orig_pos)
         return found
 
@@ -763,13 +827,14 @@ class CbfsReader(object):
             cfile.data_len = cfile.memlen
         elif ftype == TYPE_RAW:
             data = fd.read(size)
-            cfile = CbfsFile.raw(name, data, cbfs_offset, attrs)
-            cfile.decompress()
+            compress, memlen = attrs
+            cfile = CbfsFile.raw(name, data, cbfs_offset, compress)
+            cfile.decompress(memlen)
             if DEBUG:
                 print('data', data)
         elif ftype == TYPE_EMPTY:
-            # Just read the data and discard it, since it is only padding
-            fd.read(size)
+            # Skip the data, since it is only padding
+            fd.seek(size, io.SEEK_CUR)
             cfile = CbfsFile('', TYPE_EMPTY, b'', cbfs_offset)
         else:
             raise ValueError('Unknown type %#x when reading\n' % ftype)
@@ -799,7 +864,10 @@ class CbfsReader(object):
 
         Returns:
             Either:
-                Compression to use for the file (COMPRESS_...)
+                tuple containing compression info:
+                    compression to use for the file (COMPRESS_...)
+                    uncompressed size, or None if there is no compression
+                    attribute
                 tuple containing stage info:
                     load address
                     entry offset
@@ -807,7 +875,7 @@ class CbfsReader(object):
         """
         attrs = None
         if not attr:
-            return COMPRESS_NONE
+            return COMPRESS_NONE, None
         attr_size = offset - attr
         fd.seek(file_pos + attr, io.SEEK_SET)
         while attr_size:
@@ -819,10 +887,9 @@ class CbfsReader(object):
             atag, alen = struct.unpack(">II", hdr)
             data = hdr + fd.read(alen - 8)
             if atag == FILE_ATTR_TAG_COMPRESSION:
-                # We don't currently use this information
-                atag, alen, compress, _decomp_size = struct.unpack(
+                atag, alen, compress, decomp_size = struct.unpack(
                     ATTR_COMPRESSION_FORMAT, data)
-                attrs = compress
+                attrs = compress, decomp_size
             elif atag == FILE_ATTR_TAG_STAGEHEADER:
                 atag, alen, load, entry_offset, memsize = struct.unpack(
                     ATTR_STAGE_FORMAT, data)
@@ -602,6 +602,77 @@ class TestCbfs(unittest.TestCase):
         self.assertEqual(0x20, cbfs.files['u-boot'].cbfs_offset)
         self.assertEqual(0x64, cbfs.files['u-boot-dtb'].cbfs_offset)
 
+    def test_cbfs_lazy_decompress(self):
+        """Test that files are not decompressed until their data is used"""
+        if not self.have_lz4:
+            self.skipTest('lz4 --no-frame-crc not available')
+        size = 0x140
+        cbw = CbfsWriter(size)
+        cbw.add_file_raw('u-boot', COMPRESS_DATA, None,
+                         compress=cbfs_util.COMPRESS_LZ4)
+        data = cbw.get_data()
+
+        cbfs = cbfs_util.CbfsReader(data)
+        cfile = cbfs.files['u-boot']
+        self.assertEqual(len(COMPRESS_DATA), cfile.memlen)
+        self.assertTrue(cfile._decomp_pending)
+        self.assertEqual(cfile.data_len, len(cfile.orig_data))
+        self.assertEqual(COMPRESS_DATA, cfile.data)
+        self.assertFalse(cfile._decomp_pending)
+
+    def test_cbfs_search_header(self):
+        """Test searching for the master header with several files"""
+        size = 0x1000
+        cbw = CbfsWriter(size)
+        files = {}
+        for seq in range(4):
+            name = f'file{seq}'
+            files[name] = tools.get_bytes(seq, 0x100)
+            cbw.add_file_raw(name, files[name], 0x200 + seq * 0x300)
+        data = cbw.get_data()
+
+        # Drop the master-header pointer, so the header must be searched for
+        bad_data = data[:-4] + tools.get_bytes(0, 4)
+        for search, cbfs_data in [(False, data), (True, bad_data)]:
+            with test_util.capture_sys_output() as (stdout, _stderr):
+                cbfs = cbfs_util.CbfsReader(cbfs_data)
+            self.assertEqual(search,
+                             'Relative offset seems wrong' in stdout.getvalue())
+            self.assertEqual(size, cbfs.rom_size)
+            for name, file_data in files.items():
+                self.assertEqual(file_data, cbfs.files[name].data)
+
+
+    def test_cbfs_search_false_magic(self):
+        """Test that the header search skips matches which are not a header"""
+        size = 0x1000
+        cbw = CbfsWriter(size)
+
+        # Put the magic at an unaligned position and at an aligned position
+        # without a valid version, both before the real header
+        magic = struct.pack('>I', cbfs_util.HEADER_MAGIC)
+        data = (b'x' + magic + b'xxx' + magic +
+                tools.get_bytes(0, cbfs_util.HEADER_LEN))
+        cbw.add_file_raw('u-boot', data, 0x200)
+        cbfs_data = cbw.get_data()
+        self.assertLess(0x200, cbw._header_offset)
+        bad_data = cbfs_data[:-4] + tools.get_bytes(0, 4)
+
+        with test_util.capture_sys_output() as (stdout, _stderr):
+            cbfs = cbfs_util.CbfsReader(bad_data)
+        self.assertIn('Relative offset seems wrong', stdout.getvalue())
+        self.assertEqual(size, cbfs.rom_size)
+        self.assertEqual(data, cbfs.files['u-boot'].data)
+
+    def test_cbfs_skip_pad_byte(self):
+        """Test skipping forward with a pad byte other than the erase byte"""
+        cbw = CbfsWriter(0x20)
+        fd = io.BytesIO(tools.get_bytes(0xff, 0x20))
+        cbw._skip_to(fd, 8, 0xff)
+        cbw._skip_to(fd, 0x10, 0)
+        self.assertEqual(0x10, fd.tell())
+        self.assertEqual(tools.get_bytes(0xff, 8) + tools.get_bytes(0, 8) +
+                         tools.get_bytes(0xff, 0x10), fd.getvalue())
 
 if __name__ == '__main__':
     unittest.main()
@@ -132,6 +132,9 @@ controlled by a description in the board device tree.'''
         default=False, help='Output a map file for each image')
     build_parser.add_argument('-M', '--allow-missing', action='store_true',
         default=False, help='Allow external blobs and bintools to be missing')
+    build_parser.add_argument('--profile', type=str, metavar='BASENAME',
+        help='Write profiling information to BASENAME.json and '
+             'BASENAME.folded')
     build_parser.add_argument('-n', '--no-expanded', action='store_true',
             help="Don't use 'expanded' versions of entries where available; "
                  "normally 'u-boot' becomes 'u-boot-expanded', for example")
@@ -172,6 +175,8 @@ controlled by a description in the board device tree.'''
         help='Path to directory to use for input files')
     replace_parser.add_argument('-m', '--map', action='store_true',
         default=False, help='Output a map file for the updated image')
+    replace_parser.add_argument('--in-place', action='store_true',
+        help='Write just the changed bytes where possible')
     _AddPreserve(replace_parser)
     replace_parser.add_argument('paths', type=str, nargs='*',
                                 help='Paths within file to replace (wildcard)')
@@ -191,10 +196,15 @@ controlled by a description in the board device tree.'''
 
     if HAS_TESTS:
         test_parser = subparsers.add_parser('test', help='Run tests')
+        test_parser.add_argument('--dtc-cache', type=str,
+            help='Directory to use to cache compiled test .dts files')
         test_parser.add_argument('-P', '--processes', type=int,
             help='set number of processes to use for running tests')
         test_parser.add_argument('-T', '--test-coverage', action='store_true',
             default=False, help='run tests and check for 100%% coverage')
+        test_parser.add_argument('--timing-file', type=str,
+            help='File to record test durations, used to balance the tests '
+                 'between processes')
         test_parser.add_argument(
             '-X', '--test-preserve-dirs', action='store_true',
             help='Preserve and display test-created input directories; also '
@@ -7,6 +7,7 @@
 
 from collections import OrderedDict
 import glob
+import hashlib
 try:
     import importlib.resources
 except ImportError:  # pragma: no cover
@@ -344,6 +345,129 @@ def ReplaceOneEntry(image, entry, data, do_compress, allow_resize):
             entry.Raise('Entry data size does not match, but resize is disabled')
 
 
+def _GetFilePos(entry):
+    """Get the position of an entry's data in the image file
+
+    This follows the same steps as ReadData(), allowing for any skip-at-start
+    value in the containing sections.
+
+    Args:
+        entry: Entry to check
+
+    Returns:
+        int: Offset of the entry in the file
+    """
+    pos = 0
+    while entry.section:
+        pos += entry.offset - entry.section._skip_at_start
+        entry = entry.section
+    return pos
+
+
+def _HasContentRefs(node):
+    """Check if any node uses 'content' to refer to the data of other entries
+
+    Args:
+        node: Node to check, along with its subnodes
+
+    Returns:
+        True if a 'content' property was found
+    """
+    return 'content' in node.props or any(_HasContentRefs(subnode)
+                                          for subnode in node.subnodes)
+
+
+def PrepareInPlace(image, entry, data):
+    """Work out how to replace an entry by writing only the bytes that change
+
+    This is possible when the new data is the same size as the entry and no
+    other part of the image depends on the data, apart from a hash in the
+    fdtmap. Then nothing needs to be packed again and only the entry (and the
+    hash) must be written.
+
+    Args:
+        image: Image containing the entry, as read by Image.FromFile()
+        entry: Entry to replace
+        data: Data to replace it with
+
+    Returns:
+        tuple:
+            list of (int, bytes): Position in the file and data to write
+                there, or None if the entry cannot be written in place
+            str: Reason why the entry cannot be written in place, or None
+    """
+    from binman.entry import Entry
+    from binman.etype.blob import Entry_blob
+    from binman.etype import fdtmap
+
+    if entry.GetEntries():
+        return None, 'entry is a section'
+    if type(entry).WriteData is not Entry.WriteData:
+        return None, "entry type '%s' processes its data" % entry.etype
+    if type(entry).ProcessContents not in (Entry.ProcessContents,
+                                           Entry_blob.ProcessContents):
+        return None, "entry type '%s' generates its contents" % entry.etype
+    if entry.compress != 'none':
+        return None, 'entry is compressed'
+    if entry.auto_write_symbols:
+        return None, 'entry may need symbols written'
+    if entry.pad_before or entry.pad_after or len(data) != entry.size:
+        return None, 'size does not match'
+    parent = entry.section
+    while parent:
+        if parent.etype != 'section' or parent.compress != 'none':
+            return None, "entry is inside '%s'" % parent.GetPath()
+        if parent._node.FindNode('hash'):
+            return None, "section '%s' has a hash" % parent.GetPath()
+        parent = parent.section
+    if _HasContentRefs(image.fdtmap_dtb.GetRoot()):
+        return None, 'image has entries which use the data of others'
+
+    writes = [(_GetFilePos(entry), data)]
+    hash_node = entry._node.FindNode('hash')
+    if hash_node:
+        algo = hash_node.props.get('algo')
+        value = hash_node.props.get('value')
+        fdtmap_entry = image.FindEntryType('fdtmap')
+        if (not algo or algo.value != 'sha256' or not value or
+                len(value.bytes) != hashlib.sha256().digest_size or
+                not fdtmap_entry or image.GetFdts()):
+            return None, 'hash cannot be updated'
+        old = image.fdtmap_data[fdtmap.FDTMAP_HDR_LEN:]
+        hash_node.SetData('value', hashlib.sha256(data).digest())
+        image.fdtmap_dtb.Sync()
+
+        # The new value is the same size, so write only the part of the fdtmap
+        # which changed
+        new = image.fdtmap_dtb.GetContents()
+        diffs = [i for i in range(len(new)) if new[i] != old[i]]
+        if diffs:
+            start, end = diffs[0], diffs[-1] + 1
+            writes.append((_GetFilePos(fdtmap_entry) +
+                           fdtmap.FDTMAP_HDR_LEN + start, new[start:end]))
+    return writes, None
+
+
+def WriteInPlace(image, writes):
+    """Write changes directly to an image file
+
+    Args:
+        image: Image to update, as read by Image.FromFile()
+        writes: List of changes, each (int, bytes): position in the file and
+            data to write there
+
+    Returns:
+        int: Number of bytes written
+    """
+    total = 0
+    with open(image._filename, 'r+b') as fd:
+        for pos, data in writes:
+            os.pwrite(fd.fileno(), data, pos)
+            total += len(data)
+    tout.notice("Wrote %#x bytes in place to '%s'" % (total, image._filename))
+    return total
+
+
 def AfterReplace(image, allow_resize, write_map):
     """Handle write out an image after replacing entries in it
 
@@ -359,7 +483,14 @@ def AfterReplace(image, allow_resize, write_map):
 
 
 def WriteEntryToImage(image, entry, data, do_compress=True, allow_resize=True,
-                      write_map=False):
+                      write_map=False, in_place=False):
+    if in_place and not write_map:
+        writes, reason = PrepareInPlace(image, entry, data)
+        if writes:
+            tout.info('Writing data to %s in place' % entry.GetPath())
+            WriteInPlace(image, writes)
+            return
+        tout.info('Cannot write %s in place: %s' % (entry.GetPath(), reason))
     BeforeReplace(image, allow_resize)
     tout.info('Writing data to %s' % entry.GetPath())
     ReplaceOneEntry(image, entry, data, do_compress, allow_resize)
@@ -367,12 +498,17 @@ def WriteEntryToImage(image, entry, data, do_compress=True, allow_resize=True,
 
 
 def WriteEntry(image_fname, entry_path, data, do_compress=True,
-               allow_resize=True, write_map=False):
+               allow_resize=True, write_map=False, in_place=False):
     """Replace an entry in an image
 
     This replaces the data in a particular entry in an image. This size of the
     new data must match the size of the old data unless allow_resize is True.
 
+    With in_place, if the new data is the same size and nothing else in the
+    image depends on it, only the changed bytes are written to the image file.
+    In that case the image is not processed, so the returned Image object does
+    not reflect the new data.
+
     Args:
         image_fname: Image filename to process
         entry_path: Path to entry to extract
@@ -382,6 +518,7 @@ def WriteEntry(image_fname, entry_path, data, do_compress=True,
         allow_resize: True to allow entries to change size (this does a re-pack
             of the entries), False to raise an exception
         write_map: True to write a map file
+        in_place: True to write just the changed bytes if possible
 
     Returns:
         Image object that was updated
@@ -391,13 +528,15 @@ def WriteEntry(image_fname, entry_path, data, do_compress=True,
     image.CollectBintools()
     entry = image.FindEntryPath(entry_path)
     WriteEntryToImage(image, entry, data, do_compress=do_compress,
-                      allow_resize=allow_resize, write_map=write_map)
+                      allow_resize=allow_resize, write_map=write_map,
+                      in_place=in_place)
 
     return image
 
 
 def ReplaceEntries(image_fname, input_fname, indir, entry_paths,
-                   do_compress=True, allow_resize=True, write_map=False):
+                   do_compress=True, allow_resize=True, write_map=False,
+                   in_place=False):
     """Replace the data from one or more entries from input files
 
     Args:
@@ -410,6 +549,8 @@ def ReplaceEntries(image_fname, input_fname, indir, entry_paths,
             compressed if the entry requires it, False if the data is already
             compressed.
         write_map: True to write a map file
+        in_place: True to write just the changed bytes, if all entries can be
+            updated that way (see WriteEntry())
 
     Returns:
         List of EntryInfo records that were written
@@ -429,7 +570,8 @@ def ReplaceEntries(image_fname, input_fname, indir, entry_paths,
         data = tools.read_file(input_fname)
         tout.notice("Read %#x bytes from file '%s'" % (len(data), input_fname))
         WriteEntryToImage(image, entry, data, do_compress=do_compress,
-                          allow_resize=allow_resize, write_map=write_map)
+                          allow_resize=allow_resize, write_map=write_map,
+                          in_place=in_place)
         return
 
     # Otherwise we will input from a path given by the entry path of each entry.
@@ -439,8 +581,7 @@ def ReplaceEntries(image_fname, input_fname, indir, entry_paths,
     tout.notice("Replacing %d matching entries in image '%s'" %
                 (len(einfos), image_fname))
 
-    BeforeReplace(image, allow_resize)
-
+    replacements = []
     for einfo in einfos:
         entry = einfo.entry
         if entry.GetEntries():
@@ -453,12 +594,28 @@ def ReplaceEntries(image_fname, input_fname, indir, entry_paths,
         if os.path.exists(fname):
             tout.notice("Write entry '%s' from file '%s'" %
                         (entry.GetPath(), fname))
-            data = tools.read_file(fname)
-            ReplaceOneEntry(image, entry, data, do_compress, allow_resize)
+            replacements.append((entry, tools.read_file(fname)))
         else:
             tout.warning("Skipping entry '%s' from missing file '%s'" %
                          (entry.GetPath(), fname))
 
+    if in_place and not write_map:
+        all_writes = []
+        for entry, data in replacements:
+            writes, reason = PrepareInPlace(image, entry, data)
+            if not writes:
+                tout.info('Cannot write %s in place: %s' %
+                          (entry.GetPath(), reason))
+                break
+            all_writes += writes
+        else:
+            WriteInPlace(image, all_writes)
+            return image
+
+    BeforeReplace(image, allow_resize)
+    for entry, data in replacements:
+        ReplaceOneEntry(image, entry, data, do_compress, allow_resize)
+
     AfterReplace(image, allow_resize=allow_resize, write_map=write_map)
     return image
 
@@ -662,6 +819,30 @@ def CheckForProblems(image):
                                    for bintool in missing_bintool_list])))
     return any([missing_list, faked_list, missing_bintool_list])
 
+def _PackImage(image, update_fdt, write_map):
+    """Pack the entries in an image and update the device trees to match
+
+    Args:
+        image: Image to pack
+        update_fdt: True to update the FDT wth entry offsets, etc.
+        write_map: True to write a map file if packing fails
+    """
+    try:
+        with state.Profile('Pack', image):
+            image.PackEntries()
+    except Exception as e:
+        if write_map:
+            fname = image.WriteMap()
+            print("Wrote map file '%s' to show errors"  % fname)
+        raise
+    image.SetImagePos()
+    if update_fdt:
+        with state.Profile('SyncFdt', image):
+            image.SetCalculatedProperties()
+            for dtb_item in state.GetAllFdts():
+                dtb_item.Sync()
+                dtb_item.Flush()
+
 def ProcessImage(image, update_fdt, write_map, get_contents=True,
                  allow_resize=True, allow_missing=False,
                  allow_fake_blobs=False):
@@ -689,7 +870,8 @@ def ProcessImage(image, update_fdt, write_map, get_contents=True,
     if get_contents:
         image.SetAllowMissing(allow_missing)
         image.SetAllowFakeBlob(allow_fake_blobs)
-        image.GetEntryContents()
+        with state.Profile('ObtainContents', image):
+            image.GetEntryContents()
         image.drop_absent()
     image.GetEntryOffsets()
 
@@ -699,37 +881,40 @@ def ProcessImage(image, update_fdt, write_map, get_contents=True,
     # may result in an entry changing size. In that case we need to
     # do another pass. Since the device tree often contains the
     # final offset/size information we try to make space for this in
-    # AddMissingProperties() above. However, if the device is
-    # compressed we cannot know this compressed size in advance,
-    # since changing an offset from 0x100 to 0x104 (for example) can
-    # alter the compressed size of the device tree. So we need a
-    # third pass for this.
+    # AddMissingProperties() above, using fixed-width properties so that
+    # the device tree itself does not change size. However, if the
+    # device tree is compressed we cannot know this compressed size in
+    # advance, since changing an offset from 0x100 to 0x104 (for example)
+    # can alter the compressed size of the device tree.
+    #
+    # To avoid running a full pass (including signing, etc.) just to find
+    # this out, do a trial pack first and let the affected entries
+    # estimate their size from the result. Most images then complete in
+    # one pass.
+    if update_fdt and image.IsLayoutDependent():
+        _PackImage(image, update_fdt, write_map)
+        with state.Profile('EstimateContents', image):
+            image.EstimateContents()
+        image.ResetForPack()
+        tout.info("Image '%s': estimated sizes with a trial pack" % image.name)
     passes = 5
     for pack_pass in range(passes):
-        try:
-            image.PackEntries()
-        except Exception as e:
-            if write_map:
-                fname = image.WriteMap()
-                print("Wrote map file '%s' to show errors"  % fname)
-            raise
-        image.SetImagePos()
-        if update_fdt:
-            image.SetCalculatedProperties()
-            for dtb_item in state.GetAllFdts():
-                dtb_item.Sync()
-                dtb_item.Flush()
-        image.WriteSymbols()
-        sizes_ok = image.ProcessEntryContents()
+        _PackImage(image, update_fdt, write_map)
+        with state.Profile('WriteSymbols', image):
+            image.WriteSymbols()
+        with state.Profile('ProcessContents', image):
+            sizes_ok = image.ProcessEntryContents()
         if sizes_ok:
             break
         image.ResetForPack()
-    tout.info('Pack completed after %d pass(es)' % (pack_pass + 1))
+    tout.info("Image '%s': pack completed after %d pass(es)" %
+              (image.name, pack_pass + 1))
     if not sizes_ok:
         image.Raise('Entries changed size after packing (tried %s passes)' %
                     passes)
 
-    image.BuildImage()
+    with state.Profile('BuildImage', image):
+        image.BuildImage()
     if write_map:
         image.WriteMap()
 
@@ -785,7 +970,8 @@ def Binman(args):
             if args.cmd == 'replace':
                 ReplaceEntries(args.image, args.filename, args.indir, args.paths,
                                do_compress=not args.compressed,
-                               allow_resize=not args.fix_size, write_map=args.map)
+                               allow_resize=not args.fix_size, write_map=args.map,
+                               in_place=args.in_place)
 
             if args.cmd == 'sign':
                 SignEntries(args.image, args.file, args.key, args.algo, args.paths)
@@ -855,6 +1041,10 @@ def Binman(args):
             bintool.Bintool.set_missing_list(
                 args.force_missing_bintools.split(',') if
                 args.force_missing_bintools else None)
+            bintool.Bintool.reset_cache()
+            state.ResetCompressStats()
+            if args.profile:
+                state.ProfileStart()
 
             # Create the directory here instead of Entry.check_fake_fname()
             # since that is called from a threaded context so different threads
@@ -875,6 +1065,10 @@ def Binman(args):
                 data = state.GetFdtForEtype('u-boot-dtb').GetContents()
                 elf.UpdateFile(*elf_params, data)
 
+            bintool.Bintool.show_cache_stats()
+            state.ShowCompressStats()
+            if args.profile:
+                state.ProfileWrite(args.profile)
             bintool.Bintool.set_missing_list(None)
 
             # This can only be True if -M is provided, since otherwise binman
@@ -890,6 +1084,8 @@ def Binman(args):
             # Use this to debug the time take to pack the image
             #state.TimingShow()
         finally:
+            # Don't leave profiling enabled if processing fails
+            state.ProfileStop()
             tools.finalise_output_dir()
     finally:
         tout.uninit()
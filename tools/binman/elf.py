@@ -13,6 +13,7 @@ import shutil
 import struct
 import tempfile
 
+from binman import state
 from u_boot_pylib import command
 from u_boot_pylib import tools
 from u_boot_pylib import tout
@@ -282,7 +283,10 @@ def LookupAndWriteSymbols(elf_fname, entry, section, is_elf=False,
         return 0
     if base_addr is None:
         base_addr = 0 if is_elf else base.address
-    count = 0
+    state.TimingStart('symbols')
+
+    # Resolve all the values first, so that the entry data is only copied once
+    patches = []
     for name, sym in syms.items():
         if name.startswith('_binman'):
             msg = ("Section '%s': Symbol '%s'\n   in entry '%s'" %
@@ -310,15 +314,25 @@ def LookupAndWriteSymbols(elf_fname, entry, section, is_elf=False,
             if value is None:
                 value = -1
                 pack_string = pack_string.lower()
-            value_bytes = struct.pack(pack_string, value)
             tout.debug('%s:\n   insert %s, offset %x, value %x, length %d' %
-                       (msg, name, offset, value, len(value_bytes)))
-            entry.data = (entry.data[:offset] + value_bytes +
-                        entry.data[offset + sym.size:])
-            count += 1
+                       (msg, name, offset, value, sym.size))
+            patches.append((pack_string, offset, value))
+
+    # Now apply them all in place to a single copy of the data
+    count = len(patches)
+    size = 0
     if count:
+        data = bytearray(entry.data)
+        for pack_string, offset, value in patches:
+            struct.pack_into(pack_string, data, offset, value)
+            size += struct.calcsize(pack_string)
+        entry.data = bytes(data)
         tout.detail(
             f"Section '{section.GetPath()}': entry '{entry.GetPath()}' : {count} symbols")
+    state.TimingAccum('symbols')
+    state.TimingCount('symbols', count, size)
+    if count:
+        state.TimingCount(f'symbols {entry.GetPath()}', count, size)
     return count
 
 def GetSymbolValue(sym, data, msg):
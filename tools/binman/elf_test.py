@@ -12,6 +12,7 @@ import tempfile
 import unittest
 
 from binman import elf
+from binman import state
 from u_boot_pylib import command
 from u_boot_pylib import test_util
 from u_boot_pylib import tools
@@ -178,6 +179,25 @@ class TestElf(unittest.TestCase):
                     tools.get_bytes(ord('a'), 4))
         self.assertEqual(expected, entry.data)
 
+    def testSymbolTiming(self):
+        """Test that the symbols and bytes written are recorded"""
+        if not elf.ELF_TOOLS:
+            self.skipTest('Python elftools not available')
+        state.timing_info.clear()
+        entry = FakeEntry(28)
+        section = FakeSection()
+        elf_fname = self.ElfTestFile('u_boot_binman_syms')
+        count = elf.LookupAndWriteSymbols(elf_fname, entry, section)
+        self.assertEqual(5, count)
+        self.assertEqual(28, len(entry.data))
+        with test_util.capture_sys_output() as (stdout, stderr):
+            state.TimingShow()
+        lines = stdout.getvalue().splitlines()
+        self.assertIn('   symbols: ', lines[0])
+        self.assertIn('5 items       24 bytes', lines[0])
+        self.assertIn('symbols entry_path: ', lines[1])
+        self.assertIn('5 items       24 bytes', lines[1])
+
     def testDebug(self):
         """Check that enabling debug in the elf module produced debug output"""
         if not elf.ELF_TOOLS:
@@ -5,6 +5,7 @@
 #
 
 from collections import namedtuple
+import hashlib
 import importlib
 import os
 import pathlib
@@ -152,6 +153,7 @@ class Entry(object):
         self.fake_fname = None
         self.required_props = []
         self.comp_bintool = None
+        self._comp_cache = None
         self.elf_fname = None
         self.auto_write_symbols = auto_write_symbols
         self.absent = False
@@ -708,6 +710,30 @@ class Entry(object):
         """
         return True
 
+    def IsLayoutDependent(self):
+        """Check whether the size of this entry depends on the image layout
+
+        Some entries, such as a compressed device tree, change size after
+        packing, since they contain the offset/size of other entries. This
+        requires another pack pass.
+
+        Returns:
+            True if the size may change once the offsets are known
+        """
+        return False
+
+    def EstimateContents(self):
+        """Update layout-dependent contents after a trial pack
+
+        This is called after a trial pack, once the device trees have been
+        updated with the offset/size of each entry, for entries where
+        IsLayoutDependent() returns True. It gives the entry a size close to
+        its final size, so that the real pack usually only needs one pass.
+
+        The entry is reset for packing afterwards.
+        """
+        pass
+
     def WriteSymbols(self, section):
         """Write symbol values into binary files for access at run time
 
@@ -759,6 +785,17 @@ class Entry(object):
         self.WriteMapLine(fd, indent, self.name, self.offset, self.size,
                           self.image_pos)
 
+    def GetContentDeps(self):
+        """Get the nodes of other entries whose contents this entry uses
+
+        The section uses this to obtain the contents of those entries first, so
+        that ObtainContents() does not need to be retried for this one.
+
+        Returns:
+            list of Node: Nodes of the entries needed
+        """
+        return []
+
     # pylint: disable=assignment-from-none
     def GetEntries(self):
         """Return a list of entries contained by this entry
@@ -1212,17 +1249,29 @@ features to produce new behaviours.
         Args:
             indata: Data to compress
 
+        The result is reused if the data has not changed since the last call,
+        since sections are built several times while packing.
+
         Returns:
             Compressed data
         """
         self.uncomp_data = indata
         if self.compress != 'none':
             self.uncomp_size = len(indata)
-            if self.comp_bintool.is_present():
+            digest = hashlib.sha256(indata).digest()
+            if self._comp_cache and self._comp_cache[0] == digest:
+                data = self._comp_cache[1]
+                state.RecordCompression(self.compress, len(indata), len(data),
+                                        0, reused=True)
+            elif self.comp_bintool.is_present():
+                start = time.monotonic()
                 data = self.comp_bintool.compress(indata)
+                state.RecordCompression(self.compress, len(indata), len(data),
+                                        time.monotonic() - start)
                 uniq = self.GetUniqueName()
                 fname = tools.get_output_filename(f'comp.{uniq}')
                 tools.write_file(fname, data)
+                self._comp_cache = digest, data
             else:
                 self.record_missing_bintool(self.comp_bintool)
                 data = tools.get_bytes(0, 1024)
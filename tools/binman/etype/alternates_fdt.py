@@ -5,6 +5,7 @@
 """Entry-type module for producing multiple alternate sections"""
 
 import glob
+import hashlib
 import os
 
 from binman.entry import EntryArg
@@ -49,6 +50,11 @@ class Entry_alternates_fdt(Entry_section):
     The optional `fdt-phase` property indicates the phase to build. In this
     case, it etype runs fdtgrep to obtain the devicetree subset for that phase,
     respecting the `bootph-xxx` tags in the devicetree.
+
+    The alternates are built in parallel, each in its own process, unless
+    single-threaded mode (`-T0`) is selected. An alternate is not built again
+    if its output file exists and none of its inputs have changed since it
+    was written.
     """
     def __init__(self, section, etype, node):
         super().__init__(section, etype, node)
@@ -127,6 +133,26 @@ class Entry_alternates_fdt(Entry_section):
             self._cur_fdt = None
         return fname, data
 
+    def GetAlternateHash(self, alt):
+        """Get a hash of the inputs used to produce an alternate
+
+        This covers the alternate's devicetree, the settings used to process it
+        and the contents of this entry as produced with the normal devicetree,
+        which reflect any changes in the other entries in the section.
+
+        Args:
+            alt (str): Name of the alternate
+
+        Returns:
+            str: Hex digest of the inputs
+        """
+        fname = os.path.join(self._fdt_dir, f'{alt}.dtb')
+        hsh = hashlib.sha256()
+        hsh.update(tools.read_file(tools.get_input_filename(fname)))
+        hsh.update(repr((self._fdt_phase, self._remove_props)).encode())
+        hsh.update(self.GetData())
+        return hsh.hexdigest()
+
     def AddBintools(self, btools):
         super().AddBintools(btools)
         self.fdtgrep = self.AddBintool(btools, 'fdtgrep')
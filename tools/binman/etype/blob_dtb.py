@@ -54,6 +54,13 @@ class Entry_blob_dtb(Entry_blob):
         data = self.CompressData(indata)
         return self.ProcessContentsUpdate(data)
 
+    def IsLayoutDependent(self):
+        # The compressed size depends on the offset/size values in the dtb
+        return self.compress != 'none'
+
+    def EstimateContents(self):
+        self.ProcessContents()
+
     def GetFdtEtype(self):
         """Get the entry type of this device tree
 
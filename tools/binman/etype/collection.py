@@ -57,6 +57,11 @@ class Entry_collection(Entry):
 
         return data
 
+    def GetContentDeps(self):
+        fdt = self._node.GetFdt()
+        nodes = [fdt.LookupPhandle(phandle) for phandle in self.content]
+        return [node for node in nodes if node]
+
     def ObtainContents(self):
         data = self.GetContents(False)
         if data is None:
@@ -15,6 +15,9 @@ from u_boot_pylib import tout
 FDTMAP_MAGIC   = b'_FDTMAP_'
 FDTMAP_HDR_LEN = 16
 
+# Magic number at the start of the FDT which follows the header
+FDT_MAGIC      = b'\xd0\x0d\xfe\xed'
+
 # These is imported if needed
 Fdt = None
 libfdt = None
@@ -23,19 +26,25 @@ state = None
 def LocateFdtmap(data):
     """Search an image for an fdt map
 
+    This finds the first fdt map in the image, so an fdt map in a section is
+    only used if it comes before the image's own one. A match must be followed
+    by an FDT, so that any other copies of the magic in the image are skipped.
+    When data is an mmap of the image file, only the part of the image up to
+    the fdt map is read.
+
     Args:
-        data: Data to search
+        data: Data to search (bytes or mmap)
 
     Returns:
         Position of fdt map in data, or None if not found. Note that the
             position returned is of the FDT header, i.e. before the FDT data
     """
     hdr_pos = data.find(FDTMAP_MAGIC)
-    size = len(data)
-    if hdr_pos != -1:
-        hdr = data[hdr_pos:hdr_pos + FDTMAP_HDR_LEN]
-        if len(hdr) == FDTMAP_HDR_LEN:
+    while hdr_pos != -1:
+        fdt_pos = hdr_pos + FDTMAP_HDR_LEN
+        if data[fdt_pos:fdt_pos + len(FDT_MAGIC)] == FDT_MAGIC:
             return hdr_pos
+        hdr_pos = data.find(FDTMAP_MAGIC, hdr_pos + 1)
     return None
 
 class Entry_fdtmap(Entry):
@@ -14,6 +14,7 @@ import os
 from binman.entry import Entry, EntryArg
 from binman.etype.section import Entry_section
 from binman import elf
+from binman import state
 from dtoc import fdt_util
 from dtoc.fdt import Fdt
 from u_boot_pylib import tools
@@ -587,17 +588,35 @@ class Entry_fit(Entry_section):
         align = self._fit_props.get('fit,align')
         if align is not None:
             args.update({'align': fdt_util.fdt32_to_cpu(align.value)})
+
+        def _run_mkimage():
+            if self.mkimage.run(reset_timestamp=True, output_fname=output_fname,
+                                **args) is None:
+                return None
+            return tools.read_file(output_fname)
+
         if self._fit_props.get('fit,sign') is not None:
-            args.update({'priv_keys_dir': self._get_priv_keys_dir(data)})
-        if self.mkimage.run(reset_timestamp=True, output_fname=output_fname,
-                            **args) is None:
+            keys_dir = self._get_priv_keys_dir(data)
+            args.update({'priv_keys_dir': keys_dir})
+
+            # Only sign again if the FIT or the keys have changed
+            key_fnames = []
+            if keys_dir:
+                key_fnames = [os.path.join(keys_dir, fname)
+                              for fname in sorted(os.listdir(keys_dir))
+                              if fname.endswith(('.key', '.crt'))]
+            fit_data = state.Sign('fit', data, key_fnames, sorted(args.items()),
+                                  _run_mkimage)
+        else:
+            fit_data = _run_mkimage()
+        if fit_data is None:
             if not self.GetAllowMissing():
                 self.Raise("Missing tool: 'mkimage'")
             # Bintool is missing; just use empty data as the output
             self.record_missing_bintool(self.mkimage)
             return tools.get_bytes(0, 1024)
 
-        return tools.read_file(output_fname)
+        return fit_data
 
     def _raise_subnode(self, node, msg):
         """Raise an error with a paticular FIT subnode
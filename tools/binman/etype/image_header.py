@@ -17,16 +17,29 @@ from dtoc import fdt_util
 IMAGE_HEADER_MAGIC = b'BinM'
 IMAGE_HEADER_LEN   = 8
 
-def LocateHeaderOffset(data):
+def LocateHeaderOffset(data, search=True):
     """Search an image for an image header
 
+    The start and end of the image are checked first, since that is where the
+    header is normally placed.
+
     Args:
-        data: Data to search
+        data: Data to search (bytes or mmap)
+        search: True to search the whole image if the header is not at the
+            start or end
 
     Returns:
         Offset of image header in the image, or None if not found
     """
-    hdr_pos = data.find(IMAGE_HEADER_MAGIC)
+    hdr_pos = -1
+    for pos in (0, len(data) - IMAGE_HEADER_LEN):
+        if pos >= 0 and data[pos:pos + len(IMAGE_HEADER_MAGIC)] == (
+                IMAGE_HEADER_MAGIC):
+            hdr_pos = pos
+            break
+    else:
+        if search:
+            hdr_pos = data.find(IMAGE_HEADER_MAGIC)
     if hdr_pos != -1:
         size = len(data)
         hdr = data[hdr_pos:hdr_pos + IMAGE_HEADER_LEN]
@@ -13,6 +13,7 @@ from u_boot_pylib import tools
 from binman.entry import Entry
 from binman.etype.collection import Entry_collection
 from binman.entry import EntryArg
+from binman import state
 
 from Cryptodome.Hash import SHA256, SHA384, SHA512
 from Cryptodome.PublicKey import RSA
@@ -87,9 +88,11 @@ class Entry_pre_load(Entry_collection):
             self.key_path = ''
 
     def _CreateHeader(self):
-        """Create a pre load header"""
+        """Create a pre load header
+
+        The header is signed again only if the image or settings have changed.
+        """
         hash_name, sign_name = self.algo_name.split(',')
-        padding_name = self.padding_name
         key_name = os.path.join(self.key_path, self.key_name)
 
         # Check hash and signature name/type
@@ -98,6 +101,23 @@ class Entry_pre_load(Entry_collection):
         if sign_name not in RSAS:
             self.Raise(sign_name + " is not supported")
 
+        return state.Sign('pre-load', self.image, [key_name],
+                          (self.algo_name, self.padding_name, self.header_size,
+                           self.version),
+                          lambda: self._SignHeader(key_name))
+
+    def _SignHeader(self, key_name):
+        """Sign the image and produce the header contents
+
+        Args:
+            key_name (str): Filename of the private key to use
+
+        Returns:
+            bytes: Header contents, including signatures and padding
+        """
+        hash_name, sign_name = self.algo_name.split(',')
+        padding_name = self.padding_name
+
         # Read the key
         key = RSA.import_key(tools.read_file(key_name))
 
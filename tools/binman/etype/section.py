@@ -12,6 +12,7 @@ from collections import OrderedDict
 import concurrent.futures
 import re
 import sys
+import time
 
 from binman.entry import Entry
 from binman import state
@@ -169,6 +170,7 @@ class Entry_section(Entry):
         self._ignore_missing = False
         self._filename = None
         self.align_default = 0
+        self._contents_packed = False
 
     def IsSpecialSubnode(self, node):
         """Check if a node is a special one used by the section itself
@@ -332,8 +334,9 @@ class Entry_section(Entry):
         for entry in self._entries.values():
             entry_data = entry.GetData(required)
 
-            # This can happen when this section is referenced from a collection
-            # earlier in the image description. See testCollectionSection().
+            # This can happen when this section is referenced from an entry
+            # which does not declare it in GetContentDeps(). See
+            # testCollectionDepsMissing().
             if not required and entry_data is None:
                 return None
 
@@ -425,11 +428,26 @@ class Entry_section(Entry):
     def ResetForPack(self):
         """Reset offset/size fields so that packing can be done again"""
         super().ResetForPack()
+        self._contents_packed = False
         for entry in self._entries.values():
             entry.ResetForPack()
 
     def Pack(self, offset):
         """Pack all entries into the section"""
+        if not self._contents_packed:
+            self.PackContents()
+        self._contents_packed = False
+
+        offset = super().Pack(offset)
+        self.CheckEntries()
+        return offset
+
+    def PackContents(self):
+        """Pack the entries in the section and build its contents
+
+        This does not depend on the offset of the section itself, so it can be
+        done for sibling sections at the same time. See _PackCompressed().
+        """
         self._PackEntries()
         if self._sort:
             self._SortEntries()
@@ -442,16 +460,40 @@ class Entry_section(Entry):
             self.SetContents(data)
 
         self.CheckSize()
+        self._contents_packed = True
 
-        offset = super().Pack(offset)
-        self.CheckEntries()
-        return offset
+    def _PackCompressed(self):
+        """Build the contents of compressed subsections in parallel
+
+        Compression is often the slowest part of packing. The contents of a
+        subsection do not depend on its offset, so build them all up front,
+        before placing each entry in turn.
+        """
+        todo = [entry for entry in self._entries.values()
+                if isinstance(entry, Entry_section) and entry.compress != 'none']
+        threads = state.GetThreads()
+        if threads == 0 or len(todo) < 2:
+            return
+
+        def _PackContents(entry):
+            with state.Profile('Pack', entry):
+                entry.PackContents()
+
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=threads) as executor:
+            jobs = [executor.submit(_PackContents, entry) for entry in todo]
+
+        # Check the results in entry order, so any exceptions are generated
+        for job in jobs:
+            job.result()
 
     def _PackEntries(self):
         """Pack all entries into the section"""
+        self._PackCompressed()
         offset = self._skip_at_start
         for entry in self._entries.values():
-            offset = entry.Pack(offset)
+            with state.Profile('Pack', entry):
+                offset = entry.Pack(offset)
         return offset
 
     def _extend_entries(self):
@@ -501,7 +543,8 @@ class Entry_section(Entry):
     def WriteSymbols(self, section):
         """Write symbol values into binary files for access at run time"""
         for entry in self._entries.values():
-            entry.WriteSymbols(self)
+            with state.Profile('WriteSymbols', entry):
+                entry.WriteSymbols(self)
 
     def SetCalculatedProperties(self):
         super().SetCalculatedProperties()
@@ -518,10 +561,20 @@ class Entry_section(Entry):
         sizes_ok_base = super(Entry_section, self).ProcessContents()
         sizes_ok = True
         for entry in self._entries.values():
-            if not entry.ProcessContents():
-                sizes_ok = False
+            with state.Profile('ProcessContents', entry):
+                if not entry.ProcessContents():
+                    sizes_ok = False
         return sizes_ok and sizes_ok_base
 
+    def IsLayoutDependent(self):
+        return any(entry.IsLayoutDependent()
+                   for entry in self._entries.values())
+
+    def EstimateContents(self):
+        for entry in self._entries.values():
+            if entry.IsLayoutDependent():
+                entry.EstimateContents()
+
     def WriteMap(self, fd, indent):
         """Write a map of the section to a .map file
 
@@ -743,38 +796,28 @@ class Entry_section(Entry):
         actually needed
         """
         def _CheckDone(entry):
+            start = time.monotonic()
             if entry != skip_entry:
-                if entry.ObtainContents() is False:
+                with state.Profile('ObtainContents', entry):
+                    obtained = entry.ObtainContents()
+                if obtained is False:
                     next_todo.append(entry)
+            durations[entry] = (durations.get(entry, 0) + time.monotonic() -
+                                start)
             return entry
 
+        deps = self._GetEntryDeps()
+        durations = {}
         todo = self.GetEntries().values()
         for passnum in range(3):
             threads = state.GetThreads()
             next_todo = []
 
             if threads == 0:
-                for entry in todo:
+                for entry in self._OrderByDeps(todo, deps):
                     _CheckDone(entry)
             else:
-                with concurrent.futures.ThreadPoolExecutor(
-                        max_workers=threads) as executor:
-                    future_to_data = {
-                        entry: executor.submit(_CheckDone, entry)
-                        for entry in todo}
-                    timeout = 60
-                    if self.GetImage().test_section_timeout:
-                        timeout = 0
-                    done, not_done = concurrent.futures.wait(
-                        future_to_data.values(), timeout=timeout)
-                    # Make sure we check the result, so any exceptions are
-                    # generated. Check the results in entry order, since tests
-                    # may expect earlier entries to fail first.
-                    for entry in todo:
-                        job = future_to_data[entry]
-                        job.result()
-                    if not_done:
-                        self.Raise('Timed out obtaining contents')
+                self._RunByDeps(todo, deps, threads, _CheckDone)
 
             todo = next_todo
             if not todo:
@@ -783,8 +826,148 @@ class Entry_section(Entry):
         if todo:
             self.Raise('Internal error: Could not complete processing of contents: remaining %s' %
                        todo)
+        self._ShowCriticalPath(deps, durations)
         return True
 
+    def _GetEntryDeps(self):
+        """Work out which entries must obtain their contents before others
+
+        An entry depends on another if it, or any entry within it, uses the
+        contents of the other (see Entry.GetContentDeps()). Only dependencies
+        between entries in this section are returned. Others are handled by
+        the section containing both entries.
+
+        Returns:
+            dict: Dependencies:
+                key: Entry which has dependencies
+                value: set of Entry in this section which it depends on
+        """
+        def _GetNodes(entry):
+            nodes = list(entry.GetContentDeps())
+            for subentry in (entry.GetEntries() or {}).values():
+                nodes += _GetNodes(subentry)
+            return nodes
+
+        deps = {}
+        for entry in self._entries.values():
+            for node in _GetNodes(entry):
+                for other in self._entries.values():
+                    path = other._node.path
+                    if other is not entry and (node.path == path or
+                                               node.path.startswith(path + '/')):
+                        deps.setdefault(entry, set()).add(other)
+        return deps
+
+    @staticmethod
+    def _OrderByDeps(todo, deps):
+        """Order entries so that each comes after the entries it depends on
+
+        Entries otherwise stay in their original order. Any dependency loop is
+        ignored, so those entries are left in their original order.
+
+        Args:
+            todo (list of Entry): Entries to order
+            deps (dict): Dependencies, see _GetEntryDeps()
+
+        Returns:
+            list of Entry: Entries in the order to process them
+        """
+        order = []
+        pending = list(todo)
+        while pending:
+            ready = [entry for entry in pending
+                     if not (deps.get(entry, set()) & set(pending))]
+            if not ready:
+                ready = pending
+            order += ready
+            pending = [entry for entry in pending if entry not in ready]
+        return order
+
+    def _RunByDeps(self, todo, deps, threads, func):
+        """Run a function for each entry in parallel, respecting dependencies
+
+        Each entry is started as soon as all the entries it depends on have
+        finished. If there is a dependency loop, the remaining entries are
+        started together.
+
+        Args:
+            todo (list of Entry): Entries to process
+            deps (dict): Dependencies, see _GetEntryDeps()
+            threads (int): Number of threads to use, or None for the default
+            func (function): Function to call for each entry, passing the entry
+
+        Raises:
+            ValueError: No entry finished within the timeout (normally 60
+                seconds)
+        """
+        timeout = 60
+        if self.GetImage().test_section_timeout:
+            timeout = 0
+        pending = {entry: deps.get(entry, set()) & set(todo) for entry in todo}
+        jobs = {}
+        job_entry = {}
+        running = set()
+        finished = set()
+        timed_out = False
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=threads) as executor:
+            while pending or running:
+                ready = [entry for entry, need in pending.items()
+                         if not need - finished]
+                if not ready and not running:
+                    ready = list(pending)
+                for entry in ready:
+                    del pending[entry]
+                    job = executor.submit(func, entry)
+                    jobs[entry] = job
+                    job_entry[job] = entry
+                    running.add(job)
+                done, running = concurrent.futures.wait(
+                    running, timeout=timeout,
+                    return_when=concurrent.futures.FIRST_COMPLETED)
+                if not done:
+                    timed_out = True
+                    break
+                finished.update(job_entry[job] for job in done)
+
+            # Make sure we check the result, so any exceptions are generated.
+            # Check the results in entry order, since tests may expect earlier
+            # entries to fail first.
+            for entry in todo:
+                job = jobs.get(entry)
+                if job and job.done():
+                    job.result()
+            if timed_out:
+                self.Raise('Timed out obtaining contents')
+
+    def _ShowCriticalPath(self, deps, durations):
+        """Show the longest chain of dependent entries and the time it took
+
+        Args:
+            deps (dict): Dependencies, see _GetEntryDeps()
+            durations (dict): Time taken to obtain contents:
+                key: Entry
+                value: time in seconds
+        """
+        paths = {}
+
+        def _GetPath(entry):
+            if entry not in paths:
+                paths[entry] = (0, [])  # avoid looping if there is a cycle
+                best = max((_GetPath(dep) for dep in deps.get(entry, ())),
+                           key=lambda item: item[0], default=(0, []))
+                paths[entry] = (best[0] + durations.get(entry, 0),
+                                best[1] + [entry])
+            return paths[entry]
+
+        if not durations:
+            return
+        total, path = max((_GetPath(entry) for entry in durations),
+                          key=lambda item: item[0])
+        tout.info("Section '%s': contents took %.1fms, critical path %.1fms: %s" %
+                  (self.GetPath(), sum(durations.values()) * 1000,
+                   total * 1000, ' -> '.join(entry.name for entry in path)))
+
     def drop_absent(self):
         """Drop entries which are absent"""
         self._entries = {n: e for n, e in self._entries.items() if not e.absent}
@@ -60,6 +60,23 @@ class Entry_u_boot_ucode(Entry_blob):
     def __init__(self, section, etype, node):
         super().__init__(section, etype, node)
 
+    def _FindFdtEntry(self):
+        """Find the entry containing the devicetree with the microcode
+
+        Returns:
+            Entry_u_boot_dtb_with_ucode: Entry found, or None if none
+        """
+        for suffix in ['', '-spl', '-tpl']:
+            name = 'u-boot%s-dtb-with-ucode' % suffix
+            fdt_entry = self.section.FindEntryType(name)
+            if fdt_entry:
+                return fdt_entry
+        return None
+
+    def GetContentDeps(self):
+        fdt_entry = self._FindFdtEntry()
+        return [fdt_entry._node] if fdt_entry else []
+
     def ObtainContents(self):
         # If the section does not need microcode, there is nothing to do
         found = False
@@ -75,11 +92,7 @@ class Entry_u_boot_ucode(Entry_blob):
         # yet, return False so we will be called later. If the section simply
         # doesn't exist, then we may as well return True, since we are going to
         # get an error anyway.
-        for suffix in ['', '-spl', '-tpl']:
-            name = 'u-boot%s-dtb-with-ucode' % suffix
-            fdt_entry = self.section.FindEntryType(name)
-            if fdt_entry:
-                break
+        fdt_entry = self._FindFdtEntry()
         if not fdt_entry:
             self.data = b''
             return True
@@ -10,6 +10,7 @@ import os
 
 from binman.entry import EntryArg
 from binman.etype.collection import Entry_collection
+from binman import state
 
 from dtoc import fdt_util
 from u_boot_pylib  import tools
@@ -85,28 +86,19 @@ class Entry_x509_cert(Entry_collection):
         config_fname = tools.get_output_filename('config.%s' % uniq)
         tools.write_file(input_fname, input_data)
         if type == 'generic':
-            stdout = self.openssl.x509_cert(
-                cert_fname=output_fname,
-                input_fname=input_fname,
-                key_fname=self.key_fname,
+            method = self.openssl.x509_cert
+            args = dict(
                 cn=self._cert_ca,
-                revision=self._cert_rev,
-                config_fname=config_fname)
+                revision=self._cert_rev)
         elif type == 'sysfw':
-            stdout = self.openssl.x509_cert_sysfw(
-                cert_fname=output_fname,
-                input_fname=input_fname,
-                key_fname=self.key_fname,
-                config_fname=config_fname,
+            method = self.openssl.x509_cert_sysfw
+            args = dict(
                 sw_rev=self.sw_rev,
                 req_dist_name_dict=self.req_dist_name,
                 firewall_cert_data=self.firewall_cert_data)
         elif type == 'rom':
-            stdout = self.openssl.x509_cert_rom(
-                cert_fname=output_fname,
-                input_fname=input_fname,
-                key_fname=self.key_fname,
-                config_fname=config_fname,
+            method = self.openssl.x509_cert_rom
+            args = dict(
                 sw_rev=self.sw_rev,
                 req_dist_name_dict=self.req_dist_name,
                 cert_type=self.cert_type,
@@ -116,11 +108,8 @@ class Entry_x509_cert(Entry_collection):
                 sha=self.sha
             )
         elif type == 'rom-combined':
-            stdout = self.openssl.x509_cert_rom_combined(
-                cert_fname=output_fname,
-                input_fname=input_fname,
-                key_fname=self.key_fname,
-                config_fname=config_fname,
+            method = self.openssl.x509_cert_rom_combined
+            args = dict(
                 sw_rev=self.sw_rev,
                 req_dist_name_dict=self.req_dist_name,
                 load_addr=self.load_addr,
@@ -141,9 +130,19 @@ class Entry_x509_cert(Entry_collection):
                 dm_data_ext_boot_block=self.dm_data_ext_boot_block,
                 bootcore_opts=self.bootcore_opts
             )
-        if stdout is not None:
-            data = tools.read_file(output_fname)
-        else:
+
+        def _sign():
+            stdout = method(cert_fname=output_fname, input_fname=input_fname,
+                            key_fname=self.key_fname,
+                            config_fname=config_fname, **args)
+            if stdout is None:
+                return None
+            return tools.read_file(output_fname)
+
+        # The certificate is only created again if the data or settings change
+        data = state.Sign(f'x509-{type}', input_data, [self.key_fname],
+                          sorted(args.items()), _sign)
+        if data is None:
             # Bintool is missing; just use 4KB of zero data
             self.record_missing_bintool(self.openssl)
             data = tools.get_bytes(0, 4096)
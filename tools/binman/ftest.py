@@ -7,9 +7,11 @@
 #    python -m unittest func_test.TestFunctional.testHelp
 
 import collections
+import concurrent.futures
 import glob
 import gzip
 import hashlib
+import json
 from optparse import OptionParser
 import os
 import re
@@ -32,8 +34,10 @@ from binman import fmap_util
 from binman import state
 from dtoc import fdt
 from dtoc import fdt_util
+from binman.etype import collection
 from binman.etype import fdtmap
 from binman.etype import image_header
+from binman.etype import u_boot_ucode
 from binman.image import Image
 from u_boot_pylib import command
 from u_boot_pylib import test_util
@@ -374,7 +378,8 @@ class TestFunctional(unittest.TestCase):
                     use_expanded=False, verbosity=None, allow_missing=False,
                     allow_fake_blobs=False, extra_indirs=None, threads=None,
                     test_section_timeout=False, update_fdt_in_elf=None,
-                    force_missing_bintools='', ignore_missing=False, output_dir=None):
+                    force_missing_bintools='', ignore_missing=False, output_dir=None,
+                    profile=None):
         """Run binman with a given test file
 
         Args:
@@ -408,6 +413,8 @@ class TestFunctional(unittest.TestCase):
             ignore_missing (bool): True to return success even if there are
                 missing blobs or bintools
             output_dir: Specific output directory to use for image using -O
+            profile (str): Base filename for profiling output, passed with
+                --profile
 
         Returns:
             int return code, 0 on success
@@ -456,6 +463,8 @@ class TestFunctional(unittest.TestCase):
                 args += ['-I', indir]
         if output_dir:
             args += ['-O', output_dir]
+        if profile:
+            args += ['--profile', profile]
         return self._DoBinman(*args)
 
     def _SetupDtb(self, fname, outfile='u-boot.dtb'):
@@ -1237,7 +1246,8 @@ class TestFunctional(unittest.TestCase):
         data = self._DoReadFile('150_powerpc_mpc85xx_bootpg_resetvec.dts')
         self.assertEqual(PPC_MPC85XX_BR_DATA, data[:len(PPC_MPC85XX_BR_DATA)])
 
-    def _RunMicrocodeTest(self, dts_fname, nodtb_data, ucode_second=False):
+    def _RunMicrocodeTest(self, dts_fname, nodtb_data, ucode_second=False,
+                          threads=None):
         """Handle running a test for insertion of microcode
 
         Args:
@@ -1245,6 +1255,8 @@ class TestFunctional(unittest.TestCase):
             nodtb_data: Data that we expect in the first section
             ucode_second: True if the microsecond entry is second instead of
                 third
+            threads: Number of threads to use (None for default, 0 for
+                single-threaded)
 
         Returns:
             Tuple:
@@ -1252,7 +1264,7 @@ class TestFunctional(unittest.TestCase):
                 Offset and size components of microcode pointer, as inserted
                     in the above (two 4-byte words)
         """
-        data = self._DoReadFile(dts_fname, True)
+        data = self._DoReadFileDtb(dts_fname, True, threads=threads)[0]
 
         # Now check the device tree has no microcode
         if ucode_second:
@@ -1450,7 +1462,7 @@ class TestFunctional(unittest.TestCase):
         data = self._DoReadFile('048_x86_start16_spl.dts')
         self.assertEqual(X86_START16_SPL_DATA, data[:len(X86_START16_SPL_DATA)])
 
-    def _PackUbootSplMicrocode(self, dts, ucode_second=False):
+    def _PackUbootSplMicrocode(self, dts, ucode_second=False, threads=None):
         """Helper function for microcode tests
 
         We expect to see the following in the image, in order:
@@ -1463,10 +1475,13 @@ class TestFunctional(unittest.TestCase):
             dts: Device tree file to use for test
             ucode_second: True if the microsecond entry is second instead of
                 third
+            threads: Number of threads to use (None for default, 0 for
+                single-threaded)
         """
         self._SetupSplElf('u_boot_ucode_ptr')
         first, pos_and_size = self._RunMicrocodeTest(dts, U_BOOT_SPL_NODTB_DATA,
-                                                     ucode_second=ucode_second)
+                                                     ucode_second=ucode_second,
+                                                     threads=threads)
         self.assertEqual(b'splnodtb with microc' + pos_and_size +
                          b'ter somewhere in here', first)
 
@@ -1478,13 +1493,20 @@ class TestFunctional(unittest.TestCase):
     def testPackUbootSplMicrocodeReorder(self):
         """Test that order doesn't matter for microcode entries
 
-        This is the same as testPackUbootSplMicrocode but when we process the
-        u-boot-ucode entry we have not yet seen the u-boot-dtb-with-ucode
-        entry, so we reply on binman to try later.
+        This is the same as testPackUbootSplMicrocode but the u-boot-ucode
+        entry comes before the u-boot-dtb-with-ucode entry, so binman must
+        obtain the contents of the latter first.
         """
         self._PackUbootSplMicrocode('058_x86_ucode_spl_needs_retry.dts',
                                     ucode_second=True)
 
+    def testPackUbootSplMicrocodeRetry(self):
+        """Test microcode which is retried as its dependency is not declared"""
+        with unittest.mock.patch.object(u_boot_ucode.Entry_u_boot_ucode,
+                                        'GetContentDeps', return_value=[]):
+            self._PackUbootSplMicrocode('058_x86_ucode_spl_needs_retry.dts',
+                                        ucode_second=True, threads=0)
+
     def testPackMrc(self):
         """Test that an image with an MRC binary can be created"""
         data = self._DoReadFile('050_intel_mrc.dts')
@@ -2705,6 +2727,26 @@ class TestFunctional(unittest.TestCase):
             }
         self.assertEqual(expected, props)
 
+    def testCompressDtbTrialPack(self):
+        """Test that a compressed dtb has its size estimated before packing"""
+        self._CheckLz4()
+        with test_util.capture_sys_output() as (stdout, _):
+            data = self._DoReadFileDtb('124_compress_dtb.dts', use_real_dtb=True,
+                                       update_dtb=True, verbosity=3)[0]
+        out = stdout.getvalue()
+        self.assertIn("Image 'image': estimated sizes with a trial pack", out)
+        passes = re.search(r"Image 'image': pack completed after (\d+) pass",
+                           out)
+        self.assertIsNotNone(passes)
+        self.assertLessEqual(int(passes.group(1)), 2)
+
+        comp_data = data[len(U_BOOT_DATA):]
+        dtb = fdt.Fdt.FromData(self._decompress(comp_data))
+        dtb.Scan()
+        props = self._GetPropTree(dtb, ['size'])
+        self.assertEqual(len(comp_data), props['u-boot-dtb:size'])
+        self.assertEqual(len(data), props['size'])
+
     def testCbfsUpdateFdt(self):
         """Test that we can update the device tree with CBFS offset/size info"""
         self._CheckLz4()
@@ -2825,6 +2867,29 @@ class TestFunctional(unittest.TestCase):
         data = self._DoReadFile('005_simple.dts')
         self.assertEqual(None, fdtmap.LocateFdtmap(data))
 
+    def testFindFdtmapFalseMatch(self):
+        """Test skipping fdtmap magic which is not followed by an FDT"""
+        self._CheckLz4()
+        data = self._DoReadFileRealDtb('128_decode_image.dts')
+        image = control.images['image']
+        pos = image.GetEntries()['fdtmap'].image_pos
+        bad = fdtmap.FDTMAP_MAGIC + tools.get_bytes(0, 12)
+        self.assertEqual(len(bad) + pos, fdtmap.LocateFdtmap(bad + data))
+        self.assertEqual(None, fdtmap.LocateFdtmap(bad))
+
+    def testFindFdtmapNested(self):
+        """Test that the image's fdtmap is found, not a section's"""
+        data = self._DoReadFileRealDtb('343_fdtmap_nested.dts')
+        image = control.images['image']
+        entry = image.GetEntries()['fdtmap']
+        self.assertEqual(entry.image_pos, fdtmap.LocateFdtmap(data))
+
+        image = Image.FromFile(tools.get_output_filename('image.bin'))
+        self.assertEqual(['u-boot', 'fdtmap', 'section'],
+                         list(image.GetEntries().keys()))
+        self.assertEqual(['u-boot', 'fdtmap'],
+                         list(image.GetEntries()['section'].GetEntries()))
+
     def testFindImageHeader(self):
         """Test locating a image header"""
         self._CheckLz4()
@@ -2849,6 +2914,22 @@ class TestFunctional(unittest.TestCase):
         data = self._DoReadFile('005_simple.dts')
         self.assertEqual(None, image_header.LocateHeaderOffset(data))
 
+    def testReadImageLazy(self):
+        """Test that reading an image does not read the whole file"""
+        self._CheckLz4()
+        data = self._DoReadFileRealDtb('128_decode_image.dts')
+        fname = tools.get_output_filename('image.bin')
+        for method in ['header', 'search']:
+            if method == 'search':
+                # Drop the image header, so the FDT map must be searched for
+                data = data[:-image_header.IMAGE_HEADER_LEN]
+                tools.write_file(fname, data)
+            image = Image.FromFile(fname)
+            self.assertIn('fdtmap', image.GetEntries())
+            self.assertIsNone(image._data)
+            self.assertEqual(data, image.ReadData())
+            self.assertIsNotNone(image._data)
+
     def testReadImage(self):
         """Test reading an image and accessing its FDT map"""
         self._CheckLz4()
@@ -3680,6 +3761,207 @@ class TestFunctional(unittest.TestCase):
         finally:
             shutil.rmtree(tmpdir)
 
+    def testReplaceInPlace(self):
+        """Test replacing an entry without rewriting the image"""
+        self._DoReadFileRealDtb('143_replace_all.dts')
+        image_fname = tools.get_output_filename('image.bin')
+        orig = tools.read_file(image_fname)
+
+        expected = b'x' * len(U_BOOT_DATA)
+        with test_util.capture_sys_output() as (stdout, stderr):
+            image = control.WriteEntry(image_fname, 'u-boot', expected,
+                                       allow_resize=False, in_place=True)
+        entry = image.GetEntries()['u-boot']
+        data = tools.read_file(image_fname)
+        self.assertEqual(len(orig), len(data))
+        pos = entry.image_pos
+        self.assertEqual(expected, data[pos:pos + len(expected)])
+        self.assertEqual(orig[:pos], data[:pos])
+        self.assertEqual(orig[pos + len(expected):],
+                         data[pos + len(expected):])
+
+        # A change of size needs the whole image to be processed
+        writes, reason = control.PrepareInPlace(image, entry, expected + b'x')
+        self.assertIsNone(writes)
+        self.assertIn('size', reason)
+
+        # Entries which binman generates must be processed too
+        for name in ['fdtmap', 'image-header']:
+            entry = image.GetEntries()[name]
+            writes, reason = control.PrepareInPlace(image, entry,
+                                                    b'x' * entry.size)
+            self.assertIsNone(writes)
+            self.assertIn('generates its contents', reason)
+
+    def testReplaceInPlaceFallback(self):
+        """Test entries which cannot be replaced without rewriting the image"""
+        self._CheckLz4()
+        self._SetupSplElf()
+        orig = self._DoReadFileRealDtb('344_replace_in_place.dts')
+        image_fname = tools.get_output_filename('image-updated.bin')
+
+        # Entries which can be written in place
+        image = Image.FromFile(tools.get_output_filename('image.bin'))
+        for path in ['u-boot', 'section/u-boot']:
+            entry = image.FindEntryPath(path)
+            writes, reason = control.PrepareInPlace(image, entry,
+                                                    b'x' * entry.size)
+            self.assertIsNone(reason)
+            self.assertEqual([(entry.image_pos, b'x' * entry.size)], writes)
+
+        # Each of these must fall back to processing the whole image, so use
+        # a new copy of the image each time. For entries which binman generates
+        # or compresses, write back the existing data
+        new_data = b'x' * len(U_BOOT_DATA)
+        cases = [
+            ('section', 'entry is a section', None),
+            ('u-boot-dtb', "entry type 'u-boot-dtb' processes its data", None),
+            ('fdtmap', "entry type 'fdtmap' generates its contents", None),
+            ('compressed', 'entry is compressed', None),
+            ('u-boot-spl', 'entry may need symbols written',
+             b'x' * len(U_BOOT_SPL_DATA)),
+            ('padded', 'size does not match', new_data),
+            ('comp-section/u-boot', "entry is inside '/comp-section'", None),
+            ('section-with-hash/u-boot',
+             "section '/section-with-hash' has a hash", new_data),
+            ]
+        for path, expect_reason, data in cases:
+            with self.subTest(path=path):
+                tools.write_file(image_fname, orig)
+                image = Image.FromFile(image_fname)
+                entry = image.FindEntryPath(path)
+                write_data = data
+                if not data:
+                    write_data = control.ReadEntry(image_fname, path,
+                                                   decomp=False)
+                writes, reason = control.PrepareInPlace(image, entry,
+                                                        write_data)
+                self.assertIsNone(writes)
+                self.assertEqual(expect_reason, reason)
+
+                with unittest.mock.patch.object(
+                        control, 'WriteInPlace') as write_in_place:
+                    with unittest.mock.patch.object(
+                            control, 'ReplaceOneEntry',
+                            wraps=control.ReplaceOneEntry) as replace_one:
+                        with test_util.capture_sys_output():
+                            control.WriteEntry(image_fname, path, write_data,
+                                               in_place=True)
+                write_in_place.assert_not_called()
+                replace_one.assert_called_once()
+                if data:
+                    self.assertIn(data, control.ReadEntry(image_fname, path))
+
+    def testReplaceInPlaceContent(self):
+        """Test that entries used by others are not replaced in place"""
+        self._DoReadFileRealDtb('346_replace_in_place_content.dts')
+        image_fname = tools.get_output_filename('image.bin')
+        image = Image.FromFile(image_fname)
+        entry = image.FindEntryPath('u-boot')
+        writes, reason = control.PrepareInPlace(image, entry,
+                                                b'x' * entry.size)
+        self.assertIsNone(writes)
+        self.assertEqual('image has entries which use the data of others',
+                         reason)
+
+        # The full replace updates the collection too
+        expected = b'x' * len(U_BOOT_DATA)
+        with unittest.mock.patch.object(control,
+                                        'WriteInPlace') as write_in_place:
+            control.WriteEntry(image_fname, 'u-boot', expected, in_place=True)
+        write_in_place.assert_not_called()
+        self.assertEqual(expected,
+                         control.ReadEntry(image_fname, 'collection'))
+
+    def _SetupInPlaceHash(self):
+        """Set up two copies of an image with hashes, for replacing entries
+
+        Returns:
+            tuple:
+                str: Filename of image to update in place
+                str: Filename of image to update by processing it
+        """
+        data = self._DoReadFileRealDtb('345_replace_in_place_hash.dts')
+        in_place_fname = tools.get_output_filename('image-in-place.bin')
+        tools.write_file(in_place_fname, data)
+        normal_fname = tools.get_output_filename('image-normal.bin')
+        tools.write_file(normal_fname, data)
+        return in_place_fname, normal_fname
+
+    def testReplaceInPlaceHash(self):
+        """Test replacing an entry in place updates its hash in the fdtmap"""
+        in_place_fname, normal_fname = self._SetupInPlaceHash()
+        expected = b'x' * len(U_BOOT_DATA)
+        with unittest.mock.patch.object(
+                control, 'WriteInPlace',
+                wraps=control.WriteInPlace) as write_in_place:
+            control.WriteEntry(in_place_fname, 'u-boot', expected,
+                               allow_resize=False, in_place=True)
+        write_in_place.assert_called_once()
+        control.WriteEntry(normal_fname, 'u-boot', expected,
+                           allow_resize=False)
+        self.assertEqual(tools.read_file(normal_fname),
+                         tools.read_file(in_place_fname))
+
+        image = Image.FromFile(in_place_fname)
+        node = image.fdtmap_dtb.GetNode('/u-boot/hash')
+        self.assertEqual(hashlib.sha256(expected).digest(),
+                         node.props['value'].bytes)
+
+        # A hash value of the wrong size cannot be updated in place
+        entry = image.FindEntryPath('u-boot2')
+        entry._node.FindNode('hash').SetData('value', b'x')
+        writes, reason = control.PrepareInPlace(image, entry, expected)
+        self.assertIsNone(writes)
+        self.assertEqual('hash cannot be updated', reason)
+
+    def testReplaceInPlaceMulti(self):
+        """Test replacing several entries in place in one call"""
+        in_place_fname, normal_fname = self._SetupInPlaceHash()
+        indir = os.path.join(self._indir, 'in-place')
+        os.makedirs(indir, exist_ok=True)
+        expected1 = b'x' * len(U_BOOT_DATA)
+        tools.write_file(os.path.join(indir, 'u-boot'), expected1)
+        expected2 = b'y' * len(U_BOOT_DATA)
+        tools.write_file(os.path.join(indir, 'u-boot2'), expected2)
+
+        paths = ['u-boot', 'u-boot2']
+        with unittest.mock.patch.object(
+                control, 'WriteInPlace',
+                wraps=control.WriteInPlace) as write_in_place:
+            control.ReplaceEntries(in_place_fname, None, indir, paths,
+                                   allow_resize=False, in_place=True)
+        write_in_place.assert_called_once()
+        control.ReplaceEntries(normal_fname, None, indir, paths,
+                               allow_resize=False)
+        self.assertEqual(tools.read_file(normal_fname),
+                         tools.read_file(in_place_fname))
+        self.assertEqual(expected1, control.ReadEntry(in_place_fname, 'u-boot'))
+        self.assertEqual(expected2,
+                         control.ReadEntry(in_place_fname, 'u-boot2'))
+
+    def testReplaceInPlaceMultiFallback(self):
+        """Test replacing several entries where one cannot be done in place"""
+        self._CheckLz4()
+        self._SetupSplElf()
+        self._DoReadFileRealDtb('344_replace_in_place.dts')
+        image_fname = tools.get_output_filename('image.bin')
+        indir = os.path.join(self._indir, 'in-place')
+        os.makedirs(indir, exist_ok=True)
+        expected1 = b'x' * len(U_BOOT_DATA)
+        tools.write_file(os.path.join(indir, 'u-boot'), expected1)
+        expected2 = b'y' * len(U_BOOT_DATA)
+        tools.write_file(os.path.join(indir, 'padded'), expected2)
+
+        with unittest.mock.patch.object(control,
+                                        'WriteInPlace') as write_in_place:
+            with test_util.capture_sys_output():
+                control.ReplaceEntries(image_fname, None, indir,
+                                       ['u-boot', 'padded'], in_place=True)
+        write_in_place.assert_not_called()
+        self.assertEqual(expected1, control.ReadEntry(image_fname, 'u-boot'))
+        self.assertIn(expected2, control.ReadEntry(image_fname, 'padded'))
+
     def testReplaceCmdSome(self):
         """Test replacing some files fron an image on the command line"""
         updated_fname, outdir, expected1, expected2, expected_text = (
@@ -4629,6 +4911,20 @@ class TestFunctional(unittest.TestCase):
         err = stderr.getvalue()
         self.assertRegex(err, "Image 'image'.*missing bintools.*: lz4")
 
+    def testCompressSectionsParallel(self):
+        """Test building compressed sections in parallel"""
+        self._CheckLz4()
+        with test_util.capture_sys_output() as (stdout, _):
+            data = self._DoReadFileDtb('186_compress_extra.dts',
+                                       verbosity=2)[0]
+        serial = self._DoReadFileDtb('186_compress_extra.dts', threads=0)[0]
+        self.assertEqual(serial, data)
+
+        # Each section is compressed once, then the result is reused
+        self.assertRegex(stdout.getvalue(),
+                         r"compress 'lz4': 2 calls \(\d+ reused\), "
+                         r'0x[0-9a-f]+ -> 0x[0-9a-f]+ bytes in [0-9.]+s')
+
     def testCompressExtra(self):
         """Test compression of a section with no fixed size"""
         self._CheckLz4()
@@ -4984,6 +5280,91 @@ class TestFunctional(unittest.TestCase):
                          section + tools.get_bytes(0xfe, 3) + U_BOOT_DATA,
                          data)
 
+    def testCollectionDeps(self):
+        """Test that a collection obtains its contents after those it uses"""
+        self._DoReadFile('199_collection_section.dts')
+        image = control.images['image']
+        entries = image.GetEntries()
+        deps = image._GetEntryDeps()
+        self.assertEqual({entries['collection']: {entries['section'],
+                                                  entries['u-boot']}}, deps)
+        order = image._OrderByDeps(entries.values(), deps)
+        self.assertEqual(['fill', 'section', 'fill2', 'u-boot', 'collection'],
+                         [entry.name for entry in order])
+
+    def testCollectionDepsMissing(self):
+        """Test a collection which is retried as its dependencies are unknown
+
+        Without GetContentDeps() the collection is processed first, before the
+        section it uses has its contents, so it must be retried.
+        """
+        with unittest.mock.patch.object(collection.Entry_collection,
+                                        'GetContentDeps', return_value=[]):
+            data = self._DoReadFileDtb('199_collection_section.dts',
+                                       threads=0)[0]
+        section = U_BOOT_NODTB_DATA + U_BOOT_DTB_DATA
+        self.assertEqual(section + U_BOOT_DATA + tools.get_bytes(0xff, 2) +
+                         section + tools.get_bytes(0xfe, 3) + U_BOOT_DATA,
+                         data)
+
+    def testCollectionDepsCycle(self):
+        """Test collections which use each other's contents"""
+        for threads in [0, None]:
+            with self.subTest(threads=threads):
+                with self.assertRaises(ValueError) as exc:
+                    self._DoTestFile('347_collection_cycle.dts',
+                                     threads=threads)
+                self.assertIn(
+                    'Could not complete processing of contents: remaining '
+                    '[<binman.etype.collection.Entry_collection',
+                    str(exc.exception))
+
+    def testProfile(self):
+        """Test writing profiling information"""
+        base = os.path.join(self._indir, 'profile')
+        self._DoTestFile('199_collection_section.dts', profile=base)
+        info = json.loads(tools.read_file(base + '.json', binary=False))
+
+        # The collection's dependencies are ready, so it only runs once
+        coll = info['etypes']['collection']['ObtainContents']
+        self.assertEqual(1, coll['count'])
+        entry = info['entries']['/binman/section/u-boot-nodtb']
+        self.assertEqual('u-boot-nodtb', entry['etype'])
+        self.assertEqual({'count', 'time', 'self'}, entry['Pack'].keys())
+
+        phases = {'ObtainContents', 'Pack', 'SyncFdt', 'WriteSymbols',
+                  'ProcessContents', 'BuildImage'}
+        lines = tools.read_file(base + '.folded', binary=False).splitlines()
+        self.assertTrue(lines)
+        for line in lines:
+            stack, usecs = line.rsplit(' ', 1)
+            self.assertIn(stack.split(';')[0], phases)
+            self.assertGreater(int(usecs), 0)
+        self.assertIsNone(state.profile_info)
+
+    def testProfileBintool(self):
+        """Test profiling the time taken by a bintool"""
+        self._CheckLz4()
+        base = os.path.join(self._indir, 'profile')
+        self._DoTestFile('083_compress.dts', profile=base)
+        info = json.loads(tools.read_file(base + '.json', binary=False))
+        self.assertEqual(['lz4'], list(info['bintools'].keys()))
+        self.assertEqual(1, info['bintools']['lz4']['count'])
+        self.assertGreater(info['bintools']['lz4']['time'], 0)
+
+        # The bintool is shown within the entry which ran it
+        lines = tools.read_file(base + '.folded', binary=False).splitlines()
+        stacks = [line.rsplit(' ', 1)[0] for line in lines]
+        self.assertIn('ObtainContents;binman;blob;bintool:lz4', stacks)
+
+    def testProfileError(self):
+        """Test that profiling is stopped if building the image fails"""
+        base = os.path.join(self._indir, 'profile')
+        with self.assertRaises(ValueError) as exc:
+            self._DoTestFile('158_blob_ext_missing.dts', profile=base)
+        self.assertIn("Filename 'missing-file' not found", str(exc.exception))
+        self.assertIsNone(state.profile_info)
+
     def testAlignDefault(self):
         """Test that default alignment works on sections"""
         data = self._DoReadFile('200_align_default.dts')
@@ -5763,6 +6144,37 @@ fdt         fdtmap                Extract the devicetree blob from the fdtmap
         self.assertEqual(PRE_LOAD_VERSION, data[4:4 + len(PRE_LOAD_VERSION)])
         self.assertEqual(PRE_LOAD_HDR_SIZE, data[8:8 + len(PRE_LOAD_HDR_SIZE)])
 
+    def testPreLoadDepsMissing(self):
+        """Test a pre-load header retried as its dependencies are unknown"""
+        entry_args = {
+            'pre-load-key-path': os.path.join(self._binman_dir, 'test'),
+        }
+        with unittest.mock.patch.object(collection.Entry_collection,
+                                        'GetContentDeps', return_value=[]):
+            data = self._DoReadFileDtb(
+                '230_pre_load.dts', entry_args=entry_args,
+                extra_indirs=[os.path.join(self._binman_dir, 'test')],
+                threads=0)[0]
+        self.assertEqual(PRE_LOAD_MAGIC, data[:len(PRE_LOAD_MAGIC)])
+
+    def testPreLoadSignCache(self):
+        """Test that the pre-load header is not signed again in each pass"""
+        def _get_count(name):
+            return sum(timing.count for tname, timing in
+                       state.timing_info.items()
+                       if tname.rsplit(':', 1)[0] == name)
+
+        entry_args = {
+            'pre-load-key-path': os.path.join(self._binman_dir, 'test'),
+        }
+        signed = _get_count('sign')
+        cached = _get_count('sign-cached')
+        self._DoReadFileDtb(
+            '230_pre_load.dts', entry_args=entry_args,
+            extra_indirs=[os.path.join(self._binman_dir, 'test')])
+        self.assertEqual(1, _get_count('sign') - signed)
+        self.assertLess(cached, _get_count('sign-cached'))
+
     def testPreLoadNoKey(self):
         """Test an image with a pre-load heade0r with missing key"""
         with self.assertRaises(FileNotFoundError) as exc:
@@ -6782,6 +7194,17 @@ fdt         fdtmap                Extract the devicetree blob from the fdtmap
 
         # TODO: verify the signature
 
+    def testX509CertDepsMissing(self):
+        """Test an X509 certificate retried as its dependencies are unknown"""
+        entry_args = {
+            'keyfile': self.TestFile('key.key'),
+        }
+        with unittest.mock.patch.object(collection.Entry_collection,
+                                        'GetContentDeps', return_value=[]):
+            data = self._DoReadFileDtb('279_x509_cert.dts',
+                                       entry_args=entry_args, threads=0)[0]
+        self.assertEqual(U_BOOT_DATA, data[-4:])
+
     def testX509CertMissing(self):
         """Test that binman still produces an image if openssl is missing"""
         keyfile = self.TestFile('key.key')
@@ -7562,13 +7985,15 @@ fdt         fdtmap                Extract the devicetree blob from the fdtmap
 
         return testdir, dtb_list
 
-    def CheckAlternates(self, dts, phase, xpl_data):
+    def CheckAlternates(self, dts, phase, xpl_data, threads=None):
         """Run the test for the alterative-fdt etype
 
         Args:
             dts (str): Devicetree file to process
             phase (str): Phase to process ('spl', 'tpl' or 'vpl')
             xpl_data (bytes): Expected data for the phase's binary
+            threads (int): Number of threads to use (None for default, 0 for
+                single-threaded)
 
         Returns:
             dict of .dtb files produced
@@ -7583,7 +8008,8 @@ fdt         fdtmap                Extract the devicetree blob from the fdtmap
             'of-spl-remove-props': 'prop-to-remove another-prop-to-get-rid-of',
         }
         data = self._DoReadFileDtb(dts, use_real_dtb=True, update_dtb=True,
-                                   use_expanded=True, entry_args=entry_args)[0]
+                                   use_expanded=True, entry_args=entry_args,
+                                   threads=threads)[0]
         self.assertEqual(xpl_data, data[:len(xpl_data)])
         rest = data[len(xpl_data):]
         pad_len = 10
@@ -7640,6 +8066,69 @@ fdt         fdtmap                Extract the devicetree blob from the fdtmap
             # Make sure the other node is still there
             self.assertIsNotNone(dtb.GetNode('/node/other-node'))
 
+    def testAlternatesFdtUnchanged(self):
+        """Test that alternates are not built again if inputs are unchanged"""
+        self._SetupTplElf()
+        dtbs = self.CheckAlternates('328_alternates_fdt.dts', 'tpl',
+                                    U_BOOT_TPL_NODTB_DATA)
+        image = control.images['image']
+        pathnames = [tools.get_output_filename(fname) for fname in dtbs]
+        for pathname in pathnames:
+            tools.write_file(pathname, b'old')
+        image.WriteAlternates()
+        for pathname in pathnames:
+            self.assertEqual(b'old', tools.read_file(pathname))
+
+        # Without the hashes, each alternate must be built again
+        os.remove(tools.get_output_filename('image.alt-hashes'))
+        image.WriteAlternates()
+        for pathname in pathnames:
+            self.assertNotEqual(b'old', tools.read_file(pathname))
+
+        # A single alternate is built in this process
+        data = tools.read_file(pathnames[0])
+        os.remove(pathnames[0])
+        tools.write_file(pathnames[1], b'old')
+        with unittest.mock.patch.object(
+                concurrent.futures, 'ProcessPoolExecutor') as executor:
+            image.WriteAlternates()
+        executor.assert_not_called()
+        self.assertEqual(data, tools.read_file(pathnames[0]))
+        self.assertEqual(b'old', tools.read_file(pathnames[1]))
+
+    def testAlternatesFdtBadHashes(self):
+        """Test that alternates are built again if the hashes are invalid"""
+        self._SetupTplElf()
+        dtbs = self.CheckAlternates('328_alternates_fdt.dts', 'tpl',
+                                    U_BOOT_TPL_NODTB_DATA)
+        image = control.images['image']
+        pathnames = [tools.get_output_filename(fname) for fname in dtbs]
+        hash_fname = tools.get_output_filename('image.alt-hashes')
+        hashes = tools.read_file(hash_fname)
+        for bad in [hashes[:len(hashes) // 2], b'\xff', b'[]']:
+            with self.subTest(bad=bad):
+                tools.write_file(hash_fname, bad)
+                for pathname in pathnames:
+                    tools.write_file(pathname, b'old')
+                with test_util.capture_sys_output() as (_, stderr):
+                    image.WriteAlternates()
+                self.assertIn(f"Ignoring invalid file '{hash_fname}'",
+                              stderr.getvalue())
+                for pathname in pathnames:
+                    self.assertNotEqual(b'old', tools.read_file(pathname))
+                self.assertEqual(hashes, tools.read_file(hash_fname))
+
+    def testAlternatesFdtSingleThread(self):
+        """Test handling of alternates-fdt etype without multiprocessing"""
+        self._SetupTplElf()
+        for dts in ['328_alternates_fdt.dts', '329_alternates_fdtgrep.dts']:
+            with self.subTest(dts=dts):
+                with unittest.mock.patch.object(
+                        concurrent.futures, 'ProcessPoolExecutor') as executor:
+                    self.CheckAlternates(dts, 'tpl', U_BOOT_TPL_NODTB_DATA,
+                                         threads=0)
+                executor.assert_not_called()
+
     def testAlternatesFdtgrep(self):
         """Test handling of alternates-fdt etype using fdtgrep"""
         self._SetupTplElf()
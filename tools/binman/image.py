@@ -6,7 +6,11 @@
 #
 
 from collections import OrderedDict
+import concurrent.futures
 import fnmatch
+import json
+import mmap
+import multiprocessing
 from operator import attrgetter
 import os
 import re
@@ -24,6 +28,55 @@ from u_boot_pylib import tout
 # This is imported if needed
 state = None
 
+# alternates-fdt entry to process in a worker process. This is only set in the
+# workers, by _InitAlternateWorker()
+worker_alt_entry = None
+
+
+def _InitAlternateWorker(alt_entry):
+    """Set up a worker process for writing alternates
+
+    Worker processes are forked, so the entry is not pickled. Each worker has
+    its own copy of it to process.
+
+    Args:
+        alt_entry (Entry_alternates_fdt): Entry to process
+    """
+    global worker_alt_entry
+
+    worker_alt_entry = alt_entry
+
+
+def _WriteAlternate(alt_entry, alt):
+    """Write out a single alternate image
+
+    Args:
+        alt_entry (Entry_alternates_fdt): Entry to process
+        alt (str): Name of the alternate to write
+
+    Returns:
+        str: Filename of the alternate's image
+    """
+    fname, data = alt_entry.ProcessWithFdt(alt)
+    pathname = tools.get_output_filename(fname)
+    tout.info(f"Writing alternate '{alt}' to '{pathname}'")
+    tools.write_file(pathname, data)
+    tout.info("Wrote %#x bytes" % len(data))
+    return fname
+
+
+def _WriteAlternateInWorker(alt):
+    """Write out a single alternate image in a worker process
+
+    Args:
+        alt (str): Name of the alternate to write
+
+    Returns:
+        str: Filename of the alternate's image
+    """
+    return _WriteAlternate(worker_alt_entry, alt)
+
+
 class Image(section.Entry_section):
     """A Image, representing an output from binman
 
@@ -89,6 +142,7 @@ class Image(section.Entry_section):
         self._filename = '%s.bin' % self.image_name
         self.fdtmap_dtb = None
         self.fdtmap_data = None
+        self._data = None
         self.allow_repack = False
         self._ignore_missing = ignore_missing
         self.missing_etype = missing_etype
@@ -117,22 +171,32 @@ class Image(section.Entry_section):
         Raises:
             ValueError if something goes wrong
         """
-        data = tools.read_file(fname)
-        size = len(data)
-
-        # First look for an image header
-        pos = image_header.LocateHeaderOffset(data)
-        if pos is None:
-            # Look for the FDT map
-            pos = fdtmap.LocateFdtmap(data)
-        if pos is None:
-            raise ValueError('Cannot find FDT map in image')
-
-        # We don't know the FDT size, so check its header first
-        probe_dtb = fdt.Fdt.FromData(
-            data[pos + fdtmap.FDTMAP_HDR_LEN:pos + 256])
-        dtb_size = probe_dtb.GetFdtObj().totalsize()
-        fdtmap_data = data[pos:pos + dtb_size + fdtmap.FDTMAP_HDR_LEN]
+        # Map the file rather than reading it, so that only the parts needed to
+        # find the FDT map are read. The image data is read when needed.
+        with open(fname, 'rb') as fd:
+            if os.fstat(fd.fileno()).st_size:
+                data = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                data = b''
+        try:
+            # First look for an image header at the start or end, then for the
+            # FDT map, then for an image header anywhere in the image
+            pos = image_header.LocateHeaderOffset(data, search=False)
+            if pos is None:
+                pos = fdtmap.LocateFdtmap(data)
+            if pos is None:
+                pos = image_header.LocateHeaderOffset(data)
+            if pos is None:
+                raise ValueError('Cannot find FDT map in image')
+
+            # We don't know the FDT size, so check its header first
+            probe_dtb = fdt.Fdt.FromData(
+                data[pos + fdtmap.FDTMAP_HDR_LEN:pos + 256])
+            dtb_size = probe_dtb.GetFdtObj().totalsize()
+            fdtmap_data = data[pos:pos + dtb_size + fdtmap.FDTMAP_HDR_LEN]
+        finally:
+            if isinstance(data, mmap.mmap):
+                data.close()
         fdt_data = fdtmap_data[fdtmap.FDTMAP_HDR_LEN:]
         out_fname = tools.get_output_filename('fdtmap.in.dtb')
         tools.write_file(out_fname, fdt_data)
@@ -147,7 +211,6 @@ class Image(section.Entry_section):
         image.image_node = fdt_util.GetString(root, 'image-node', 'image')
         image.fdtmap_dtb = dtb
         image.fdtmap_data = fdtmap_data
-        image._data = data
         image._filename = fname
         image.image_name, _ = os.path.splitext(fname)
         return image
@@ -194,17 +257,62 @@ class Image(section.Entry_section):
             os.symlink(fname, sname)
 
     def WriteAlternates(self):
-        """Write out alternative devicetree blobs, each in its own file"""
+        """Write out alternative devicetree blobs, each in its own file
+
+        Each alternate is produced by processing the alternates-fdt entry again
+        with a different devicetree. This changes the state of the entries in
+        that section, so when running in parallel each alternate is built in a
+        separate (forked) process.
+
+        A hash of the inputs for each alternate is stored in a '.alt-hashes'
+        file, so that alternates which have not changed are skipped. If that
+        file cannot be read, all alternates are built.
+        """
         alt_entry = self.FindEntryType('alternates-fdt')
         if not alt_entry:
             return
 
+        hash_fname = tools.get_output_filename(f'{self.image_name}.alt-hashes')
+        old_hashes = {}
+        if os.path.exists(hash_fname):
+            try:
+                old_hashes = json.loads(tools.read_file(hash_fname,
+                                                        binary=False))
+                if not isinstance(old_hashes, dict):
+                    raise ValueError('Expected a JSON object')
+            except ValueError as exc:
+                tout.warning(f"Ignoring invalid file '{hash_fname}': {exc}")
+                old_hashes = {}
+        hashes = {}
+        todo = []
         for alt in alt_entry.alternates:
-            fname, data = alt_entry.ProcessWithFdt(alt)
-            pathname = tools.get_output_filename(fname)
-            tout.info(f"Writing alternate '{alt}' to '{pathname}'")
-            tools.write_file(pathname, data)
-            tout.info("Wrote %#x bytes" % len(data))
+            hashes[alt] = alt_entry.GetAlternateHash(alt)
+            pattern = alt_entry._fname_pattern or 'NAME.bin'
+            pathname = tools.get_output_filename(pattern.replace('NAME', alt))
+            if hashes[alt] == old_hashes.get(alt) and os.path.exists(pathname):
+                tout.info(f"Alternate '{alt}' is unchanged")
+            else:
+                todo.append(alt)
+
+        threads = state.GetThreads()
+        if (threads == 0 or len(todo) < 2 or
+                'fork' not in multiprocessing.get_all_start_methods()):
+            for alt in todo:
+                _WriteAlternate(alt_entry, alt)
+        else:
+            with concurrent.futures.ProcessPoolExecutor(
+                    max_workers=threads,
+                    mp_context=multiprocessing.get_context('fork'),
+                    initializer=_InitAlternateWorker,
+                    initargs=(alt_entry,)) as executor:
+                jobs = [executor.submit(_WriteAlternateInWorker, alt)
+                        for alt in todo]
+
+                # Check the results in order, so any exceptions are raised
+                for job in jobs:
+                    job.result()
+        tout.notice(f'Wrote {len(todo)} of {len(hashes)} alternates')
+        tools.write_file(hash_fname, json.dumps(hashes), binary=False)
 
     def WriteMap(self):
         """Write a map of the image to a .map file
@@ -255,6 +363,8 @@ class Image(section.Entry_section):
         return entry
 
     def ReadData(self, decomp=True, alt_format=None):
+        if self._data is None:
+            self._data = tools.read_file(self._filename)
         tout.debug("Image '%s' ReadData(), size=%#x" %
                    (self.GetPath(), len(self._data)))
         return self._data
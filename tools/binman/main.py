@@ -9,9 +9,13 @@
 
 """See README for more information"""
 
+import glob
 import os
+import shutil
 import site
 import sys
+import tempfile
+import time
 import traceback
 
 # Get the absolute path to this file at run-time
@@ -46,7 +50,31 @@ from binman import cmdline
 from binman import control
 from u_boot_pylib import test_util
 
-def RunTests(debug, verbosity, processes, test_preserve_dirs, args, toolpath):
+def PrecompileTestFiles(processes):
+    """Compile all the test .dts files before running the tests
+
+    Most tests compile a .dts file, often one used by other tests too. This
+    compiles them all once, in parallel, so that the tests can use the output.
+
+    Args:
+        processes: Number of processes to use (None=same as #CPUs)
+
+    Returns:
+        str: Temporary directory holding the output, to be removed by the
+            caller
+    """
+    from dtoc import fdt_util
+
+    outdir = tempfile.mkdtemp(prefix='binman-dts.')
+    fnames = sorted(glob.glob(os.path.join(our_path, 'test', '*.dts')))
+    start = time.monotonic()
+    count = fdt_util.Precompile(fnames, outdir, processes)
+    print('Precompiled %d of %d test .dts files in %.1fs' %
+          (count, len(fnames), time.monotonic() - start))
+    return outdir
+
+def RunTests(debug, verbosity, processes, test_preserve_dirs, args, toolpath,
+             dtc_cache=None, timing_fname=None):
     """Run the functional tests and any embedded doctests
 
     Args:
@@ -61,6 +89,8 @@ def RunTests(debug, verbosity, processes, test_preserve_dirs, args, toolpath):
         args: List of positional args provided to binman. This can hold a test
             name to execute (as in 'binman test testSections', for example)
         toolpath: List of paths to use for tools
+        dtc_cache: Directory to use to cache compiled .dts files, or None
+        timing_fname: File used to record test durations, or None
     """
     from binman import bintool_test
     from binman import cbfs_util_test
@@ -70,18 +100,33 @@ def RunTests(debug, verbosity, processes, test_preserve_dirs, args, toolpath):
     from binman import fip_util_test
     from binman import ftest
     from binman import image_test
+    from dtoc import fdt_util
     import doctest
 
     test_name = args and args[0] or None
+    fdt_util.SetCompileCache(dtc_cache)
+    _, _, offset = fdt_util.GetCompileCacheStats()
+
+    # Only precompile when running many tests, since it takes a while
+    precompile_dir = None if test_name else PrecompileTestFiles(processes)
 
     # Run the entry tests first ,since these need to be the first to import the
     # 'entry' module.
-    result = test_util.run_test_suites(
-        'binman', debug, verbosity, test_preserve_dirs, processes, test_name,
-        toolpath,
-        [bintool_test.TestBintool, entry_test.TestEntry, ftest.TestFunctional,
-         fdt_test.TestFdt, elf_test.TestElf, image_test.TestImage,
-         cbfs_util_test.TestCbfs, fip_util_test.TestFip])
+    try:
+        result = test_util.run_test_suites(
+            'binman', debug, verbosity, test_preserve_dirs, processes,
+            test_name, toolpath,
+            [bintool_test.TestBintool, entry_test.TestEntry,
+             ftest.TestFunctional, fdt_test.TestFdt, elf_test.TestElf,
+             image_test.TestImage, cbfs_util_test.TestCbfs,
+             fip_util_test.TestFip], timing_fname)
+    finally:
+        if precompile_dir:
+            shutil.rmtree(precompile_dir)
+
+    if dtc_cache:
+        hits, misses, _ = fdt_util.GetCompileCacheStats(offset)
+        print('dtc cache: %d hits, %d misses' % (hits, misses))
 
     return (0 if result.wasSuccessful() else 1)
 
@@ -121,7 +166,8 @@ def RunBinman(args):
         else:
             ret_code = RunTests(args.debug, args.verbosity, args.processes,
                                 args.test_preserve_dirs, args.tests,
-                                args.toolpath)
+                                args.toolpath, args.dtc_cache,
+                                args.timing_file)
             if args.debug and not test_util.use_concurrent:
                 print('Tests can run in parallel: pip install concurrencytest')
 
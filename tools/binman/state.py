@@ -6,7 +6,9 @@
 #
 
 from collections import defaultdict
+import contextlib
 import hashlib
+import json
 import re
 import time
 import threading
@@ -72,11 +74,15 @@ class Timing:
         name: Operation name (only one of each name is stored)
         start: Start time of operation in seconds (None if not start)
         accum:: Amount of time spent on this operation so far, in seconds
+        count: Number of items processed by this operation so far
+        size: Number of bytes processed by this operation so far
     """
     def __init__(self, name):
         self.name = name
         self.start = None # cause an error if TimingStart() is not called
         self.accum = 0.0
+        self.count = 0
+        self.size = 0
 
 
 # Holds timing info for each name:
@@ -84,6 +90,40 @@ class Timing:
 #    value: Timing object
 timing_info = {}
 
+# Profiling information, or None if profiling is not enabled. See ProfileStart()
+#    key: tuple of str: Stack of operations, e.g. ('Pack', 'binman', 'u-boot')
+#    value: list:
+#        int: Number of times the operation was performed
+#        float: Total time taken in seconds
+#        str: Entry type, or None if this is not an entry operation
+profile_info = None
+
+# Holds the stack of profile operations in progress in each thread
+profile_local = threading.local()
+
+# Compression statistics, see RecordCompression()
+#    key: str: Compression algorithm, e.g. 'lz4'
+#    value: list:
+#        int: Number of times data was compressed
+#        int: Number of times an earlier result was reused
+#        int: Total size of the input data in bytes
+#        int: Total size of the compressed data in bytes
+#        float: Total time taken in seconds
+compress_stats = {}
+
+# Lock for updating compress_stats, since compression runs in threads
+compress_lock = threading.Lock()
+
+# Lock for updating profile_info
+profile_lock = threading.Lock()
+
+# Holds the results of signing operations, so that they are not repeated when
+# the same data is signed again in a later pack pass. This is cleared by
+# Prepare() and PrepareFromLoadedData(), so results are not used across runs:
+#    key: str hash of the operation, data, keys and parameters
+#    value: bytes result of the operation
+sign_cache = {}
+
 
 def GetFdtForEtype(etype):
     """Get the Fdt object for a particular device-tree entry
@@ -228,6 +268,7 @@ def Prepare(images, dtb):
     # was handled just above.
     main_dtb = dtb
     output_fdt_info.clear()
+    sign_cache.clear()
     fdt_path_prefix = ''
     output_fdt_info['u-boot-dtb'] = [dtb, 'u-boot.dtb']
     if use_fake_dtb:
@@ -266,6 +307,7 @@ def PrepareFromLoadedData(image):
 
     tout.info('Preparing device trees')
     output_fdt_info.clear()
+    sign_cache.clear()
     fdt_path_prefix = ''
     output_fdt_info['fdtmap'] = [image.fdtmap_dtb, 'u-boot.dtb']
     main_dtb = None
@@ -509,15 +551,241 @@ def TimingAccum(name):
     timing = GetTiming(name)
     timing.accum += time.monotonic() - timing.start
 
+def TimingCount(name, count, size):
+    """Record the number of items and bytes processed by an operation
+
+    Args:
+        name: Operation name to update
+        count (int): Number of items processed
+        size (int): Number of bytes processed
+    """
+    timing = GetTiming(name)
+    timing.count += count
+    timing.size += size
+
 def TimingShow():
     """Show all timing information"""
     duration = defaultdict(float)
+    count = defaultdict(int)
+    size = defaultdict(int)
     for threaded_name, timing in timing_info.items():
-        name = threaded_name.split(':')[0]
+        name = threaded_name.rsplit(':', 1)[0]
         duration[name] += timing.accum
+        count[name] += timing.count
+        size[name] += timing.size
 
     for name, seconds in duration.items():
-        print('%10s: %10.1fms' % (name, seconds * 1000))
+        if count[name]:
+            print('%10s: %10.1fms %6d items %8d bytes' %
+                  (name, seconds * 1000, count[name], size[name]))
+        else:
+            print('%10s: %10.1fms' % (name, seconds * 1000))
+
+def Sign(name, data, key_fnames, params, func):
+    """Sign some data, reusing the result if the inputs have not changed
+
+    Signing is slow and is repeated in each pack pass, normally with exactly the
+    same data. The result is cached using a hash of the data, the contents of
+    the key files and the other parameters.
+
+    The number of operations is recorded as timing information, under 'sign'
+    for those which are performed and 'sign-cached' for those which are not.
+
+    Args:
+        name (str): Name of the operation, e.g. 'pre-load'
+        data (bytes): Data to be signed
+        key_fnames (list of str): Files containing the keys used; any which
+            do not exist are ignored
+        params (tuple): Other parameters which affect the result, using only
+            values with a stable repr()
+        func (function): Function which performs the signing. It takes no
+            arguments and returns the result (bytes), or None if signing was
+            not possible, e.g. due to a missing tool
+
+    Returns:
+        bytes: Result of func(), or None if it failed
+    """
+    hsh = hashlib.sha256(name.encode())
+    hsh.update(repr(params).encode())
+    hsh.update(hashlib.sha256(data).digest())
+    for fname in key_fnames:
+        if os.path.exists(fname):
+            hsh.update(hashlib.sha256(tools.read_file(fname)).digest())
+    key = hsh.hexdigest()
+
+    result = sign_cache.get(key)
+    if result is not None:
+        TimingCount('sign-cached', 1, len(data))
+        return result
+    TimingStart('sign')
+    result = func()
+    TimingAccum('sign')
+    TimingCount('sign', 1, len(data))
+    if result is not None:
+        sign_cache[key] = result
+    return result
+
+def ResetCompressStats():
+    """Drop all compression statistics"""
+    with compress_lock:
+        compress_stats.clear()
+
+def RecordCompression(algo, in_size, out_size, secs, reused=False):
+    """Record the result of compressing some data
+
+    Args:
+        algo (str): Compression algorithm, e.g. 'lz4'
+        in_size (int): Size of the input data in bytes
+        out_size (int): Size of the compressed data in bytes
+        secs (float): Time taken in seconds
+        reused (bool): True if an earlier result was reused, rather than
+            compressing the data again
+    """
+    with compress_lock:
+        stats = compress_stats.setdefault(algo, [0, 0, 0, 0, 0.0])
+        if reused:
+            stats[1] += 1
+        else:
+            stats[0] += 1
+            stats[2] += in_size
+            stats[3] += out_size
+            stats[4] += secs
+
+def ShowCompressStats():
+    """Show the throughput of each compression algorithm
+
+    Since compression runs in threads, the time is the total across all
+    threads, so the throughput is that of a single thread.
+    """
+    for algo, (count, reused, in_size, out_size, secs) in sorted(
+            compress_stats.items()):
+        rate = in_size / secs / 1e6 if secs else 0
+        tout.notice(f"compress '{algo}': {count} calls ({reused} reused), "
+                    f'{in_size:#x} -> {out_size:#x} bytes in {secs:.3f}s '
+                    f'({rate:.1f} MB/s)')
+
+class _ProfileFrame:
+    """Records the time taken by an operation while profiling
+
+    Properties:
+        stack: Stack of operations, see profile_info
+        etype: Entry type, or None if this is not an entry operation
+        start: Start time of the operation in seconds
+    """
+    def __init__(self, name, entry):
+        if entry:
+            self.stack = (name,) + tuple(entry.GetPath().strip('/').split('/'))
+            self.etype = entry.etype
+        else:
+            frames = getattr(profile_local, 'frames', None)
+            parent = frames[-1].stack if frames else ()
+            self.stack = parent + (name,)
+            self.etype = None
+        self.start = None
+
+    def __enter__(self):
+        if not hasattr(profile_local, 'frames'):
+            profile_local.frames = []
+        profile_local.frames.append(self)
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        elapsed = time.monotonic() - self.start
+        profile_local.frames.pop()
+        with profile_lock:
+            info = profile_info.setdefault(self.stack, [0, 0.0, self.etype])
+            info[0] += 1
+            info[1] += elapsed
+
+def ProfileStart():
+    """Start recording profiling information, dropping any existing info"""
+    global profile_info
+
+    profile_info = {}
+
+def ProfileStop():
+    """Stop recording profiling information"""
+    global profile_info
+
+    profile_info = None
+
+def Profile(name, entry=None):
+    """Record the time taken by an operation, if profiling is enabled
+
+    This returns a context manager, so is used like this::
+
+        with state.Profile('Pack', entry):
+            entry.Pack(offset)
+
+    Args:
+        name (str): Name of the operation, e.g. 'ObtainContents'
+        entry (Entry): Entry being processed, or None for an operation within
+            the current one in this thread, such as running a bintool
+
+    Returns:
+        Context manager which records the time taken
+    """
+    if profile_info is None:
+        return contextlib.nullcontext()
+    return _ProfileFrame(name, entry)
+
+def _GetProfileSelfTimes():
+    """Work out the time spent in each operation, excluding those within it
+
+    Operations run in threads may overlap, so the result is never less than 0
+
+    Returns:
+        dict: key: stack (see profile_info), value: time in seconds
+    """
+    self_time = {stack: info[1] for stack, info in profile_info.items()}
+    for stack, info in profile_info.items():
+        parent = stack[:-1]
+        if parent in self_time:
+            self_time[parent] -= info[1]
+    return {stack: max(0, secs) for stack, secs in self_time.items()}
+
+def ProfileWrite(base_fname):
+    """Write out the profiling information
+
+    This writes two files:
+
+    <base_fname>.json: Time taken for each entry type, entry and bintool,
+        split by operation
+    <base_fname>.folded: Collapsed stacks, one per line, with the time in
+        microseconds, suitable for producing a flame graph
+
+    Args:
+        base_fname (str): Base filename to write to
+    """
+    self_time = _GetProfileSelfTimes()
+    etypes = defaultdict(dict)
+    entries = defaultdict(dict)
+    bintools = {}
+    for stack, (count, secs, etype) in sorted(profile_info.items()):
+        item = {'count': count, 'time': secs, 'self': self_time[stack]}
+        if etype:
+            name = stack[0]
+            entries['/' + '/'.join(stack[1:])][name] = item
+            entries['/' + '/'.join(stack[1:])]['etype'] = etype
+            total = etypes[etype].setdefault(
+                name, {'count': 0, 'time': 0.0, 'self': 0.0})
+            for key, value in item.items():
+                total[key] += value
+        else:
+            name = stack[-1].split(':', 1)[-1]
+            total = bintools.setdefault(name, {'count': 0, 'time': 0.0})
+            total['count'] += count
+            total['time'] += secs
+
+    with open(f'{base_fname}.json', 'w', encoding='utf-8') as fd:
+        json.dump({'etypes': etypes, 'entries': entries,
+                   'bintools': bintools}, fd, indent=2, sort_keys=True)
+    with open(f'{base_fname}.folded', 'w', encoding='utf-8') as fd:
+        for stack, secs in sorted(self_time.items()):
+            usecs = round(secs * 1e6)
+            if usecs:
+                print(f"{';'.join(stack)} {usecs}", file=fd)
 
 def GetVersion(path=OUR_PATH):
     """Get the version string for binman
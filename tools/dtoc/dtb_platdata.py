@@ -16,6 +16,7 @@ See doc/driver-model/of-plat.rst for more informaiton
 import collections
 import copy
 from enum import IntEnum
+import io
 import os
 import re
 import sys
@@ -156,7 +157,9 @@ class DtbPlatdata():
         _valid_nodes: A list of Node object with compatible strings, ordered by
             conv_name_to_c(node.name)
         _include_disabled: true to include nodes marked status = "disabled"
-        _outfile: The current output file (sys.stdout or a real file)
+        _outfile: The current output file (sys.stdout or a StringIO which is
+            written to _out_pathname when finished)
+        _out_pathname: Pathname of the current output file, or None if none
         _lines: Stashed list of output lines for outputting in the future
         _dirname: Directory to hold output files, or None for none (all files
             go to stdout)
@@ -179,6 +182,7 @@ class DtbPlatdata():
         self._valid_nodes_unsorted = None
         self._include_disabled = include_disabled
         self._outfile = None
+        self._out_pathname = None
         self._lines = []
         self._dirnames = [None] * len(Ftype)
         self._struct_data = collections.OrderedDict()
@@ -203,6 +207,7 @@ class DtbPlatdata():
                 os.makedirs(dirname, exist_ok=True)
                 self._dirnames[ftype] = dirname
 
+        self._dirnames = [None] * len(Ftype)
         if output_dirs:
             c_dirname = output_dirs[0]
             h_dirname = output_dirs[1] if len(output_dirs) > 1 else c_dirname
@@ -222,6 +227,11 @@ class DtbPlatdata():
         the new one. If they are the same file, nothing happens and output will
         continue to the same file.
 
+        Output is collected in memory and only written to the file when it is
+        closed, and then only if its contents have changed. This avoids
+        updating the timestamp of files which are unchanged, so that make does
+        not rebuild things which depend on them.
+
         Args:
             ftype (str): Type of file to create ('c' or 'h')
             fname (str): Filename to send output to. If there is a directory in
@@ -230,24 +240,33 @@ class DtbPlatdata():
         """
         dirname = self._dirnames[ftype]
         if dirname:
-            pathname = os.path.join(dirname, fname)
-            if self._outfile:
-                self._outfile.close()
-            self._outfile = open(pathname, 'w')
+            self.finish_output()
+            self._outfile = io.StringIO()
+            self._out_pathname = os.path.join(dirname, fname)
         elif fname:
             if not self._outfile:
-                self._outfile = open(fname, 'w')
+                self._outfile = io.StringIO()
+                self._out_pathname = fname
         else:
             self._outfile = sys.stdout
 
     def finish_output(self):
         """Finish outputing to a file
 
-        This closes the output file, if one is in use
+        This writes out the output file, if one is in use and its contents
+        have changed
         """
-        if self._outfile != sys.stdout:
-            self._outfile.close()
-            self._outfile = None
+        if self._outfile and self._outfile != sys.stdout:
+            data = self._outfile.getvalue()
+            old = None
+            if os.path.exists(self._out_pathname):
+                with open(self._out_pathname, encoding='utf-8') as inf:
+                    old = inf.read()
+            if data != old:
+                with open(self._out_pathname, 'w', encoding='utf-8') as outf:
+                    outf.write(data)
+        self._outfile = None
+        self._out_pathname = None
 
     def out(self, line):
         """Output a string to the output file
@@ -418,6 +437,16 @@ class DtbPlatdata():
             node.idx = idx
             node.struct_name, _ = self._scan.get_normalized_compat_name(node)
             node.var_name = conv_name_to_c(node.name)
+        self.reset_nodes()
+
+    def reset_nodes(self):
+        """Reset the properties which depend on the drivers in use
+
+        This allows the nodes to be processed again for a different phase of
+        U-Boot. See prepare_nodes() for the properties.
+        """
+        self._valid_uclasses = None
+        for node in self._valid_nodes:
             node.child_devs = []
             node.child_refs = {}
             node.seq = -1
@@ -1147,7 +1176,7 @@ OUTPUT_FILES_INST = {
 
 def run_steps(args, dtb_file, include_disabled, output, output_dirs, phase,
               instantiate, warning_disabled=False, drivers_additional=None,
-              basedir=None, scan=None):
+              basedir=None, scan=None, lazy=False, index_fname=None):
     """Run all the steps of the dtoc tool
 
     Args:
@@ -1170,6 +1199,10 @@ def run_steps(args, dtb_file, include_disabled, output, output_dirs, phase,
             grandparent of this file's directory
         scan (src_src.Scanner): Scanner from a previous run. This can help speed
             up tests. Use None for normal operation
+        lazy (bool): True to parse only the source files needed for the
+            drivers used by the devicetree, instead of every driver in the tree
+        index_fname (str): Filename to use to cache the index of driver source
+            files in lazy mode, or None to not cache it
 
     Returns:
         DtbPlatdata object
@@ -1177,28 +1210,85 @@ def run_steps(args, dtb_file, include_disabled, output, output_dirs, phase,
     Raises:
         ValueError: if args has no command, or an unknown command
     """
+    return _run_phases(args, dtb_file, include_disabled, output,
+                       [(phase, output_dirs)], instantiate, warning_disabled,
+                       drivers_additional, basedir, scan, lazy, index_fname)
+
+
+def run_phases(args, dtb_file, include_disabled, output_dirs, phases,
+               instantiate, warning_disabled=False, drivers_additional=None,
+               basedir=None, scan=None, lazy=False, index_fname=None):
+    """Run the dtoc tool for several phases of U-Boot at once
+
+    This produces the same output as calling run_steps() for each phase, but
+    the source tree and devicetree are only scanned once. The steps which
+    depend only on the devicetree (such as working out the structs) are shared
+    between phases, with the driver-dependent steps repeated for each one.
+
+    Args:
+        args (list): List of non-option arguments provided to the problem
+        dtb_file (str): Filename of dtb file to process
+        include_disabled (bool): True to include disabled nodes
+        output_dirs (tuple of str):
+            Directory to put C output files
+            Directory to put H output files
+            Any '{phase}' in these is replaced by the phase name
+        phases (list of str): The phases of U-Boot that we are generating
+            data for, e.g. ['spl', 'tpl']
+        instantiate: Instantiate devices so they don't need to be bound at
+            run-time
+        warning_disabled (bool): True to avoid showing warnings about missing
+            drivers
+        drivers_additional (list): List of additional drivers to use during
+            scanning
+        basedir (str): Base directory of U-Boot source code. Defaults to the
+            grandparent of this file's directory
+        scan (src_src.Scanner): Scanner from a previous run. This can help speed
+            up tests. Use None for normal operation
+        lazy (bool): True to parse only the source files needed for the
+            drivers used by the devicetree, instead of every driver in the tree
+        index_fname (str): Filename to use to cache the index of driver source
+            files in lazy mode, or None to not cache it
+
+    Returns:
+        DtbPlatdata object, as used for the last phase
+
+    Raises:
+        ValueError: if args has no command, or an unknown command, or there
+            are no output directories
+    """
+    if not output_dirs or not any(output_dirs):
+        raise ValueError('Must specify output_dirs with multiple phases')
+    if len(phases) > 1 and not any('{phase}' in dirname
+                                   for dirname in output_dirs if dirname):
+        raise ValueError("Output dirs must include '{phase}' with multiple "
+                         'phases')
+    phase_dirs = [(phase, [dirname.replace('{phase}', phase) if dirname
+                           else dirname for dirname in output_dirs])
+                  for phase in phases]
+    return _run_phases(args, dtb_file, include_disabled, None, phase_dirs,
+                       instantiate, warning_disabled, drivers_additional,
+                       basedir, scan, lazy, index_fname)
+
+
+def _run_phases(args, dtb_file, include_disabled, output, phase_dirs,
+                instantiate, warning_disabled, drivers_additional, basedir,
+                scan, lazy, index_fname):
+    """Run all the steps of the dtoc tool for one or more phases
+
+    See run_steps() and run_phases() for the arguments. The phase_dirs
+    argument is a list of tuples, each containing the phase and the output
+    directories to use for it.
+
+    Returns:
+        DtbPlatdata object, as used for the last phase
+    """
     if not args:
         raise ValueError('Please specify a command: struct, platdata, all')
-    if output and output_dirs and any(output_dirs):
-        raise ValueError('Must specify either output or output_dirs, not both')
-
-    if not scan:
-        scan = src_scan.Scanner(basedir, drivers_additional, phase)
-        scan.scan_drivers()
-        do_process = True
-    else:
-        do_process = False
-    plat = DtbPlatdata(scan, dtb_file, include_disabled, instantiate)
-    plat.scan_dtb()
-    plat.scan_tree(add_root=instantiate)
-    plat.prepare_nodes()
-    plat.scan_reg_sizes()
-    plat.setup_output_dirs(output_dirs)
-    plat.scan_structs()
-    plat.scan_phandles()
-    plat.process_nodes(instantiate)
-    plat.read_aliases()
-    plat.assign_seqs()
+    for _, output_dirs in phase_dirs:
+        if output and output_dirs and any(output_dirs):
+            raise ValueError(
+                'Must specify either output or output_dirs, not both')
 
     # Figure out what output files we plan to generate
     output_files = dict(OUTPUT_FILES_COMMON)
@@ -1211,16 +1301,49 @@ def run_steps(args, dtb_file, include_disabled, output, output_dirs, phase,
     if 'all' in cmds:
         cmds = sorted(output_files.keys())
     for cmd in cmds:
-        outfile = output_files.get(cmd)
-        if not outfile:
+        if cmd not in output_files:
             raise ValueError("Unknown command '%s': (use: %s)" %
                              (cmd, ', '.join(sorted(output_files.keys()))))
-        plat.setup_output(outfile.ftype,
-                          outfile.fname if output_dirs else output)
-        plat.out_header(outfile)
-        outfile.method(plat)
-    plat.finish_output()
-
-    if not warning_disabled:
-        scan.show_warnings()
+
+    phase = phase_dirs[0][0]
+    if not scan:
+        scan = src_scan.Scanner(basedir, drivers_additional, phase)
+        if not lazy:
+            scan.scan_drivers()
+    else:
+        lazy = False
+    plat = DtbPlatdata(scan, dtb_file, include_disabled, instantiate)
+    plat.scan_dtb()
+    plat.scan_tree(add_root=instantiate)
+    if lazy:
+        scan.scan_drivers_lazy(plat._valid_nodes_unsorted, index_fname)
+    plat.prepare_nodes()
+    plat.scan_reg_sizes()
+    plat.scan_structs()
+    plat.scan_phandles()
+
+    # Each phase has its own drivers, so check for warnings in each, but only
+    # show each warning once
+    shown = set()
+    for seq, (phase, output_dirs) in enumerate(phase_dirs):
+        if seq:
+            scan.set_phase(phase)
+            plat.reset_nodes()
+        plat.setup_output_dirs(output_dirs)
+        plat.process_nodes(instantiate)
+        plat.read_aliases()
+        plat.assign_seqs()
+
+        for cmd in cmds:
+            outfile = output_files[cmd]
+            plat.setup_output(outfile.ftype,
+                              outfile.fname if output_dirs else output)
+            plat.out_header(outfile)
+            outfile.method(plat)
+        plat.finish_output()
+
+        if not warning_disabled:
+            scan.show_warnings(shown)
+    if lazy:
+        scan.show_stats()
     return plat
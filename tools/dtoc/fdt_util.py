@@ -8,14 +8,40 @@
 # Utility functions for reading from a device tree. Once the upstream pylibfdt
 # implementation advances far enough, we should be able to drop these.
 
+import concurrent.futures
+import hashlib
 import os
 import struct
 import sys
 import tempfile
+import time
 
 from u_boot_pylib import command
 from u_boot_pylib import tools
 
+# Directory holding compiled .dtb files, keyed by a hash of their inputs. See
+# SetCompileCache()
+compile_cache_dir = None
+
+# Version strings of the compile tools, so we only need to obtain them once
+#    key: Tool command, e.g. 'dtc'
+#    value: Output of 'tool --version'
+tool_versions = {}
+
+# Name of the file in the cache directory which records each cache lookup
+CACHE_STATS_FNAME = 'stats'
+
+# Cache entries which have not been used for this many seconds are removed by
+# SetCompileCache()
+CACHE_MAX_AGE = 30 * 24 * 60 * 60
+
+# Precompiled .dtb files, see Precompile()
+#    key: Real path to .dts file
+#    value: Tuple:
+#        str: Filename of preprocessed .dts file
+#        str: Filename of .dtb file
+precompiled = {}
+
 def fdt32_to_cpu(val):
     """Convert a device tree cell to an integer
 
@@ -55,9 +81,155 @@ def fdt_cells_to_cpu(val, cells):
         out = out << 32 | fdt32_to_cpu(val[1])
     return out
 
+def SetCompileCache(dirname):
+    """Set the directory to use to cache compiled .dtb files
+
+    EnsureCompiled() uses this to avoid running dtc when it has already
+    compiled the same source. Each .dtb is stored under a hash of the
+    preprocessed source, the include path and the versions of cc and dtc, so
+    the cache can be shared between tests, runs and concurrent processes.
+
+    This should be called once at the start of a run, before starting any
+    test processes. It resets the statistics (see GetCompileCacheStats()) and
+    removes entries which have not been used for CACHE_MAX_AGE seconds, so
+    that the cache does not grow without limit.
+
+    Args:
+        dirname (str): Directory to use, or None to disable the cache
+    """
+    global compile_cache_dir
+
+    if dirname:
+        os.makedirs(dirname, exist_ok=True)
+        _PruneCompileCache(dirname, CACHE_MAX_AGE)
+        fname = os.path.join(dirname, CACHE_STATS_FNAME)
+        if os.path.exists(fname):
+            os.remove(fname)
+    compile_cache_dir = dirname
+
+def _PruneCompileCache(dirname, max_age):
+    """Remove old entries from the compile cache
+
+    Each entry has its modification time updated when it is used, so this
+    removes entries which have not been used recently. Temporary files left
+    behind by a process which was killed are removed too.
+
+    Args:
+        dirname (str): Cache directory
+        max_age (int): Maximum age of an entry in seconds
+    """
+    cutoff = time.time() - max_age
+    for entry in os.scandir(dirname):
+        if entry.name.endswith(('.dtb', '.tmp')):
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                # Another process removed it first
+                pass
+
+def GetCompileCacheStats(offset=0):
+    """Get the number of cache hits and misses in EnsureCompiled()
+
+    These are recorded in a file in the cache directory, so that lookups from
+    all processes using the cache are included.
+
+    Args:
+        offset (int): Position in the stats file to start counting from. Use
+            the value returned by a previous call to count only lookups made
+            since then
+
+    Returns:
+        tuple:
+            int: Number of cache hits
+            int: Number of cache misses
+            int: Offset to pass to the next call
+    """
+    if not compile_cache_dir:
+        return 0, 0, offset
+    fname = os.path.join(compile_cache_dir, CACHE_STATS_FNAME)
+    if not os.path.exists(fname):
+        return 0, 0, offset
+    data = tools.read_file(fname)[offset:]
+    return data.count(b'+'), data.count(b'-'), offset + len(data)
+
+def Precompile(fnames, outdir, processes=None):
+    """Compile a set of .dts files in parallel, for use by EnsureCompiled()
+
+    This is intended for test suites, which compile the same files many times.
+    Once this is done, EnsureCompiled() copies the precompiled output instead
+    of running the preprocessor and dtc. The source files must not change
+    while the precompiled output is in use.
+
+    Files which fail to compile are ignored, so that EnsureCompiled() reports
+    the error when it is called for that file.
+
+    Args:
+        fnames (list of str): .dts files to compile
+        outdir (str): Directory to hold the output. A subdirectory is created
+            for each file
+        processes (int): Number of files to compile at once (None for the
+            number of CPUs)
+
+    Returns:
+        int: Number of files compiled successfully
+    """
+    def _compile(seq, fname):
+        tmpdir = os.path.join(outdir, str(seq))
+        os.makedirs(tmpdir, exist_ok=True)
+        try:
+            dtb = EnsureCompiled(fname, tmpdir, capture_stderr=True)
+        except Exception:
+            return None
+        return os.path.realpath(fname), (os.path.join(tmpdir, 'source.dts'),
+                                         dtb)
+
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=processes or os.cpu_count()) as executor:
+        results = list(executor.map(_compile, range(len(fnames)), fnames))
+    done = dict(result for result in results if result)
+    precompiled.update(done)
+    return len(done)
+
+def _GetToolVersion(tool):
+    """Get the version string for a tool, caching the result
+
+    Args:
+        tool (str): Tool to run
+
+    Returns:
+        str: Version string (output of 'tool --version')
+    """
+    version = tool_versions.get(tool)
+    if version is None:
+        version = command.output(tool, '--version', raise_on_error=False)
+        tool_versions[tool] = version
+    return version
+
+def _RecordCacheLookup(hit):
+    """Record a cache lookup in the stats file
+
+    A single byte is appended for each lookup. Writes of this size to a file
+    opened for append are atomic, so concurrent processes can share the file.
+
+    Args:
+        hit (bool): True if the lookup was a hit
+    """
+    fname = os.path.join(compile_cache_dir, CACHE_STATS_FNAME)
+    fd = os.open(fname, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, b'+' if hit else b'-')
+    finally:
+        os.close(fd)
+
 def EnsureCompiled(fname, tmpdir=None, capture_stderr=False):
     """Compile an fdt .dts source file into a .dtb binary blob if needed.
 
+    If the file has been precompiled (see Precompile()), the output is copied
+    from there. Otherwise, if a compile cache is set up (see
+    SetCompileCache()), the preprocessed source is looked up in the cache and
+    dtc is only run if it is not found.
+
     Args:
         fname: Filename (if .dts it will be compiled). It not it will be
             left alone
@@ -78,6 +250,12 @@ def EnsureCompiled(fname, tmpdir=None, capture_stderr=False):
         dts_input = tools.get_output_filename('source.dts')
         dtb_output = tools.get_output_filename('source.dtb')
 
+    pre = precompiled.get(os.path.realpath(fname))
+    if pre:
+        for src, dest in zip(pre, (dts_input, dtb_output)):
+            tools.write_file(dest, tools.read_file(src))
+        return dtb_output
+
     search_paths = [os.path.join(os.getcwd(), 'include')]
     root, _ = os.path.splitext(fname)
     cc, args = tools.get_target_compile_tool('cc')
@@ -97,7 +275,36 @@ def EnsureCompiled(fname, tmpdir=None, capture_stderr=False):
             '-W', 'no-unit_address_vs_reg']
     args.extend(search_list)
     args.append(dts_input)
+
+    cache_fname = None
+    if compile_cache_dir:
+        hsh = hashlib.sha256(tools.read_file(dts_input))
+        for item in [cc, _GetToolVersion(cc), dtc, _GetToolVersion(dtc)]:
+            hsh.update(item.encode('utf-8') + b'\0')
+        for item in search_paths + args[:-1]:
+            if item != dtb_output:
+                hsh.update(item.encode('utf-8') + b'\0')
+        cache_fname = os.path.join(compile_cache_dir,
+                                   hsh.hexdigest() + '.dtb')
+        if os.path.exists(cache_fname):
+            _RecordCacheLookup(True)
+            tools.write_file(dtb_output, tools.read_file(cache_fname))
+
+            # Mark the entry as used, so it is not pruned
+            os.utime(cache_fname)
+            return dtb_output
+        _RecordCacheLookup(False)
+
     command.run(dtc, *args, capture_stderr=capture_stderr)
+
+    if cache_fname:
+        # Write to a temporary file and rename it, so that other processes
+        # never see a partial file
+        fd, tmp_fname = tempfile.mkstemp(dir=compile_cache_dir,
+                                         suffix='.tmp')
+        with os.fdopen(fd, 'wb') as fout:
+            fout.write(tools.read_file(dtb_output))
+        os.replace(tmp_fname, cache_fname)
     return dtb_output
 
 def GetInt(node, propname, default=None):
@@ -49,12 +49,15 @@ def run_tests(processes, args):
         args: List of positional args provided to dtoc. This can hold a test
             name to execute (as in 'dtoc -t test_empty_file', for example)
     """
+    from dtoc import fdt_util
     from dtoc import test_src_scan
     from dtoc import test_dtoc
 
     sys.argv = [sys.argv[0]]
     test_name = args.files and args.files[0] or None
 
+    fdt_util.SetCompileCache(args.dtc_cache)
+    _, _, offset = fdt_util.GetCompileCacheStats()
     test_dtoc.setup()
 
     result = test_util.run_test_suites(
@@ -62,6 +65,10 @@ def run_tests(processes, args):
         processes=processes, test_name=test_name, toolpath=[],
         class_and_module_list=[test_dtoc.TestDtoc,test_src_scan.TestSrcScan])
 
+    if args.dtc_cache:
+        hits, misses, _ = fdt_util.GetCompileCacheStats(offset)
+        print('dtc cache: %d hits, %d misses' % (hits, misses))
+
     return (0 if result.wasSuccessful() else 1)
 
 
@@ -86,16 +93,25 @@ def run_dtoc():
         help='Select output directory for H files (defaults to --c-output-di)')
     parser.add_argument('-d', '--dtb-file', action='store',
                       help='Specify the .dtb input file')
+    parser.add_argument('--dtc-cache', type=str,
+                      help='Directory to use to cache compiled test .dts files')
     parser.add_argument(
         '-i', '--instantiate', action='store_true', default=False,
         help='Instantiate devices to avoid needing device_bind()')
     parser.add_argument('--include-disabled', action='store_true',
                       help='Include disabled nodes')
+    parser.add_argument(
+        '--index-file', type=str,
+        help='File to use to cache the index of driver source files (with -l)')
+    parser.add_argument(
+        '-l', '--lazy', action='store_true', default=False,
+        help='Only parse source files for drivers used by the devicetree')
     parser.add_argument('-o', '--output', action='store',
                       help='Select output filename')
     parser.add_argument(
         '-p', '--phase', type=str,
-        help='set phase of U-Boot this invocation is for (spl/tpl)')
+        help='set phase of U-Boot this invocation is for (spl/tpl). Use a '
+        "comma-separated list for several phases, with '{phase}' in -c/-C")
     parser.add_argument('-P', '--processes', type=int,
                       help='set number of processes to use for running tests')
     if HAVE_TESTS:
@@ -115,11 +131,20 @@ def run_dtoc():
     elif HAVE_TESTS and args.test_coverage:
         RunTestCoverage(args.build_dir)
 
+    elif args.phase and ',' in args.phase:
+        dtb_platdata.run_phases(args.files, args.dtb_file,
+                                args.include_disabled,
+                                [args.c_output_dir, args.h_output_dir],
+                                args.phase.split(','),
+                                instantiate=args.instantiate, lazy=args.lazy,
+                                index_fname=args.index_file)
+
     else:
         dtb_platdata.run_steps(args.files, args.dtb_file, args.include_disabled,
                                args.output,
                                [args.c_output_dir, args.h_output_dir],
-                               args.phase, instantiate=args.instantiate)
+                               args.phase, instantiate=args.instantiate,
+                               lazy=args.lazy, index_fname=args.index_file)
 
 
 if __name__ == '__main__':
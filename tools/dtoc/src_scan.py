@@ -14,10 +14,25 @@ See doc/driver-model/of-plat.rst for more informaiton
 """
 
 import collections
+import json
 import os
 import re
 import sys
 
+# Version of the driver index stored by Scanner.build_index(). Increment this
+# when the format or the information collected changes.
+INDEX_VERSION = 1
+
+# Regular expressions used to build the driver index. These are deliberately
+# looser than the parsers below, since it does not matter if the index
+# includes a few extra files: they are simply parsed in full when needed.
+RE_INDEX_DRIVER = re.compile(r'^U_BOOT_DRIVER\((.*)\)', re.M)
+RE_INDEX_ALIAS = re.compile(
+    r'^DM_DRIVER_ALIAS\(\s*(\w+)\s*,\s*(\w+)\s*\)', re.M)
+RE_INDEX_UCLASS = re.compile(r'^UCLASS_DRIVER\(.*?^};', re.M | re.S)
+RE_INDEX_UCLASS_ID = re.compile(r'\.id\s*=\s*(UCLASS_[A-Z0-9_]+)')
+RE_INDEX_STRUCT = re.compile(r'^struct ([a-z0-9_]+) {$', re.M)
+
 
 def conv_name_to_c(name):
     """Convert a device-tree name to a C identifier
@@ -208,6 +223,24 @@ class Scanner:
             value: Struct object
         _phase: The phase of U-Boot that we are generating data for, e.g. 'spl'
              or 'tpl'. None if not known
+        _index: Dict of source files which define each item, built by
+                build_index():
+            key: Type of item ('drivers', 'aliases', 'uclasses' or 'structs')
+            value: Dict:
+                key: Name of item, e.g. driver name or 'UCLASS_I2C'
+                value: List of pathnames which define that item
+        _index_order: Dict giving the position of each file in the tree walk,
+            so that files are parsed in the same order as scan_drivers():
+            key: Pathname
+            value: Position (int)
+        _scanned: Set of pathnames which have been parsed so far
+        _driver_variants: Dict of all drivers found with each name, in the
+                order they were parsed. This allows the phase to be changed
+                after scanning (see set_phase()):
+            key: Driver name
+            value: List of Driver
+        _files_parsed: Number of files parsed by this scanner
+        _files_total: Number of source files found in the tree
     """
     def __init__(self, basedir, drivers_additional, phase=''):
         """Set up a new Scanner
@@ -227,6 +260,12 @@ class Scanner:
         self._uclass = {}
         self._structs = {}
         self._phase = phase
+        self._index = None
+        self._index_order = {}
+        self._scanned = set()
+        self._driver_variants = collections.defaultdict(list)
+        self._files_parsed = 0
+        self._files_total = 0
 
     def get_driver(self, name):
         """Get a driver given its name
@@ -577,6 +616,7 @@ class Scanner:
 
         # Make the updates based on what we found
         for driver in drivers.values():
+            self._driver_variants[driver.name].append(driver)
             if driver.name in self._drivers:
                 orig = self._drivers[driver.name]
                 if self._phase:
@@ -593,13 +633,62 @@ class Scanner:
             self._drivers[driver.name] = driver
         self._of_match.update(of_match)
 
-    def show_warnings(self):
-        """Show any warnings that have been collected"""
+    def set_phase(self, phase):
+        """Select the drivers to use for a different phase of U-Boot
+
+        This allows the same scan results to be used for several phases. It
+        chooses between drivers with the same name in the same way as
+        _parse_driver(), then clears the information recorded by previous use
+        of the drivers and uclasses, i.e. by mark_used(), add_uclass_alias()
+        and assign_seq() and by the caller adding devices to each uclass.
+
+        Args:
+            phase (str): The phase of U-Boot that we are generating data for,
+                e.g. 'spl' or 'tpl'. None if not known
+        """
+        self._phase = phase
+        for name, variants in self._driver_variants.items():
+            for driver in variants:
+                driver.used = False
+                driver.dups = []
+                driver.warn_dups = False
+            chosen = None
+            for driver in variants:
+                if chosen:
+                    if self._phase:
+                        if chosen.phase == self._phase:
+                            chosen.dups.append(driver)
+                            continue
+                    else:
+                        driver.warn_dups = True
+                    driver.dups.append(chosen)
+                chosen = driver
+            self._drivers[name] = chosen
+        for uclass in self._uclass.values():
+            uclass.alias_num_to_node = {}
+            uclass.alias_path_to_num = {}
+            uclass.devs = []
+            uclass.node_refs = {}
+
+    def show_warnings(self, shown=None):
+        """Show any warnings that have been collected
+
+        Args:
+            shown (set of tuple): Warnings which have already been shown, each
+                a tuple (driver name, warning). These are not shown again and
+                the set is updated with the warnings shown now. None to show
+                all warnings
+        """
         used_drivers = [drv.name for drv in self._drivers.values() if drv.used]
         missing = self._missing_drivers.copy()
         for name in sorted(self._warnings.keys()):
             if name in missing or name in used_drivers:
                 warns = sorted(list(self._warnings[name]))
+                if shown is not None:
+                    warns = [warn for warn in warns if (name, warn) not in shown]
+                    shown.update((name, warn) for warn in warns)
+                    if not warns:
+                        continue
                 print('%s: %s' % (name, warns[0]))
                 indent = ' ' * len(name)
                 for warn in warns[1:]:
@@ -621,6 +710,8 @@ class Scanner:
         Args
             fname: Driver filename to scan
         """
+        self._scanned.add(fname)
+        self._files_parsed += 1
         with open(fname, encoding='utf-8') as inf:
             try:
                 buff = inf.read()
@@ -646,6 +737,8 @@ class Scanner:
         Args
             fname: header filename to scan
         """
+        self._scanned.add(fname)
+        self._files_parsed += 1
         with open(fname, encoding='utf-8') as inf:
             try:
                 buff = inf.read()
@@ -659,10 +752,13 @@ class Scanner:
             if 'struct' in buff:
                 self._parse_structs(fname, buff)
 
-    def scan_drivers(self):
-        """Scan the driver folders to build a list of driver names and aliases
+    def _walk_sources(self):
+        """Walk the source tree looking for C and header files
 
-        This procedure will populate self._drivers and self._driver_aliases
+        Build directories and the .git directory are skipped.
+
+        Yields:
+            str: Pathname of each .c or .h file, in a stable order
         """
         for (dirpath, _, filenames) in os.walk(self._basedir):
             rel_path = dirpath[len(self._basedir):]
@@ -671,11 +767,11 @@ class Scanner:
             if rel_path.startswith('build') or rel_path.startswith('.git'):
                 continue
             for fname in filenames:
-                pathname = dirpath + '/' + fname
-                if fname.endswith('.c'):
-                    self.scan_driver(pathname)
-                elif fname.endswith('.h'):
-                    self.scan_header(pathname)
+                if fname.endswith('.c') or fname.endswith('.h'):
+                    yield dirpath + '/' + fname
+
+    def _scan_additional(self):
+        """Scan the additional drivers provided to the scanner"""
         for fname in self._drivers_additional:
             if not isinstance(fname, str) or len(fname) == 0:
                 continue
@@ -684,12 +780,188 @@ class Scanner:
             else:
                 self.scan_driver(self._basedir + '/' + fname)
 
-        # Get the uclass for each driver
-        # TODO: Can we just get the uclass for the ones we use, e.g. in
-        # mark_used()?
+    def _set_uclasses(self):
+        """Get the uclass for each driver"""
         for driver in self._drivers.values():
             driver.uclass = self._uclass.get(driver.uclass_id)
 
+    def scan_drivers(self):
+        """Scan the driver folders to build a list of driver names and aliases
+
+        This procedure will populate self._drivers and self._driver_aliases
+        """
+        for pathname in self._walk_sources():
+            self._files_total += 1
+            if pathname.endswith('.c'):
+                self.scan_driver(pathname)
+            else:
+                self.scan_header(pathname)
+        self._scan_additional()
+        self._set_uclasses()
+
+    @staticmethod
+    def _index_file(pathname):
+        """Find the items defined by a source file
+
+        Args:
+            pathname (str): Pathname of the .c or .h file to index
+
+        Returns:
+            dict: Items defined by the file:
+                key: Type of item ('drivers', 'aliases', 'uclasses' or
+                    'structs')
+                value: List of names of that type
+        """
+        info = {}
+        try:
+            with open(pathname, encoding='utf-8') as inf:
+                buff = inf.read()
+        except UnicodeDecodeError:
+            # scan_driver() / scan_header() report this if the file is needed
+            return info
+        if pathname.endswith('.h'):
+            if 'struct' in buff:
+                info['structs'] = RE_INDEX_STRUCT.findall(buff)
+            return info
+        if 'U_BOOT_DRIVER' in buff:
+            # scan_driver() only looks for aliases in files with drivers
+            info['drivers'] = RE_INDEX_DRIVER.findall(buff)
+            info['aliases'] = [m.group(2)
+                               for m in RE_INDEX_ALIAS.finditer(buff)]
+        if 'UCLASS_DRIVER' in buff:
+            info['uclasses'] = [
+                uc_id for block in RE_INDEX_UCLASS.findall(buff)
+                for uc_id in RE_INDEX_UCLASS_ID.findall(block)]
+        return {key: val for key, val in info.items() if val}
+
+    def build_index(self, index_fname=None):
+        """Build an index of which source files define each item
+
+        This reads every .c and .h file in the tree once, recording the
+        drivers, driver aliases, uclasses and structs that it defines, without
+        fully parsing it. If index_fname is provided, the index is stored there
+        and reused on the next run, so that only files whose size or
+        modification time has changed need to be read again.
+
+        It updates the following members:
+            _index - the index of items to pathnames
+            _index_order - position of each file in the tree walk
+            _files_total - number of files in the tree
+
+        Args:
+            index_fname (str): Filename to use to cache the index, or None to
+                not cache it
+        """
+        cached = {}
+        if index_fname and os.path.exists(index_fname):
+            try:
+                with open(index_fname, encoding='utf-8') as inf:
+                    data = json.load(inf)
+            except ValueError:
+                data = {}
+            if (data.get('version') == INDEX_VERSION and
+                    data.get('basedir') == self._basedir):
+                cached = data['files']
+
+        files = {}
+        self._index = collections.defaultdict(
+            lambda: collections.defaultdict(list))
+        for seq, pathname in enumerate(self._walk_sources()):
+            stat = os.stat(pathname)
+            entry = cached.get(pathname)
+            if (not entry or entry['mtime'] != stat.st_mtime_ns or
+                    entry['size'] != stat.st_size):
+                entry = {'mtime': stat.st_mtime_ns, 'size': stat.st_size,
+                         'items': self._index_file(pathname)}
+            files[pathname] = entry
+            self._index_order[pathname] = seq
+            for kind, names in entry['items'].items():
+                for name in names:
+                    self._index[kind][name].append(pathname)
+        self._files_total = len(files)
+
+        if index_fname and files != cached:
+            with open(index_fname, 'w', encoding='utf-8') as outf:
+                json.dump({'version': INDEX_VERSION, 'basedir': self._basedir,
+                           'files': files}, outf)
+
+    def _scan_indexed(self, kind, names):
+        """Parse all files which define any of the given items
+
+        Files are parsed in tree order and files which have already been parsed
+        are skipped.
+
+        Args:
+            kind (str): Type of item ('drivers', 'aliases', 'uclasses' or
+                'structs')
+            names (iterable of str): Names of the items to look up
+        """
+        fnames = set()
+        for name in names:
+            fnames.update(self._index[kind].get(name, []))
+        for pathname in sorted(fnames - self._scanned,
+                               key=lambda fname: self._index_order[fname]):
+            if pathname.endswith('.h'):
+                self.scan_header(pathname)
+            else:
+                self.scan_driver(pathname)
+
+    def scan_drivers_lazy(self, nodes, index_fname=None):
+        """Scan only the source files needed for a list of nodes
+
+        This is an alternative to scan_drivers() which avoids parsing every
+        driver in the tree. It uses an index (see build_index()) to find the
+        files defining the drivers that the nodes' compatible strings refer to,
+        either directly or via DM_DRIVER_ALIAS(), then the files defining
+        their uclasses and finally the headers defining the structs they use.
+
+        The additional drivers are always scanned in full.
+
+        Args:
+            nodes (list of fdt.Node): Nodes which will be output
+            index_fname (str): Filename to use to cache the index, or None to
+                not cache it
+        """
+        if self._index is None:
+            self.build_index(index_fname)
+
+        names = set()
+        for node in nodes:
+            if not node.parent:
+                names.add('root_driver')
+            elif 'compatible' in node.props:
+                names.update(get_compat_name(node))
+
+        # Aliases may be declared in a different file from their driver
+        self._scan_indexed('aliases', names)
+        self._scan_additional()
+        names.update([self._driver_aliases[name] for name in names
+                      if name in self._driver_aliases])
+        self._scan_indexed('drivers', names)
+
+        drivers = []
+        for driver in self._drivers.values():
+            drivers += [driver] + driver.dups
+        self._scan_indexed('uclasses',
+                           set(drv.uclass_id for drv in drivers))
+
+        structs = set()
+        for driver in drivers:
+            structs.update([driver.priv, driver.plat, driver.child_priv,
+                            driver.child_plat])
+        for uc_drv in self._uclass.values():
+            structs.update([uc_drv.priv, uc_drv.per_dev_priv,
+                            uc_drv.per_dev_plat, uc_drv.per_child_priv,
+                            uc_drv.per_child_plat])
+        self._scan_indexed('structs', set(struc.strip() for struc in structs
+                                          if struc))
+        self._set_uclasses()
+
+    def show_stats(self):
+        """Show how many source files were parsed"""
+        print('dtoc: parsed %d of %d source files' %
+              (self._files_parsed, self._files_total), file=sys.stderr)
+
     def mark_used(self, nodes):
         """Mark the drivers associated with a list of nodes as 'used'
 
@@ -12,10 +12,14 @@ tool.
 import collections
 import copy
 import glob
+import json
 import os
 import pathlib
+import re
+import shutil
 import struct
 import unittest
+from unittest import mock
 
 from dtoc import dtb_platdata
 from dtoc import fdt
@@ -1600,6 +1604,160 @@ U_BOOT_DRVINFO(spl_test2) = {
              'dt-uclass.c', 'dt-decl.h', 'dt-device.c'},
             leafs)
 
+    def test_output_phases(self):
+        """Test outputting files for several phases at once"""
+        tools._remove_output_dir()
+        tools.prepare_output_dir(None)
+        dtb_file = get_dtb_file('dtoc_test_simple.dts')
+        outdir = tools.get_output_dir()
+        dtb_platdata.run_phases(
+            ['all'], dtb_file, False, [os.path.join(outdir, '{phase}')],
+            ['spl', 'tpl'], False, warning_disabled=True, scan=copy_scan())
+        for phase in ['spl', 'tpl']:
+            leafs = set(os.listdir(os.path.join(outdir, phase)))
+            self.assertEqual({'dt-structs-gen.h', 'dt-plat.c', 'dt-decl.h'},
+                             leafs)
+
+        # Each phase should produce the same output as a separate run
+        spl_dir = os.path.join(outdir, 'spl')
+        fname = os.path.join(spl_dir, 'dt-plat.c')
+        data = tools.read_file(fname, binary=False)
+        os.utime(fname, (0, 0))
+        dtb_platdata.run_steps(
+            ['all'], dtb_file, False, None, [spl_dir], 'spl', False,
+            warning_disabled=True, scan=copy_scan())
+        self.assertEqual(data, tools.read_file(fname, binary=False))
+
+        # The file is unchanged so should not have been written
+        self.assertEqual(0, os.stat(fname).st_mtime)
+
+    def test_output_phases_bad(self):
+        """Test detection of invalid output dirs with several phases"""
+        with self.assertRaises(ValueError) as exc:
+            dtb_platdata.run_phases(['all'], None, False, [None], ['spl'],
+                                    False)
+        self.assertIn('Must specify output_dirs with multiple phases',
+                      str(exc.exception))
+
+        with self.assertRaises(ValueError) as exc:
+            dtb_platdata.run_phases(['all'], None, False, ['dir'],
+                                    ['spl', 'tpl'], False)
+        self.assertIn("Output dirs must include '{phase}' with multiple phases",
+                      str(exc.exception))
+
+    @staticmethod
+    def _read_dir(dirname):
+        """Read all the files in a directory
+
+        Args:
+            dirname (str): Directory to read
+
+        Returns:
+            dict: Contents of each file:
+                key: Leafname of file
+                value: Contents of file, as a string
+        """
+        return {fname: tools.read_file(os.path.join(dirname, fname),
+                                       binary=False)
+                for fname in os.listdir(dirname)}
+
+    def _run_lazy(self, dtb_file, outdir, instantiate, basedir=None):
+        """Run dtoc in lazy mode, with the index in the output directory
+
+        Args:
+            dtb_file (str): Filename of .dtb file
+            outdir (str): Output directory to use
+            instantiate (bool): Instantiate devices so they don't need to be
+                bound at run-time
+            basedir (str): Base directory of source tree, or None to use the
+                U-Boot tree
+
+        Returns:
+            tuple:
+                DtbPlatdata: object used
+                int: Number of source files parsed
+                int: Number of source files in the tree
+        """
+        with test_util.capture_sys_output() as (_, stderr):
+            plat = dtb_platdata.run_steps(
+                ['all'], dtb_file, False, None, [outdir], None, instantiate,
+                warning_disabled=True, basedir=basedir, lazy=True,
+                index_fname=tools.get_output_filename('index.json'))
+        match = re.match(r'dtoc: parsed (\d+) of (\d+) source files\n$',
+                         stderr.getvalue())
+        self.assertIsNotNone(match)
+        return plat, int(match.group(1)), int(match.group(2))
+
+    def test_lazy(self):
+        """Test that lazy mode produces the same output as a full scan"""
+        dtb_file = get_dtb_file('dtoc_test_simple.dts')
+        for instantiate in [False, True]:
+            full_dir = tools.get_output_filename(f'full{instantiate}')
+            lazy_dir = tools.get_output_filename(f'lazy{instantiate}')
+            dtb_platdata.run_steps(
+                ['all'], dtb_file, False, None, [full_dir], None,
+                instantiate, warning_disabled=True, scan=copy_scan())
+            plat, parsed, total = self._run_lazy(dtb_file, lazy_dir,
+                                                 instantiate)
+            self.assertEqual(self._read_dir(full_dir),
+                             self._read_dir(lazy_dir))
+            self.assertEqual(len(plat._scan._scanned), parsed)
+            self.assertLess(parsed, total)
+
+            # The root node needs root_driver, but only when instantiating
+            self.assertEqual(instantiate,
+                             'root_driver' in plat._scan._drivers)
+
+    def test_lazy_index(self):
+        """Test that lazy mode reuses its index and recovers if it is bad"""
+        dtb_file = get_dtb_file('dtoc_test_simple.dts')
+        index_fname = tools.get_output_filename('index.json')
+        lazy_dir = tools.get_output_filename('lazy')
+        if os.path.exists(index_fname):
+            os.remove(index_fname)
+        self._run_lazy(dtb_file, lazy_dir, False)
+        expected = self._read_dir(lazy_dir)
+        index = tools.read_file(index_fname, binary=False)
+
+        # No files have changed, so none should be read for the index
+        with mock.patch.object(src_scan.Scanner, '_index_file') as mocked:
+            self._run_lazy(dtb_file, lazy_dir, False)
+        self.assertEqual(0, len(mocked.mock_calls))
+        self.assertEqual(expected, self._read_dir(lazy_dir))
+
+        # A corrupt index should be ignored and then rewritten
+        tools.write_file(index_fname, '{"version": ', binary=False)
+        self._run_lazy(dtb_file, lazy_dir, False)
+        self.assertEqual(expected, self._read_dir(lazy_dir))
+        self.assertEqual(json.loads(index),
+                         json.loads(tools.read_file(index_fname,
+                                                    binary=False)))
+
+    def test_lazy_undecodable(self):
+        """Test lazy mode with a source file which is not valid UTF-8"""
+        dtb_file = get_dtb_file('dtoc_test_simple.dts')
+        lazy_dir = tools.get_output_filename('lazy')
+        plat, _, _ = self._run_lazy(dtb_file, lazy_dir, False)
+        expected = self._read_dir(lazy_dir)
+
+        # Set up a tree with just the files that were needed, plus a bad one
+        basedir = tools.get_output_filename('src')
+        shutil.rmtree(basedir, ignore_errors=True)
+        for pathname in plat._scan._scanned:
+            fname = os.path.join(basedir,
+                                 os.path.relpath(pathname, plat._scan._basedir))
+            os.makedirs(os.path.dirname(fname), exist_ok=True)
+            shutil.copy(pathname, fname)
+        fname = os.path.join(basedir, 'drivers', 'bad.c')
+        os.makedirs(os.path.dirname(fname), exist_ok=True)
+        tools.write_file(fname, b'U_BOOT_DRIVER(bad) = {\xff};\n')
+
+        # The bad file is not needed so should not be parsed, nor cause an error
+        _, parsed, total = self._run_lazy(dtb_file, lazy_dir, False, basedir)
+        self.assertEqual(expected, self._read_dir(lazy_dir))
+        self.assertEqual(len(plat._scan._scanned), parsed)
+        self.assertEqual(parsed + 1, total)
+
     def setup_process_test(self):
         """Set up a test of process_nodes()
 
@@ -13,6 +13,7 @@ import shutil
 import sys
 import tempfile
 import unittest
+from unittest import mock
 
 # Bring in the patman libraries
 our_path = os.path.dirname(os.path.realpath(__file__))
@@ -932,6 +933,96 @@ class TestFdtUtil(unittest.TestCase):
         finally:
             tools.outdir = old_outdir
 
+    def test_compile_cache_prune(self):
+        """Test that old cache entries and statistics are removed"""
+        cachedir = tempfile.mkdtemp(prefix='test_fdt.')
+        try:
+            old = os.path.join(cachedir, 'old.dtb')
+            new = os.path.join(cachedir, 'new.dtb')
+            tmp = os.path.join(cachedir, 'old.tmp')
+            for fname in [old, new, tmp]:
+                tools.write_file(fname, b'')
+            age = fdt_util.CACHE_MAX_AGE + 60
+            for fname in [old, tmp]:
+                mtime = os.path.getmtime(fname) - age
+                os.utime(fname, (mtime, mtime))
+            tools.write_file(os.path.join(cachedir, fdt_util.CACHE_STATS_FNAME),
+                             b'+-+')
+
+            fdt_util.SetCompileCache(cachedir)
+            self.assertEqual(['new.dtb'], os.listdir(cachedir))
+            self.assertEqual((0, 0, 0), fdt_util.GetCompileCacheStats())
+
+            # Another process may remove an entry first, which is ignored
+            tools.write_file(old, b'')
+            os.utime(old, (mtime, mtime))
+            real_remove = os.remove
+            def _remove(fname):
+                real_remove(fname)
+                if fname == old:
+                    raise FileNotFoundError(fname)
+            with mock.patch.object(fdt_util.os, 'remove', side_effect=_remove):
+                fdt_util.SetCompileCache(cachedir)
+            self.assertEqual(['new.dtb'], os.listdir(cachedir))
+        finally:
+            fdt_util.SetCompileCache(None)
+            shutil.rmtree(cachedir)
+
+    def test_ensure_compiled_cache(self):
+        """Test using a cache of compiled .dtb files"""
+        cachedir = tempfile.mkdtemp(prefix='test_fdt.')
+        try:
+            fdt_util.SetCompileCache(cachedir)
+            fname = find_dtb_file('dtoc_test_simple.dts')
+            dtb = fdt_util.EnsureCompiled(fname)
+            data = tools.read_file(dtb)
+            self.assertEqual((0, 1, 1), fdt_util.GetCompileCacheStats())
+
+            # This should be satisfied from the cache, without running dtc
+            os.remove(dtb)
+            with mock.patch.object(fdt_util.command, 'run',
+                    wraps=fdt_util.command.run) as mocked:
+                self.assertEqual(dtb, fdt_util.EnsureCompiled(fname))
+            self.assertEqual(1, len(mocked.mock_calls))
+            self.assertEqual(data, tools.read_file(dtb))
+            self.assertEqual((1, 0, 2), fdt_util.GetCompileCacheStats(1))
+
+            # A different file should be a miss
+            fdt_util.EnsureCompiled(find_dtb_file('dtoc_test_phandle.dts'))
+            self.assertEqual((1, 2, 3), fdt_util.GetCompileCacheStats())
+        finally:
+            fdt_util.SetCompileCache(None)
+            shutil.rmtree(cachedir)
+        self.assertEqual((0, 0, 0), fdt_util.GetCompileCacheStats())
+
+    def test_precompile(self):
+        """Test precompiling .dts files"""
+        outdir = tempfile.mkdtemp(prefix='test_fdt.')
+        try:
+            fname = find_dtb_file('dtoc_test_simple.dts')
+            bad_fname = os.path.join(outdir, 'bad.dts')
+            tools.write_file(bad_fname, b'invalid')
+            self.assertEqual(1, fdt_util.Precompile([fname, bad_fname],
+                                                    outdir))
+
+            # This should not need to run the preprocessor or dtc
+            with mock.patch.object(fdt_util.command, 'run') as mocked:
+                dtb = fdt_util.EnsureCompiled(fname)
+            self.assertEqual(0, len(mocked.mock_calls))
+            self.assertEqual(tools.read_file(
+                fdt_util.precompiled[os.path.realpath(fname)][1]),
+                             tools.read_file(dtb))
+            self.assertTrue(os.path.exists(
+                tools.get_output_filename('source.dts')))
+
+            # The bad file should be compiled as normal, reporting the error
+            with self.assertRaises(Exception) as exc:
+                fdt_util.EnsureCompiled(bad_fname, capture_stderr=True)
+            self.assertIn("Error running 'dtc", str(exc.exception))
+        finally:
+            fdt_util.precompiled.clear()
+            shutil.rmtree(outdir)
+
     def test_get_phandle_name_offset(self):
         val = fdt_util.GetPhandleNameOffset(self.node, 'missing')
         self.assertIsNone(val)
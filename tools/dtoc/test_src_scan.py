@@ -481,6 +481,39 @@ U_BOOT_DRIVER(%s) = {
             scan.mark_used([node])
         self.assertEqual('', stdout.getvalue().strip())
 
+    def test_dup_drivers_set_phase(self):
+        """Test changing the phase after scanning duplicate drivers"""
+        name = 'nvidia_tegra114_i2c'
+        scan, drv1, driver2, _ = self.setup_dup_drivers(name, 'spl')
+        scan._parse_driver('file2.c', driver2)
+        drv2 = drv1.dups[0]
+        uclass = src_scan.UclassDriver('i2c')
+        uclass.devs.append('dev')
+        uclass.alias_num_to_node[2] = 'dev'
+        scan._uclass['UCLASS_I2C'] = uclass
+        drv1.used = True
+
+        # The spl driver does not match, so the last one should be used
+        scan.set_phase('tpl')
+        self.assertEqual(drv2, scan._drivers[name])
+        self.assertEqual([drv1], drv2.dups)
+        self.assertEqual([], drv1.dups)
+        self.assertFalse(drv2.warn_dups)
+        self.assertFalse(drv1.used)
+        self.assertEqual([], uclass.devs)
+        self.assertEqual({}, uclass.alias_num_to_node)
+
+        # Going back to spl should give the same result as the original scan
+        scan.set_phase('spl')
+        self.assertIs(drv1, scan._drivers[name])
+        self.assertEqual([drv2], drv1.dups)
+        self.assertEqual([], drv2.dups)
+
+        # With no phase there is no way to distinguish the drivers
+        scan.set_phase('')
+        self.assertIs(drv2, scan._drivers[name])
+        self.assertTrue(drv2.warn_dups)
+
     def test_sequence(self):
         """Test assignment of sequence numnbers"""
         scan = src_scan.Scanner(None, None, '')
@@ -583,6 +616,16 @@ rockchip_rk3288_grf: WARNING: the driver rockchip_rk3288_grf was not found in th
             stdout.getvalue())
         self.assertIn('tegra_i2c_ids', stdout.getvalue())
 
+        # Warnings already shown (e.g. for an earlier phase) are skipped
+        shown = set()
+        with test_util.capture_sys_output() as (stdout, _):
+            scan.show_warnings(shown)
+        self.assertIn('rockchip_rk3288_grf', stdout.getvalue())
+        self.assertEqual(3, len(shown))
+        with test_util.capture_sys_output() as (stdout, _):
+            scan.show_warnings(shown)
+        self.assertEqual('', stdout.getvalue())
+
     def scan_uclass_warning(self):
         """Test a missing .uclass in the driver"""
         buff = '''
@@ -620,3 +663,89 @@ U_BOOT_DRIVER(i2c_tegra) = {
         self.assertEqual(
             {'i2c_tegra': {'Missing .compatible in file.c'}},
             scan._warnings)
+
+    def test_scan_lazy(self):
+        """Test scanning only the files needed for a list of nodes"""
+        files = {
+            'drivers/i2c/tegra_i2c.c': '''
+static const struct udevice_id tegra_i2c_ids[] = {
+	{ .compatible = "nvidia,tegra20-i2c" },
+	{ }
+};
+
+U_BOOT_DRIVER(nvidia_tegra20_i2c) = {
+	.name	= "nvidia_tegra20_i2c",
+	.id	= UCLASS_I2C,
+	.of_match = tegra_i2c_ids,
+	.priv_auto = sizeof(struct i2c_bus),
+};
+
+DM_DRIVER_ALIAS(nvidia_tegra20_i2c, nvidia_tegra114_i2c)
+''',
+            'drivers/i2c/i2c-uclass.c': '''
+UCLASS_DRIVER(i2c) = {
+	.id		= UCLASS_I2C,
+	.name		= "i2c",
+	.per_device_auto	= sizeof(struct dm_i2c_chip),
+};
+''',
+            'drivers/spi/spi.c': '''
+static const struct udevice_id spi_ids[] = {
+	{ .compatible = "vendor,spi" },
+	{ }
+};
+
+U_BOOT_DRIVER(vendor_spi) = {
+	.name	= "vendor_spi",
+	.id	= UCLASS_SPI,
+	.of_match = spi_ids,
+};
+''',
+            'drivers/spi/spi-uclass.c': '''
+UCLASS_DRIVER(spi) = {
+	.id		= UCLASS_SPI,
+	.name		= "spi",
+};
+''',
+            'include/i2c.h': 'struct i2c_bus {\n};\nstruct dm_i2c_chip {\n};\n',
+            'include/spi.h': 'struct spi_slave {\n};\n',
+        }
+        prop = FakeProp()
+        prop.name = 'compatible'
+        prop.value = 'nvidia,tegra114-i2c'
+        node = FakeNode()
+        node.props = {'compatible': prop}
+        node.parent = FakeNode()
+
+        try:
+            indir = tempfile.mkdtemp(prefix='dtoc.')
+            for fname, data in files.items():
+                pathname = os.path.join(indir, fname)
+                os.makedirs(os.path.dirname(pathname), exist_ok=True)
+                tools.write_file(pathname, data, binary=False)
+            index_fname = os.path.join(indir, 'index.json')
+
+            scan = src_scan.Scanner(indir, None)
+            scan.scan_drivers_lazy([node], index_fname)
+            self.assertEqual(['nvidia_tegra20_i2c'], list(scan._drivers))
+            self.assertEqual('nvidia_tegra20_i2c',
+                             scan._driver_aliases['nvidia_tegra114_i2c'])
+            self.assertEqual(['UCLASS_I2C'], list(scan._uclass))
+            self.assertEqual(scan._uclass['UCLASS_I2C'],
+                             scan._drivers['nvidia_tegra20_i2c'].uclass)
+            self.assertEqual(['i2c_bus', 'dm_i2c_chip'], list(scan._structs))
+            self.assertEqual(3, scan._files_parsed)
+            self.assertEqual(6, scan._files_total)
+            with test_util.capture_sys_output() as (_, stderr):
+                scan.show_stats()
+            self.assertEqual('dtoc: parsed 3 of 6 source files\n',
+                             stderr.getvalue())
+
+            # The index should be reused, without reading unchanged files
+            with mock.patch.object(src_scan.Scanner, '_index_file') as mocked:
+                scan = src_scan.Scanner(indir, None)
+                scan.scan_drivers_lazy([node], index_fname)
+            self.assertEqual(0, len(mocked.mock_calls))
+            self.assertIn('nvidia_tegra20_i2c', scan._drivers)
+        finally:
+            shutil.rmtree(indir)
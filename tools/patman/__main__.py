@@ -49,7 +49,7 @@ def run_patman():
         result = test_util.run_test_suites(
             'patman', False, False, False, None, None, None,
             [test_checkpatch.TestPatch, func_test.TestFunctional,
-             'gitutil', 'settings'])
+             'get_maintainer', 'gitutil', 'settings'])
 
         sys.exit(0 if result.wasSuccessful() else 1)
 
@@ -83,7 +83,9 @@ def run_patman():
         try:
             control.patchwork_status(args.branch, args.count, args.start, args.end,
                                      args.dest_branch, args.force,
-                                     args.show_comments, args.patchwork_url)
+                                     args.show_comments, args.patchwork_url,
+                                     None if args.no_cache else args.cache_dir,
+                                     args.verbose)
         except Exception as exc:
             terminal.tprint(f'patman: {type(exc).__name__}: {exc}',
                             colour=terminal.Color.RED)
@@ -4,9 +4,11 @@
 
 import collections
 import concurrent.futures
+import hashlib
 import os
 import re
 import sys
+import tempfile
 
 from patman import gitutil
 from u_boot_pylib import command
@@ -187,7 +189,36 @@ def check_patch_parse(checkpatch_output, verbose=False):
     return result
 
 
-def check_patch(fname, verbose=False, show_types=False, use_tree=False):
+def _get_cache_fname(cache_dir, args, fname):
+    """Get the name of the cache file for a checkpatch run
+
+    The key covers the contents of checkpatch.pl (and so its version), the
+    arguments and the patch itself. The first line of the patch is ignored if
+    it holds the commit hash from 'git format-patch', so that a rebase which
+    does not change the patch does not cause it to be checked again.
+
+    Args:
+        cache_dir (str): Directory holding the cache
+        args (list of str): checkpatch.pl filename followed by its arguments
+        fname (str): Patch filename
+
+    Returns:
+        str: Filename to use for the cached checkpatch output
+    """
+    hsh = hashlib.sha256()
+    with open(args[0], 'rb') as inf:
+        hsh.update(hashlib.sha256(inf.read()).digest())
+    hsh.update('\0'.join(args[1:]).encode('utf-8') + b'\0')
+    with open(fname, 'rb') as inf:
+        data = inf.read()
+    if data.startswith(b'From '):
+        data = data[data.find(b'\n') + 1:]
+    hsh.update(data)
+    return os.path.join(cache_dir, hsh.hexdigest())
+
+
+def check_patch(fname, verbose=False, show_types=False, use_tree=False,
+                cache_dir=None):
     """Run checkpatch.pl on a file and parse the results.
 
     Args:
@@ -196,6 +227,8 @@ def check_patch(fname, verbose=False, show_types=False, use_tree=False):
             parsed
         show_types: Tell checkpatch to show the type (number) of each message
         use_tree (bool): If False we'll pass '--no-tree' to checkpatch.
+        cache_dir (str): Directory to use to cache checkpatch output, or None
+            to always run checkpatch
 
     Returns:
         namedtuple containing:
@@ -210,6 +243,7 @@ def check_patch(fname, verbose=False, show_types=False, use_tree=False):
             checks: Number of checks
             lines: Number of lines
             stdout: Full output of checkpatch
+            cached: True if the output came from the cache
     """
     chk = find_check_patch()
     args = [chk]
@@ -217,9 +251,25 @@ def check_patch(fname, verbose=False, show_types=False, use_tree=False):
         args.append('--no-tree')
     if show_types:
         args.append('--show-types')
-    output = command.output(*args, fname, raise_on_error=False)
-
-    return check_patch_parse(output, verbose)
+    output = None
+    if cache_dir:
+        cache_fname = _get_cache_fname(cache_dir, args, fname)
+        if os.path.exists(cache_fname):
+            with open(cache_fname, encoding='utf-8') as inf:
+                output = inf.read()
+    cached = output is not None
+    if not cached:
+        output = command.output(*args, fname, raise_on_error=False)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            fd, tmpname = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as outf:
+                outf.write(output)
+            os.replace(tmpname, cache_fname)
+
+    result = check_patch_parse(output, verbose)
+    result.cached = cached
+    return result
 
 
 def get_warning_msg(col, msg_type, fname, line, msg):
@@ -240,19 +290,35 @@ def get_warning_msg(col, msg_type, fname, line, msg):
     line_str = '' if line is None else '%d' % line
     return '%s:%s: %s: %s\n' % (fname, line_str, msg_type, msg)
 
-def check_patches(verbose, args, use_tree):
-    '''Run the checkpatch.pl script on each patch'''
+def check_patches(verbose, args, use_tree, cache_dir=None):
+    """Run the checkpatch.pl script on each patch
+
+    Args:
+        verbose (bool): True to print out every line of the checkpatch output
+            as it is parsed
+        args (list of str): Patch filenames to check
+        use_tree (bool): If False we'll pass '--no-tree' to checkpatch.
+        cache_dir (str): Directory to use to cache checkpatch output, or None
+            to always run checkpatch
+
+    Returns:
+        bool: True if all patches are OK, False if any had problems
+    """
     error_count, warning_count, check_count = 0, 0, 0
     col = terminal.Color()
 
-    with concurrent.futures.ThreadPoolExecutor(max_workers=16) as executor:
+    cached = 0
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=os.cpu_count()) as executor:
         futures = []
         for fname in args:
-            f = executor.submit(check_patch, fname, verbose, use_tree=use_tree)
+            f = executor.submit(check_patch, fname, verbose, use_tree=use_tree,
+                                cache_dir=cache_dir)
             futures.append(f)
 
         for fname, f in zip(args, futures):
             result = f.result()
+            cached += result.cached
             if not result.ok:
                 error_count += result.errors
                 warning_count += result.warnings
@@ -270,6 +336,8 @@ def check_patches(verbose, args, use_tree):
                             item.get('file', '<unknown>'),
                             item.get('line', 0), item.get('msg', 'message')))
                 print
+    if verbose and cache_dir:
+        print('checkpatch: %d of %d patches from cache' % (cached, len(args)))
     if error_count or warning_count or check_count:
         str = 'checkpatch.pl found %d error(s), %d warning(s), %d checks(s)'
         color = col.GREEN
@@ -20,6 +20,10 @@ from patman import settings
 PATMAN_DIR = pathlib.Path(__file__).parent
 HAS_TESTS = os.path.exists(PATMAN_DIR / "func_test.py")
 
+# Default directory for cached results
+CACHE_DIR = os.path.join(
+    os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'patman')
+
 def parse_args():
     """Parse command line arguments from sys.argv[]
 
@@ -73,6 +77,11 @@ def parse_args():
         default=os.path.join(gitutil.get_top_level(), 'scripts',
                              'get_maintainer.pl') + ' --norolestats',
         help='File name of the get_maintainer.pl (or compatible) script.')
+    send.add_argument(
+        '--maintainers-index', action='store_true', default=False,
+        help='Find maintainers by reading the MAINTAINERS files once for the '
+             'series, instead of running get_maintainer.pl for each patch. '
+             'This does not look at the git history')
     send.add_argument('-n', '--dry-run', action='store_true', dest='dry_run',
            default=False, help="Do a dry run (create but don't email patches)")
     send.add_argument('-r', '--in-reply-to', type=str, action='store',
@@ -90,6 +99,15 @@ def parse_args():
     send.add_argument('--no-check', action='store_false', dest='check_patch',
                       default=True,
                       help="Don't check for patch compliance")
+    send.add_argument(
+        '--cache-dir', type=str, default=CACHE_DIR,
+        help='Directory to cache checkpatch results [default: %(default)s]')
+    send.add_argument('--no-cache', action='store_true',
+                      help='Do not cache checkpatch results')
+    send.add_argument(
+        '--check-changed', action='store_true',
+        help='Only check commits which have changed since checkpatch last '
+             'passed')
     send.add_argument(
         '--tree', dest='check_patch_use_tree', default=False,
         action='store_true',
@@ -106,6 +124,10 @@ def parse_args():
                       help="Specify the SMTP server to 'git send-email'")
     send.add_argument('--keep-change-id', action='store_true',
                       help='Preserve Change-Id tags in patches to send.')
+    send.add_argument(
+        '--single-pass', action='store_true',
+        help='Create the patches with a single git command, writing each '
+             'file once (faster for large series)')
 
     send.add_argument('patchfiles', nargs='*')
 
@@ -124,6 +146,11 @@ def parse_args():
         help='Name of branch to create with collected responses')
     status.add_argument('-f', '--force', action='store_true',
                         help='Force overwriting an existing branch')
+    status.add_argument(
+        '--cache-dir', type=str, default=CACHE_DIR,
+        help='Directory to cache patchwork responses [default: %(default)s]')
+    status.add_argument('--no-cache', action='store_true',
+                        help='Do not cache patchwork responses')
 
     # Parse options twice: first to get the project and second to handle
     # defaults properly (which depends on project)
@@ -15,6 +15,7 @@ from patman import checkpatch
 from patman import gitutil
 from patman import patchstream
 from u_boot_pylib import terminal
+from u_boot_pylib import tools
 
 
 def setup():
@@ -23,7 +24,7 @@ def setup():
 
 
 def prepare_patches(col, branch, count, start, end, ignore_binary, signoff,
-                    keep_change_id=False):
+                    keep_change_id=False, single_pass=False):
     """Figure out what patches to generate, then generate them
 
     The patch files are written to the current directory, e.g. 0001_xxx.patch
@@ -39,6 +40,9 @@ def prepare_patches(col, branch, count, start, end, ignore_binary, signoff,
             etc.)
         ignore_binary (bool): Don't generate patches for binary files
         keep_change_id (bool): Preserve the Change-Id tag.
+        single_pass (bool): Create all patches with a single git command and
+            write each file once, instead of having git write the files and
+            then fixing them up in place
 
     Returns:
         Tuple:
@@ -59,6 +63,13 @@ def prepare_patches(col, branch, count, start, end, ignore_binary, signoff,
     # Read the metadata from the commits
     to_do = count - end
     series = patchstream.get_metadata(branch, start, to_do)
+    if single_pass:
+        cover, patches = gitutil.format_patch_stream(
+            branch, start, to_do, ignore_binary, series, signoff)
+        cover_fname, patch_files = patchstream.write_patches(
+            series, cover, patches, keep_change_id)
+        return series, cover_fname, patch_files
+
     cover_fname, patch_files = gitutil.create_patches(
         branch, start, to_do, ignore_binary, series, signoff)
 
@@ -69,7 +80,8 @@ def prepare_patches(col, branch, count, start, end, ignore_binary, signoff,
     return series, cover_fname, patch_files
 
 
-def check_patches(series, patch_files, run_checkpatch, verbose, use_tree):
+def check_patches(series, patch_files, run_checkpatch, verbose, use_tree,
+                  cache_dir=None, changed_only=False):
     """Run some checks on a set of patches
 
     This santiy-checks the patman tags like Series-version and runs the patches
@@ -83,6 +95,10 @@ def check_patches(series, patch_files, run_checkpatch, verbose, use_tree):
         verbose (bool): True to print out every line of the checkpatch output as
             it is parsed
         use_tree (bool): If False we'll pass '--no-tree' to checkpatch.
+        cache_dir (str): Directory to use to cache checkpatch results, or None
+            for no cache
+        changed_only (bool): True to skip checking commits which were part of
+            a series that passed checkpatch before. This requires cache_dir
 
     Returns:
         bool: True if the patches had no errors, False if they did
@@ -92,7 +108,28 @@ def check_patches(series, patch_files, run_checkpatch, verbose, use_tree):
 
     # Check the patches
     if run_checkpatch:
-        ok = checkpatch.check_patches(verbose, patch_files, use_tree)
+        checkpatch_dir = None
+        to_check = patch_files
+        if cache_dir:
+            # Record the commits in each series which passed checkpatch
+            checkpatch_dir = os.path.join(cache_dir, 'checkpatch')
+            ok_fname = os.path.join(cache_dir, 'checkpatch-ok')
+            ok_hashes = set()
+            if os.path.exists(ok_fname):
+                ok_hashes = set(tools.read_file(ok_fname, binary=False).split())
+            if changed_only:
+                to_check = [fname for cmt, fname in zip(series.commits,
+                                                        patch_files)
+                            if cmt.hash not in ok_hashes]
+                print('Checking %d of %d patches changed since the last '
+                      'successful run' % (len(to_check), len(patch_files)))
+        ok = checkpatch.check_patches(verbose, to_check, use_tree,
+                                      checkpatch_dir)
+        if ok and cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            ok_hashes.update(cmt.hash for cmt in series.commits)
+            tools.write_file(ok_fname, '\n'.join(sorted(ok_hashes)) + '\n',
+                             binary=False)
     else:
         ok = True
     return ok
@@ -100,7 +137,8 @@ def check_patches(series, patch_files, run_checkpatch, verbose, use_tree):
 
 def email_patches(col, series, cover_fname, patch_files, process_tags, its_a_go,
                   ignore_bad_tags, add_maintainers, get_maintainer_script, limit,
-                  dry_run, in_reply_to, thread, smtp_server):
+                  dry_run, in_reply_to, thread, smtp_server,
+                  maintainers_index=False, verbose=False):
     """Email patches to the recipients
 
     This emails out the patches and cover letter using 'git send-email'. Each
@@ -139,9 +177,15 @@ def email_patches(col, series, cover_fname, patch_files, process_tags, its_a_go,
         thread (bool): True to add --thread to git send-email (make all patches
             reply to cover-letter or first patch in series)
         smtp_server (str): SMTP server to use to send patches (None for default)
+        maintainers_index (bool): True to find maintainers from an index of the
+            MAINTAINERS files instead of running get_maintainer_script for each
+            patch
+        verbose (bool): True to show how long it took to work out the Cc list
+            for each patch
     """
     cc_file = series.MakeCcFile(process_tags, cover_fname, not ignore_bad_tags,
-                                add_maintainers, limit, get_maintainer_script)
+                                add_maintainers, limit, get_maintainer_script,
+                                maintainers_index, verbose)
 
     # Email the patches out (giving the user time to check / cancel)
     cmd = ''
@@ -172,9 +216,11 @@ def send(args):
     series, cover_fname, patch_files = prepare_patches(
         col, args.branch, args.count, args.start, args.end,
         args.ignore_binary, args.add_signoff,
-        keep_change_id=args.keep_change_id)
+        keep_change_id=args.keep_change_id, single_pass=args.single_pass)
     ok = check_patches(series, patch_files, args.check_patch,
-                       args.verbose, args.check_patch_use_tree)
+                       args.verbose, args.check_patch_use_tree,
+                       None if args.no_cache else args.cache_dir,
+                       args.check_changed)
 
     ok = ok and gitutil.check_suppress_cc_config()
 
@@ -183,10 +229,11 @@ def send(args):
         col, series, cover_fname, patch_files, args.process_tags,
         its_a_go, args.ignore_bad_tags, args.add_maintainers,
         args.get_maintainer_script, args.limit, args.dry_run,
-        args.in_reply_to, args.thread, args.smtp_server)
+        args.in_reply_to, args.thread, args.smtp_server,
+        args.maintainers_index, args.verbose)
 
 def patchwork_status(branch, count, start, end, dest_branch, force,
-                     show_comments, url):
+                     show_comments, url, cache_dir=None, verbose=False):
     """Check the status of patches in patchwork
 
     This finds the series in patchwork using the Series-link tag, checks for new
@@ -207,6 +254,9 @@ def patchwork_status(branch, count, start, end, dest_branch, force,
             provided by reviewers
         url (str): URL of patchwork server, e.g. 'https://patchwork.ozlabs.org'.
             This is ignored if the series provides a Series-patchwork-url tag.
+        cache_dir (str): Directory to use to cache patchwork responses, or None
+            for no cache
+        verbose (bool): True to show statistics about the patchwork requests
 
     Raises:
         ValueError: if the branch has no Series-link value
@@ -243,4 +293,5 @@ def patchwork_status(branch, count, start, end, dest_branch, force,
     # are not present
     from patman import status
     status.check_patchwork_status(series, found[0], branch, dest_branch, force,
-                                  show_comments, url)
+                                  show_comments, url, cache_dir=cache_dir,
+                                  verbose=verbose)
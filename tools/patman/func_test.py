@@ -7,17 +7,25 @@
 """Functional tests for checking that patman behaves correctly"""
 
 import contextlib
+import hashlib
+import http.server
+import json
 import os
 import pathlib
 import re
 import shutil
 import sys
 import tempfile
+import threading
+import time
 import unittest
+from unittest import mock
 
 
+from patman import checkpatch
 from patman.commit import Commit
 from patman import control
+from patman import get_maintainer
 from patman import gitutil
 from patman import patchstream
 from patman.patchstream import PatchStream
@@ -45,6 +53,121 @@ def directory_excursion(directory):
         os.chdir(current)
 
 
+class FakePatchworkServer:
+    """Fake Patchwork server which serves the REST API over HTTP
+
+    This serves the series, patches and comments from a list of Patch objects.
+    Each response has an ETag, and requests with a matching If-None-Match header
+    get a '304 Not Modified' response.
+
+    It can also be used to benchmark 'patman status' offline, using the delay
+    property to simulate the round-trip time to a real server.
+
+    Properties:
+        url (str): URL of the server
+        patches (list of Patch): Patches to serve, with patch IDs starting at 1
+        delay (float): Time to wait before sending each response, in seconds
+        requests (list of str): Subpath of each request received
+        not_modified (int): Number of '304 Not Modified' responses sent
+        max_active (int): Maximum number of requests being handled at once
+    """
+    def __init__(self, patches, delay=0):
+        self.patches = patches
+        self.delay = delay
+        self.requests = []
+        self.not_modified = 0
+        self.max_active = 0
+        self._active = 0
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            """Handles a single request to the fake server"""
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                """Handle a GET request"""
+                server.handle(self)
+
+            def log_message(self, *args):
+                """Drop all log messages"""
+
+        self._httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0),
+                                                      Handler)
+        self._httpd.daemon_threads = True
+        self.url = 'http://127.0.0.1:%d' % self._httpd.server_address[1]
+        self._thread = threading.Thread(target=self._httpd.serve_forever)
+        self._thread.daemon = True
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def lookup(self, subpath):
+        """Look up the data for a REST API subpath
+
+        Args:
+            subpath (str): URL subpath, e.g. 'patches/1/comments/'
+
+        Returns:
+            dict or list: Data for that subpath, or None if not found
+        """
+        re_series = re.match(r'series/(\d*)/$', subpath)
+        re_patch = re.match(r'patches/(\d*)/$', subpath)
+        re_comments = re.match(r'patches/(\d*)/comments/$', subpath)
+        if re_series:
+            return {'patches': self.patches}
+        if re_patch:
+            return self.patches[int(re_patch.group(1)) - 1]
+        if re_comments:
+            return self.patches[int(re_comments.group(1)) - 1].comments
+        return None
+
+    def handle(self, req):
+        """Handle a request
+
+        Args:
+            req (http.server.BaseHTTPRequestHandler): Request to handle
+        """
+        with self._lock:
+            self._active += 1
+            self.max_active = max(self.max_active, self._active)
+        try:
+            time.sleep(self.delay)
+            subpath = req.path.split('/api/1.2/', 1)[-1]
+            with self._lock:
+                self.requests.append(subpath)
+            data = self.lookup(subpath)
+            if data is None:
+                req.send_response(404)
+                req.send_header('Content-Length', '0')
+                req.end_headers()
+                return
+            body = json.dumps(data).encode('utf-8')
+            etag = '"%s"' % hashlib.sha256(body).hexdigest()
+            if req.headers.get('If-None-Match') == etag:
+                with self._lock:
+                    self.not_modified += 1
+                req.send_response(304)
+                req.send_header('ETag', etag)
+                req.send_header('Content-Length', '0')
+                req.end_headers()
+                return
+            req.send_response(200)
+            req.send_header('Content-Type', 'application/json')
+            req.send_header('ETag', etag)
+            req.send_header('Content-Length', str(len(body)))
+            req.end_headers()
+            req.wfile.write(body)
+        finally:
+            with self._lock:
+                self._active -= 1
+
+
 class TestFunctional(unittest.TestCase):
     """Functional tests for checking that patman behaves correctly"""
     leb = (b'Lord Edmund Blackadd\xc3\xabr <weasel@blackadder.org>'.
@@ -527,6 +650,73 @@ complicated as possible''')
         finally:
             os.chdir(orig_dir)
 
+    def _prepare_both_ways(self, branch, count):
+        """Create patches with and without single_pass and compare them
+
+        Args:
+            branch (str): Branch to create patches from
+            count (int): Number of patches to produce (-1 for all)
+        """
+        # Signed-off-by needs an identity, which may not be set globally
+        self.repo.config['user.name'] = 'Test user'
+        self.repo.config['user.email'] = 'test@email.com'
+        col = terminal.Color()
+        results = []
+        for single_pass in (False, True):
+            outdir = os.path.join(self.gitdir, 'out%d' % single_pass)
+            os.mkdir(outdir)
+            with directory_excursion(outdir):
+                with capture_sys_output() as (stdout, _):
+                    _, cover_fname, patch_files = control.prepare_patches(
+                        col, branch=branch, count=count, start=0, end=0,
+                        ignore_binary=False, signoff=True,
+                        single_pass=single_pass)
+                contents = {fname: tools.read_file(fname)
+                            for fname in sorted(os.listdir('.'))}
+            results.append((cover_fname, patch_files, stdout.getvalue(),
+                            contents))
+            shutil.rmtree(outdir)
+        self.assertEqual(results[0], results[1])
+
+    def test_single_pass(self):
+        """Test creating patches with a single git command"""
+        repo = self.make_git_tree()
+        control.setup()
+        self.make_commit_with_file(
+            'video: Support UTF-8 characters such as \u00f6 and \u00fc in the '
+            'console', '', 'video.c', '\u00fcml\u00e4ut')
+        repo.branches.local.create('third', repo.revparse_single('HEAD'))
+        self._prepare_both_ways('first', 2)
+        self._prepare_both_ways('second', 3)
+        self._prepare_both_ways('third', 4)
+
+        # Check the cover-letter and patch filenames
+        with directory_excursion(self.gitdir):
+            with capture_sys_output():
+                _, cover_fname, patch_files = control.prepare_patches(
+                    terminal.Color(), branch='third', count=4, start=0, end=0,
+                    ignore_binary=False, signoff=True, single_pass=True)
+        self.assertEqual('0000-cover-letter.patch', cover_fname)
+        self.assertEqual(
+            ['0002-serial-Add-a-serial-driver.patch',
+             '0003-bootm-Make-it-boot.patch',
+             '0004-video-Support-UTF-8-characters-such-as-and-in-the-co.patch'],
+            patch_files[1:])
+
+    def test_single_pass_large(self):
+        """Test creating patches for a large series with a single command"""
+        repo = self.make_git_tree()
+        control.setup()
+        for seq in range(150):
+            self.make_commit_with_file(
+                'drv%d: Add support for a fairly long list of new features in '
+                'driver number %d' % (seq, seq),
+                '\nThis is patch %d\n%s' % (
+                    seq, '\nSeries-version: 2\n' if seq == 75 else ''),
+                'drv%d.c' % seq, 'int drv%d;\n' % seq)
+        repo.branches.local.create('large', repo.revparse_single('HEAD'))
+        self._prepare_both_ways('large', 153)
+
     def test_custom_get_maintainer_script(self):
         """Validate that a custom get_maintainer script gets used."""
         self.make_git_tree()
@@ -559,6 +749,111 @@ complicated as possible''')
                 # output.
                 self.assertIn('hello@there.com', output)
 
+    def test_maintainers_index(self):
+        """Test finding maintainers using the MAINTAINERS index"""
+        srcdir = os.path.join(self.tmpdir, 'src')
+        os.makedirs(os.path.join(srcdir, 'board', 'acme'))
+        os.makedirs(os.path.join(srcdir, 'drivers', 'spi'))
+        tools.write_file(os.path.join(srcdir, 'MAINTAINERS'), f"""\
+Descriptions of section entries:
+
+	M: Mail patches to: FullName <address@domain>
+
+SPI
+M:	{self.fred}
+S:	Maintained
+L:	spi@lists.example.com
+F:	drivers/spi
+X:	drivers/spi/old_spi.c
+K:	spi_xfer
+
+FDT
+M:	{self.mary}
+S:	Maintained
+N:	fdt
+
+THE REST
+M:	{self.leb}
+L:	u-boot@lists.denx.de
+S:	Maintained
+F:	*
+F:	*/
+""", binary=False)
+        tools.write_file(os.path.join(srcdir, 'board', 'acme', 'MAINTAINERS'),
+                         f"""\
+ACME BOARD
+M:	Joe Bloggs <joe@old.address>
+S:	Maintained
+F:	board/acme/
+""", binary=False)
+        tools.write_file(os.path.join(srcdir, '.mailmap'),
+                         f'{self.joe} <joe@old.address>\n', binary=False)
+        index = get_maintainer.MaintainersIndex(srcdir)
+
+        def check(expected, *fnames, body='+int x;'):
+            fname = os.path.join(self.tmpdir, 'test.patch')
+            with open(fname, 'w', encoding='utf-8') as outf:
+                print('Subject: [PATCH] Test\n\n---', file=outf)
+                for name in fnames:
+                    print(f'diff --git a/{name} b/{name}\n--- a/{name}\n'
+                          f'+++ b/{name}\n@@ -1,1 +1,1 @@\n{body}',
+                          file=outf)
+            self.assertEqual(sorted(expected),
+                             sorted(index.get_maintainers(fname)))
+
+        rest = [self.leb, 'u-boot@lists.denx.de']
+        spi = [self.fred, 'spi@lists.example.com']
+        check(spi + rest, 'drivers/spi/spi-uclass.c')
+        check(rest, 'drivers/spi/old_spi.c')
+        check(rest, 'drivers/spi_fake.c')
+        check(spi + rest, 'lib/spi.c', body='+\tspi_xfer(slave);')
+        check([self.mary] + rest, 'lib/fdtdec.c')
+        check([self.joe] + rest, 'board/acme/board.c')
+        check([self.fred, self.joe, 'spi@lists.example.com'] + rest,
+              'board/acme/board.c', 'drivers/spi/spi-uclass.c')
+
+        # Patches with a Fixes: tag need the git history, so need the script
+        fname = os.path.join(self.tmpdir, 'fixes.patch')
+        tools.write_file(fname, 'Subject: [PATCH] Fix\n\nFixes: 0123456789ab\n'
+                         '---\n--- a/lib/fdtdec.c\n+++ b/lib/fdtdec.c\n',
+                         binary=False)
+        self.assertIsNone(index.get_maintainers(fname))
+
+    def test_check_changed(self):
+        """Test checking only the commits changed since the last good run"""
+        series = Series()
+        series.commits = [Commit('abcd'), Commit('ef12')]
+        patch_files = ['0001-a.patch', '0002-b.patch']
+        cache_dir = os.path.join(self.tmpdir, 'cache')
+        with mock.patch.object(checkpatch, 'check_patches',
+                               return_value=True) as check:
+            with capture_sys_output() as (stdout, _):
+                self.assertTrue(control.check_patches(
+                    series, patch_files, True, False, False, cache_dir, True))
+            check.assert_called_with(False, patch_files, False,
+                                     os.path.join(cache_dir, 'checkpatch'))
+
+            # Change the second commit and check again
+            series.commits[1] = Commit('3456')
+            with capture_sys_output() as (stdout, _):
+                self.assertTrue(control.check_patches(
+                    series, patch_files, True, False, False, cache_dir, True))
+            check.assert_called_with(False, ['0002-b.patch'], False,
+                                     os.path.join(cache_dir, 'checkpatch'))
+            self.assertIn('Checking 1 of 2 patches changed', stdout.getvalue())
+
+            # A failure should not be recorded
+            check.return_value = False
+            series.commits[1] = Commit('7890')
+            with capture_sys_output():
+                self.assertFalse(control.check_patches(
+                    series, patch_files, True, False, False, cache_dir, True))
+            with capture_sys_output():
+                control.check_patches(series, patch_files, True, False, False,
+                                      cache_dir, True)
+            check.assert_called_with(False, ['0002-b.patch'], False,
+                                     os.path.join(cache_dir, 'checkpatch'))
+
     def test_tags(self):
         """Test collection of tags in a patchstream"""
         text = '''This is a patch
@@ -1125,6 +1420,78 @@ diff --git a/lib/efi_loader/efi_memory.c b/lib/efi_loader/efi_memory.c
         self.assertEqual('Reviewed-by: %s' % self.mary, next(lines))
         self.assertEqual('Tested-by: %s' % self.leb, next(lines))
 
+    def _make_status_patches(self, count):
+        """Set up commits and patches for use by the fake patchwork server
+
+        Each patch has a review tag which is not present in its commit
+
+        Args:
+            count (int): Number of commits / patches to create
+
+        Returns:
+            tuple:
+                Series: Series containing the commits
+                list of Patch: Corresponding patches
+        """
+        series = Series()
+        patches = []
+        for seq in range(count):
+            cmt = Commit('%04x' % seq)
+            cmt.subject = 'Subject %d' % (seq + 1)
+            series.commits.append(cmt)
+            patch = status.Patch(str(seq + 1))
+            patch.parse_subject('[%d/%d] %s' % (seq + 1, count, cmt.subject))
+            patch.name = patch.raw_subject
+            patch.content = 'Patch content %d' % (seq + 1)
+            patch.comments = [{'content': 'Reviewed-by: %s\n' % self.joe}]
+            patches.append(patch)
+        return series, patches
+
+    def test_status_rest_cache(self):
+        """Test collecting status from patchwork over HTTP with a cache"""
+        series, patches = self._make_status_patches(4)
+        cache_dir = os.path.join(self.tmpdir, 'cache')
+        with FakePatchworkServer(patches, delay=.05) as server:
+            terminal.set_print_test_mode()
+            rest_api = status.RestApi(cache_dir)
+            status.check_patchwork_status(series, '1234', None, None, False,
+                                          False, server.url, rest_api)
+            lines = terminal.get_print_test_lines()
+            self.assertEqual(
+                '4 new responses available in patchwork (use -d to write them '
+                'to a new branch)', lines[-1].text)
+            self.assertEqual(9, len(server.requests))
+            self.assertEqual(0, server.not_modified)
+            self.assertEqual(0, rest_api.cached)
+            self.assertGreater(server.max_active, 1)
+
+            # Everything should now come from the cache, with the same result
+            terminal.get_print_test_lines()
+            rest_api = status.RestApi(cache_dir)
+            status.check_patchwork_status(series, '1234', None, None, False,
+                                          False, server.url, rest_api)
+            self.assertEqual(lines, terminal.get_print_test_lines())
+            self.assertEqual(18, len(server.requests))
+            self.assertEqual(9, server.not_modified)
+            self.assertEqual(9, rest_api.requests)
+            self.assertEqual(9, rest_api.cached)
+
+            # A new comment should be picked up. Since the fake server embeds
+            # the comments in the series and patch data, those change too
+            patches[0].comments.append(
+                {'content': 'Tested-by: %s\n' % self.mary})
+            rest_api = status.RestApi(cache_dir)
+            status.check_patchwork_status(series, '1234', None, None, False,
+                                          False, server.url, rest_api,
+                                          verbose=True)
+            self.assertEqual(6, rest_api.cached)
+            lines = terminal.get_print_test_lines()
+            self.assertIn('Patchwork: 9 requests, 6 from cache',
+                          lines[0].text)
+            self.assertEqual(
+                '5 new responses available in patchwork (use -d to write them '
+                'to a new branch)', lines[-1].text)
+
     def test_parse_snippets(self):
         """Test parsing of review snippets"""
         text = '''Hi Fred,
@@ -1383,3 +1750,43 @@ second line.'''
         msg += '\n\n' + signoff
         new_msg = patchstream.insert_tags(msg, tags)
         self.assertEqual(msg + '\n' + tag_str, new_msg)
+
+    def test_flatten_aliases(self):
+        """Test expanding a large set of nested aliases once per series"""
+        alias = {}
+        for seq in range(200):
+            alias['dev%d' % seq] = ['Dev %d <dev%d@example.com>' % (seq, seq)]
+        for seq in range(50):
+            alias['list%d' % seq] = ['dev%d' % (seq * 4 + i) for i in range(4)]
+        alias['all'] = ['list%d' % seq for seq in range(50)] + ['dev0']
+        alias['loop'] = ['other', 'dev1']
+        alias['other'] = ['loop']
+        flat = gitutil.flatten_aliases(alias)
+        self.assertEqual(200, len(flat['all']))
+        self.assertEqual(['other', 'dev1'], flat['loop'])
+        names = ['all', 'list3', 'dev7', 'unknown', 'fred@example.com']
+        with capture_sys_output() as (stdout, _):
+            self.assertEqual(gitutil.build_email_list(names, 'Cc', alias),
+                             gitutil.build_email_list(names, 'Cc', flat))
+        self.assertEqual("Alias 'unknown' not found\n" * 2, stdout.getvalue())
+        with self.assertRaises(OSError) as exc:
+            gitutil.build_email_list(['loop'], None, flat)
+        self.assertIn('Recursive email alias', str(exc.exception))
+
+        # Check that the Cc file uses the aliases and shows its timing
+        settings.alias = alias
+        series = Series()
+        series.commits = [Commit('abcd'), Commit('ef12')]
+        for seq, cmt in enumerate(series.commits):
+            cmt.patch = '%04d-patch.patch' % (seq + 1)
+            cmt.tags = ['list%d' % seq]
+        with capture_sys_output() as (stdout, _):
+            cc_file = series.MakeCcFile(True, None, True, False, None, None,
+                                        verbose=True)
+        cc_lines = tools.read_file(cc_file, binary=False).splitlines()
+        os.remove(cc_file)
+        self.assertEqual(
+            '0001-patch.patch %s' % '\0'.join(
+                sorted('Dev %d <dev%d@example.com>' % (i, i)
+                       for i in range(4))), cc_lines[0])
+        self.assertIn('Cc file: 2 patches in ', stdout.getvalue())
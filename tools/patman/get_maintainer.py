@@ -4,6 +4,7 @@
 #
 
 import os
+import re
 import shlex
 import shutil
 
@@ -27,7 +28,7 @@ def find_get_maintainer(script_file_name):
         return git_relative_script
 
 
-def get_maintainer(script_file_name, fname, verbose=False):
+def get_maintainer(script_file_name, fname, verbose=False, index=None):
     """Run `script_file_name` on a file.
 
     `script_file_name` should be a get_maintainer.pl-like script that
@@ -40,10 +41,17 @@ def get_maintainer(script_file_name, fname, verbose=False):
         script_file_name: The file name of the get_maintainer.pl script
             (or compatible).
         fname: File name of the patch to process with get_maintainer.pl.
+        index (MaintainersIndex): Index to use to look up the maintainers
+            instead of running the script, or None to always run the script
 
     Returns:
         A list of email addresses to CC to.
     """
+    if index:
+        maintainers = index.get_maintainers(fname)
+        if maintainers is not None:
+            return maintainers
+
     # Expand `script_file_name` into a file name and its arguments, if
     # any.
     cmd_args = shlex.split(script_file_name)
@@ -59,3 +67,423 @@ def get_maintainer(script_file_name, fname, verbose=False):
     stdout = command.output(get_maintainer, *arguments, fname)
     lines = stdout.splitlines()
     return [x.replace('"', '') for x in lines]
+
+
+# Matches a tag line in MAINTAINERS, e.g. 'F:	drivers/core/'
+RE_TAG = re.compile(r'^([A-Z]):\s*(.*)')
+
+# Lines in a patch which give the names of files being changed
+RE_PATCH_FILES = [
+    re.compile(r'^ mode change [0-7]+ => [0-7]+ (\S+)\s*$'),
+    re.compile(r'^rename (?:from|to) (\S+)\s*$'),
+    re.compile(r'^diff --git a/(\S+) b/(\S+)\s*$'),
+]
+RE_PATCH_FILE = re.compile(r'^(?:\+\+\+|---)\s+(\S+)')
+RE_FIXES = re.compile(r'^Fixes:\s+([0-9a-fA-F]{6,40})')
+
+
+def parse_email(email):
+    """Split an email address into a name and address
+
+    This follows the rules used by get_maintainer.pl
+
+    Args:
+        email (str): Email, e.g. 'Fred Bloggs <fred@bloggs.org>'
+
+    Returns:
+        tuple:
+            str: Name, quoted if needed (e.g. '"Fred J. Bloggs"'), or ''
+            str: Address, e.g. 'fred@bloggs.org', or ''
+
+    >>> parse_email('Fred Bloggs <fred@bloggs.org>')
+    ('Fred Bloggs', 'fred@bloggs.org')
+    >>> parse_email('Fred J. Bloggs <fred@bloggs.org>')
+    ('"Fred J. Bloggs"', 'fred@bloggs.org')
+    >>> parse_email('fred@bloggs.org')
+    ('', 'fred@bloggs.org')
+    """
+    name = ''
+    address = ''
+    mat = re.match(r'^([^<]+)<(.+@.*)>.*$', email)
+    if mat:
+        name, address = mat.groups()
+    else:
+        mat = (re.match(r'^\s*<(.+@\S*)>.*$', email) or
+               re.match(r'^(.+@\S*).*$', email))
+        if mat:
+            address = mat.group(1)
+    name = name.strip()
+    name = re.sub(r'^"|"$', '', name)
+    address = address.strip()
+    return _quote_name(name), address
+
+def _quote_name(name):
+    """Quote a name if it contains characters which need it
+
+    Args:
+        name (str): Name to check
+
+    Returns:
+        str: Name, surrounded by double quotes if needed
+    """
+    if re.search(r'[^\w \-]', name):
+        name = '"%s"' % re.sub(r'(?<!\\)"', r'\\"', name)
+    return name
+
+def format_email(name, address):
+    """Put together a name and an address
+
+    Args:
+        name (str): Name, or '' if none
+        address (str): Email address
+
+    Returns:
+        str: Formatted email, e.g. 'Fred Bloggs <fred@bloggs.org>'
+    """
+    name = re.sub(r'^"|"$', '', name.strip())
+    name = _quote_name(name)
+    address = address.strip()
+    return '%s <%s>' % (name, address) if name else address
+
+
+class MaintainersIndex:
+    """Index of the MAINTAINERS files, used to find the maintainers for patches
+
+    This reads all the MAINTAINERS files in the tree (and .mailmap) once and
+    then resolves the F:, N:, X: and K: patterns for each patch in memory,
+    rather than running get_maintainer.pl for every patch. It follows the rules
+    used by that script, giving the same result as:
+
+        get_maintainer.pl --find-maintainer-files --norolestats --nogit \\
+            --nogit-fallback
+
+    So unlike the default U-Boot configuration, the git history is not used to
+    find people to Cc. The script also uses git to find the authors of commits
+    mentioned in Fixes: tags and looks inside .yaml files for email addresses.
+    For such patches get_maintainers() returns None, so that the caller can
+    fall back to running the script.
+
+    Properties:
+        srcdir (str): Top-level directory of the source tree
+        sections (list of list of tuple): Sections in MAINTAINERS, each a
+            list of (tag, value) tuples, e.g. ('M', 'Fred <fred@bloggs.org>')
+        file_pats (dict): F: patterns, indexed by the first path component:
+            key (str): First component (e.g. 'drivers'), or '' for patterns
+                which start with a wildcard
+            value (list of tuple): Patterns, each:
+                int: Section index
+                re.Pattern: Compiled pattern
+                int: Pattern depth, as used by get_maintainer.pl
+        excludes (dict): X: patterns for each section:
+            key (int): Section index
+            value (list of re.Pattern): Compiled patterns
+        names (list of tuple): N: patterns, each (section index, re.Pattern)
+        keywords (list of tuple): K: patterns, each (section index,
+            re.Pattern)
+        mailmap_names (dict): Real names from .mailmap, keyed by the email
+            address or formatted email being replaced
+        mailmap_addresses (dict): Real addresses from .mailmap, keyed by the
+            email address or formatted email being replaced
+    """
+    def __init__(self, srcdir):
+        """Set up a new index
+
+        Args:
+            srcdir (str): Top-level directory of the source tree
+        """
+        self.srcdir = srcdir
+        self.sections = []
+        self.file_pats = {}
+        self.excludes = {}
+        self.names = []
+        self.keywords = []
+        self.mailmap_names = {}
+        self.mailmap_addresses = {}
+        for dirpath, dirnames, fnames in os.walk(srcdir):
+            dirnames[:] = sorted(name for name in dirnames if name != '.git')
+            if 'MAINTAINERS' in fnames:
+                self._read_maintainers(os.path.join(dirpath, 'MAINTAINERS'))
+        mailmap_fname = os.path.join(srcdir, '.mailmap')
+        if os.path.exists(mailmap_fname):
+            self._read_mailmap(mailmap_fname)
+
+    def _convert_pattern(self, value):
+        """Convert an F: or X: pattern into a regular expression
+
+        Args:
+            value (str): Pattern, e.g. 'drivers/core/*.c'
+
+        Returns:
+            str: Regular expression, e.g. 'drivers/core/.*\\.c'
+        """
+        value = value.replace('.', r'\.').replace('*', '.*').replace('?', '.')
+        if os.path.isdir(os.path.join(self.srcdir, value)):
+            value = re.sub('([^/])$', r'\1/', value)
+        return value
+
+    def _add_file_pattern(self, seq, value):
+        """Add an F: pattern to the index
+
+        Args:
+            seq (int): Section index
+            value (str): Pattern, converted by _convert_pattern()
+        """
+        try:
+            pat = re.compile('^' + value)
+        except re.error:
+            return
+        depth = value.count('/')
+        if not value.endswith('/'):
+            depth += 1
+        if value.startswith('.*'):
+            depth = -1
+        first, sep, _ = value.partition('/')
+        key = first if sep and not re.search(r'[.\[\\(|+?*{]', first) else ''
+        self.file_pats.setdefault(key, []).append((seq, pat, depth))
+
+    def _read_maintainers(self, fname):
+        """Read a MAINTAINERS file into the index
+
+        Args:
+            fname (str): Filename to read
+        """
+        section = None
+        with open(fname, encoding='utf-8') as inf:
+            for line in inf:
+                mat = RE_TAG.match(line.rstrip('\n'))
+                if not mat:
+                    if line.strip() and not line.lstrip().startswith('#'):
+                        section = None
+                    continue
+                if section is None:
+                    section = []
+                    self.sections.append(section)
+                tag, value = mat.groups()
+                seq = len(self.sections) - 1
+                if tag in 'FX':
+                    value = self._convert_pattern(value)
+                    if tag == 'F':
+                        self._add_file_pattern(seq, value)
+                    else:
+                        try:
+                            self.excludes.setdefault(seq, []).append(
+                                re.compile('^' + value))
+                        except re.error:
+                            pass
+                elif tag in 'NK':
+                    try:
+                        pat = re.compile(value, re.VERBOSE)
+                    except re.error:
+                        pat = None
+                    if pat:
+                        (self.names if tag == 'N' else self.keywords).append(
+                            (seq, pat))
+                section.append((tag, value))
+
+    def _read_mailmap(self, fname):
+        """Read a .mailmap file
+
+        Args:
+            fname (str): Filename to read
+        """
+        with open(fname, encoding='utf-8') as inf:
+            for line in inf:
+                line = re.sub('#.*$', '', line).strip()
+                if not line:
+                    continue
+                mat = re.match(r'^([^<]+)<([^>]+)>$', line)
+                if mat:
+                    name, address = parse_email('%s <%s>' % (
+                        mat.group(1).rstrip(), mat.group(2)))
+                    self.mailmap_names[address] = name
+                    continue
+                mat = re.match(r'^<([^>]+)>\s*<([^>]+)>$', line)
+                if mat:
+                    self.mailmap_addresses[mat.group(2)] = mat.group(1)
+                    continue
+                mat = re.match(r'^(.+)<([^>]+)>\s*<([^>]+)>$', line)
+                if mat:
+                    name, address = parse_email('%s <%s>' % (
+                        mat.group(1).rstrip(), mat.group(2)))
+                    self.mailmap_names[mat.group(3)] = name
+                    self.mailmap_addresses[mat.group(3)] = address
+                    continue
+                mat = re.match(r'^(.+)<([^>]+)>\s*(.+)\s*<([^>]+)>$', line)
+                if mat:
+                    name, address = parse_email('%s <%s>' % (
+                        mat.group(1).rstrip(), mat.group(2)))
+                    wrong = format_email(*parse_email('%s <%s>' % (
+                        mat.group(3).rstrip(), mat.group(4))))
+                    self.mailmap_names[wrong] = name
+                    self.mailmap_addresses[wrong] = address
+
+    def _mailmap_email(self, email):
+        """Look up an email in the .mailmap
+
+        Args:
+            email (str): Email to look up
+
+        Returns:
+            str: Real email to use
+        """
+        name, address = parse_email(email)
+        email = format_email(name, address)
+        if email in self.mailmap_names or email in self.mailmap_addresses:
+            key = email
+        else:
+            key = address
+        return format_email(self.mailmap_names.get(key, name),
+                            self.mailmap_addresses.get(key, address))
+
+    @staticmethod
+    def _match_file(fname, pat):
+        """Check if a filename matches an F: or X: pattern
+
+        Patterns ending in '/' match all files in that directory and below.
+        Other patterns only match files at the same depth.
+
+        Args:
+            fname (str): Filename to check
+            pat (re.Pattern): Pattern to check
+
+        Returns:
+            bool: True if the file matches
+        """
+        if not pat.match(fname):
+            return False
+        return (pat.pattern.endswith('/') or
+                fname.count('/') == pat.pattern.count('/'))
+
+    def _find_sections(self, fname):
+        """Find the sections which match a file
+
+        Args:
+            fname (str): Filename to check, relative to the top of the tree
+
+        Returns:
+            dict: Matching sections:
+                key (int): Section index
+                value (int): Depth of the pattern which matched
+        """
+        found = {}
+        excluded = set()
+        for seq, pats in self.excludes.items():
+            for pat in pats:
+                if self._match_file(fname, pat):
+                    excluded.add(seq)
+                    break
+        first = fname.split('/')[0]
+        for seq, pat, depth in (self.file_pats.get(first, []) +
+                                self.file_pats.get('', [])):
+            if seq not in excluded and self._match_file(fname, pat):
+                found[seq] = depth
+        for seq, pat in self.names:
+            if seq not in excluded and pat.search(fname):
+                found[seq] = 0
+        return found
+
+    @staticmethod
+    def _scan_patch(fname):
+        """Scan a patch to find the files it changes
+
+        Args:
+            fname (str): Patch filename
+
+        Returns:
+            tuple:
+                list of str: Files changed by the patch (sorted, unique)
+                list of str: Lines of the patch which can match K: keywords,
+                    i.e. the header and commit message, then only lines which
+                    add or remove code
+                bool: True if the patch has a Fixes: tag
+        """
+        files = set()
+        lines = []
+        has_fixes = False
+        in_diff = False
+        with open(fname, encoding='utf-8', errors='replace') as inf:
+            for line in inf:
+                line = line.rstrip('\n')
+                for regex in RE_PATCH_FILES:
+                    mat = regex.match(line)
+                    if mat:
+                        files.update(mat.groups())
+                        break
+                else:
+                    if RE_FIXES.match(line):
+                        has_fixes = True
+                    elif RE_PATCH_FILE.match(line):
+                        name = RE_PATCH_FILE.match(line).group(1)
+                        files.add(re.sub('^[^/]*/', '', name))
+                        in_diff = True
+                    elif line.startswith('@@ -'):
+                        pass
+                    elif not in_diff or line[:1] in '+-' and line:
+                        lines.append(line)
+        return sorted(files), lines, has_fixes
+
+    def get_maintainers(self, fname):
+        """Get the maintainers for a patch
+
+        Args:
+            fname (str): Patch filename
+
+        Returns:
+            list of str: Emails of the maintainers, reviewers and mailing lists
+                for the patch, or None if get_maintainer.pl must be used
+                instead (see the class comment)
+        """
+        files, lines, has_fixes = self._scan_patch(fname)
+        if has_fixes or not files:
+            return None
+        if any(path.endswith('.yaml') for path in files):
+            return None
+        sections = []
+        for path in files:
+            found = self._find_sections(path)
+            sections += sorted(found, key=lambda seq: -found[seq])
+        sections += sorted({seq for seq, pat in self.keywords
+                            if any(pat.search(line) for line in lines)})
+
+        emails = []
+        lists = []
+        names_seen = set()
+        addrs_seen = set()
+        for seq in sections:
+            for tag, value in self.sections[seq]:
+                if tag in 'MR':
+                    name, address = parse_email(value)
+                    if not address:
+                        continue
+                    if ((name and name.lower() in names_seen) or
+                            address.lower() in addrs_seen):
+                        continue
+                    emails.append(format_email(name, address))
+                    if name:
+                        names_seen.add(name.lower())
+                    addrs_seen.add(address.lower())
+                elif tag == 'L':
+                    address, _, extra = value.partition(' ')
+                    if ('subscribers-only' not in extra and
+                            address.lower() not in lists):
+                        lists.append(address.lower())
+                        emails.append(address)
+
+        # Deduplicate as get_maintainer.pl does, after applying .mailmap
+        dedup_name = {}
+        dedup_addr = {}
+        out = []
+        for email in emails:
+            name, address = parse_email(self._mailmap_email(email))
+            real = (dedup_name.get(name.lower()) if name else None) or \
+                dedup_addr.get(address.lower())
+            if real:
+                name, address = real
+            else:
+                dedup_name[name.lower()] = (name, address)
+                dedup_addr[address.lower()] = (name, address)
+            email = self._mailmap_email(format_email(name, address))
+            email = email.replace('"', '')
+            if email not in out:
+                out.append(email)
+        return out
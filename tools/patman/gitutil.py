@@ -2,7 +2,10 @@
 # Copyright (c) 2011 The Chromium OS Authors.
 #
 
+import email.header
 import os
+import re
+import string
 import sys
 
 from patman import settings
@@ -12,6 +15,17 @@ from u_boot_pylib import terminal
 # True to use --no-decorate - we check this in setup()
 use_no_decorate = True
 
+# Maximum length of a patch filename produced by 'git format-patch'
+PATCH_NAME_MAX = 64
+
+# Characters which 'git format-patch' keeps when naming a patch file
+PATCH_NAME_CHARS = frozenset(
+    (string.ascii_letters + string.digits + '._').encode('ascii'))
+
+# Start of each patch in the output of 'git format-patch --stdout'
+RE_PATCH_START = re.compile(
+    r'^From [0-9a-f]{40,64} Mon Sep 17 00:00:00 2001$', re.MULTILINE)
+
 
 def log_cmd(commit_range, git_dir=None, oneline=False, reverse=False,
             count=None):
@@ -319,11 +333,8 @@ def prune_worktrees(git_dir):
         raise OSError('git worktree prune: %s' % result.stderr)
 
 
-def create_patches(branch, start, count, ignore_binary, series, signoff=True):
-    """Create a series of patches from the top of the current branch.
-
-    The patch files are written to the current directory using
-    git format-patch.
+def _format_patch_cmd(branch, start, count, ignore_binary, series, signoff):
+    """Create a 'git format-patch' command for a series
 
     Args:
         branch: Branch to create patches from (None for current branch)
@@ -331,9 +342,9 @@ def create_patches(branch, start, count, ignore_binary, series, signoff=True):
         count: number of commits to include
         ignore_binary: Don't generate patches for binary files
         series: Series object for this series (set of patches)
+        signoff: True to add a Signed-off-by line
     Return:
-        Filename of cover letter (None if none)
-        List of filenames of patch files
+        List containing command and arguments to run
     """
     cmd = ['git', 'format-patch', '-M']
     if signoff:
@@ -347,7 +358,27 @@ def create_patches(branch, start, count, ignore_binary, series, signoff=True):
         cmd += ['--subject-prefix=%s' % prefix]
     brname = branch or 'HEAD'
     cmd += ['%s~%d..%s~%d' % (brname, start + count, brname, start)]
+    return cmd
+
+
+def create_patches(branch, start, count, ignore_binary, series, signoff=True):
+    """Create a series of patches from the top of the current branch.
 
+    The patch files are written to the current directory using
+    git format-patch.
+
+    Args:
+        branch: Branch to create patches from (None for current branch)
+        start: Commit to start from: 0=HEAD, 1=next one, etc.
+        count: number of commits to include
+        ignore_binary: Don't generate patches for binary files
+        series: Series object for this series (set of patches)
+    Return:
+        Filename of cover letter (None if none)
+        List of filenames of patch files
+    """
+    cmd = _format_patch_cmd(branch, start, count, ignore_binary, series,
+                            signoff)
     stdout = command.run_list(cmd)
     files = stdout.splitlines()
 
@@ -358,6 +389,121 @@ def create_patches(branch, start, count, ignore_binary, series, signoff=True):
         return None, files
 
 
+def get_patch_fname(seq, subject):
+    """Get the filename that 'git format-patch' uses for a patch
+
+    This follows git's rules: runs of characters other than letters, digits,
+    '.' and '_' become a single '-', then the name is truncated so that it
+    fits in 64 characters along with the '.patch' suffix.
+
+    Args:
+        seq: Sequence number of the patch (0 for the cover letter)
+        subject: Subject of the commit, without any '[PATCH]' prefix
+    Return:
+        Filename, e.g. '0001-dm-core-Add-a-new-uclass.patch'
+
+    >>> get_patch_fname(1, 'dm: core: Add a new uclass...')
+    '0001-dm-core-Add-a-new-uclass.patch'
+    >>> get_patch_fname(2, 'video: Support UTF-8 in the f\\u00f6nt')
+    '0002-video-Support-UTF-8-in-the-f-nt.patch'
+    """
+    out = bytearray()
+    space = 2
+    data = subject.encode('utf-8')
+    pos = 0
+    while pos < len(data):
+        char = data[pos]
+        if char in PATCH_NAME_CHARS:
+            if space == 1:
+                out.append(ord('-'))
+            space = 0
+            out.append(char)
+            if char == ord('.'):
+                while data[pos + 1:pos + 2] == b'.':
+                    pos += 1
+        else:
+            space |= 1
+        pos += 1
+    name = ('%04d-' % seq) + out.decode('ascii').rstrip('.-')
+    return name[:PATCH_NAME_MAX - len('.patch') - 1] + '.patch'
+
+
+def _get_stream_subject(text, prefix):
+    """Get the commit subject from the email header of a patch
+
+    Args:
+        text: Patch text, as produced by 'git format-patch'
+        prefix: Subject prefix, e.g. 'RFC PATCH v2'
+    Return:
+        Subject of the commit with the '[prefix n/m] ' part removed, or
+        None if there is no subject
+    """
+    lines = []
+    for line in text.splitlines():
+        if lines:
+            if not line.startswith(' '):
+                break
+            lines.append(line)
+        elif line.startswith('Subject: '):
+            lines.append(line[len('Subject: '):])
+        elif not line:
+            break
+    if not lines:
+        return None
+
+    # Unfold the header and decode any RFC 2047 words, e.g. for UTF-8
+    value = str(email.header.make_header(email.header.decode_header(
+        '\n'.join(lines).replace('\n ', ' '))))
+    return re.sub(r'^\[%s(?: \d+/\d+)?\] ' % re.escape(prefix), '', value)
+
+
+def format_patch_stream(branch, start, count, ignore_binary, series,
+                        signoff=True):
+    """Create a series of patches in memory using a single git command
+
+    This runs 'git format-patch --stdout' and splits the result into the
+    patches which create_patches() would write, along with their filenames.
+    Nothing is written to the current directory.
+
+    Args:
+        branch: Branch to create patches from (None for current branch)
+        start: Commit to start from: 0=HEAD, 1=next one, etc.
+        count: number of commits to include
+        ignore_binary: Don't generate patches for binary files
+        series: Series object for this series (set of patches)
+    Return:
+        Tuple (filename, text) for the cover letter (None if none)
+        List of tuples (filename, text), one for each patch
+    """
+    cmd = _format_patch_cmd(branch, start, count, ignore_binary, series,
+                            signoff)
+    cmd.insert(2, '--stdout')
+    stdout = command.run_pipe([cmd], capture=True,
+                              binary=True).stdout.decode('utf-8')
+
+    starts = [m.start() for m in RE_PATCH_START.finditer(stdout)]
+    starts.append(len(stdout))
+    prefix = series.GetPatchPrefix()
+    patches = []
+    seq = 0 if series.get('cover') else 1
+    for pos, end in zip(starts, starts[1:]):
+        text = stdout[pos:end]
+        if seq:
+            # git puts a blank line between commits; files do not have it
+            if end != len(stdout):
+                text = text[:-1]
+            subject = _get_stream_subject(text, prefix)
+        else:
+            subject = 'cover letter'
+        patches.append((get_patch_fname(seq, subject), text))
+        seq += 1
+
+    # We have an extra patch if there is a cover letter
+    if series.get('cover'):
+        return patches[0], patches[1:]
+    return None, patches
+
+
 def build_email_list(in_list, tag=None, alias=None, warn_on_error=True):
     """Build a list of email addresses based on an input list.
 
@@ -396,10 +542,7 @@ def build_email_list(in_list, tag=None, alias=None, warn_on_error=True):
     raw = []
     for item in in_list:
         raw += lookup_email(item, alias, warn_on_error=warn_on_error)
-    result = []
-    for item in raw:
-        if item not in result:
-            result.append(item)
+    result = list(dict.fromkeys(raw))
     if tag:
         return ['%s %s%s%s' % (tag, quote, email, quote) for email in result]
     return result
@@ -604,15 +747,89 @@ def lookup_email(lookup_name, alias=None, warn_on_error=True, level=0):
             if warn_on_error:
                 print(col.build(col.RED, msg))
             return out_list
+        found = {}
         for item in alias[lookup_name]:
-            todo = lookup_email(item, alias, warn_on_error, level + 1)
-            for new_item in todo:
-                if new_item not in out_list:
-                    out_list.append(new_item)
+            found.update(dict.fromkeys(
+                lookup_email(item, alias, warn_on_error, level + 1)))
+        out_list = list(found)
 
     return out_list
 
 
+def flatten_aliases(alias=None):
+    """Expand every alias into the full list of email addresses it refers to
+
+    lookup_email() expands an alias recursively each time it is used, which is
+    slow with large alias files when building the Cc lists for a series. This
+    works out the expansion of every alias once, so that the result can be
+    passed as the alias dictionary to lookup_email() and build_email_list().
+
+    Aliases which are part of a loop, or which refer to an alias that does not
+    exist, are left as they are, so that lookup_email() reports the problem
+    if they are used.
+
+    Args:
+        alias: Dictionary containing aliases (None to use settings default)
+
+    Returns:
+        dict: Flattened aliases:
+            key: Alias name
+            value: List of email addresses, or the original list of aliases /
+                email addresses for an alias which cannot be expanded
+
+    >>> alias = {}
+    >>> alias['fred'] = ['f.bloggs@napier.co.nz']
+    >>> alias['john'] = ['j.bloggs@napier.co.nz']
+    >>> alias['boys'] = ['fred', ' john', 'f.bloggs@napier.co.nz']
+    >>> alias['all'] = ['boys ', 'Mary Poppins <m.poppins@cloud.net>']
+    >>> alias['loop'] = ['other', 'john']
+    >>> alias['other'] = ['loop']
+    >>> alias['odd'] = ['fred', 'arthur']
+    >>> flat = flatten_aliases(alias)
+    >>> flat['all']
+    ['f.bloggs@napier.co.nz', 'j.bloggs@napier.co.nz', \
+'Mary Poppins <m.poppins@cloud.net>']
+    >>> flat['loop'], flat['odd']
+    (['other', 'john'], ['fred', 'arthur'])
+    >>> build_email_list(['boys', 'john'], None, flat)
+    ['f.bloggs@napier.co.nz', 'j.bloggs@napier.co.nz']
+    """
+    if not alias:
+        alias = settings.alias
+    flat = {}
+    bad = set()
+
+    def _expand(name, active):
+        """Expand an alias, returning its addresses or None on failure"""
+        if name in flat:
+            return flat[name]
+        if name in bad or name in active or name not in alias:
+            return None
+        active.add(name)
+        found = {}
+        for item in alias[name]:
+            item = item.strip()
+            if '@' in item:
+                found[item] = None
+            elif item:
+                addrs = _expand(item.lower(), active)
+                if addrs is None:
+                    bad.add(name)
+                    break
+                found.update(dict.fromkeys(addrs))
+        active.remove(name)
+        if name in bad:
+            return None
+        flat[name] = list(found)
+        return flat[name]
+
+    for name in alias:
+        _expand(name, set())
+    for name in bad:
+        flat[name] = alias[name]
+    return flat
+
+
 def get_top_level():
     """Return name of top-level directory for this git repo.
 
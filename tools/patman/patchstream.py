@@ -807,6 +807,20 @@ def fix_patch(backup_dir, fname, series, cmt, keep_change_id=False):
     shutil.move(tmpname, fname)
     return cmt.warn
 
+def _show_warnings(fname, warnings):
+    """Show the warnings found when fixing up a patch file
+
+    Args:
+        fname (str): Filename of the patch file
+        warnings (list of str): Warnings to show
+    """
+    if warnings:
+        print('%d warning%s for %s:' %
+              (len(warnings), 's' if len(warnings) > 1 else '', fname))
+        for warn in warnings:
+            print('\t%s' % warn)
+        print()
+
 def fix_patches(series, fnames, keep_change_id=False):
     """Fix up a list of patches identified by filenames
 
@@ -826,28 +840,62 @@ def fix_patches(series, fnames, keep_change_id=False):
         cmt.count = count
         result = fix_patch(backup_dir, fname, series, cmt,
                            keep_change_id=keep_change_id)
-        if result:
-            print('%d warning%s for %s:' %
-                  (len(result), 's' if len(result) > 1 else '', fname))
-            for warn in result:
-                print('\t%s' % warn)
-            print()
+        _show_warnings(fname, result)
         count += 1
     print('Cleaned %d patch%s' % (count, 'es' if count > 1 else ''))
 
-def insert_cover_letter(fname, series, count):
-    """Inserts a cover letter with the required info into patch 0
+def write_patches(series, cover, patches, keep_change_id=False):
+    """Fix up a list of patches held in memory and write out the files
+
+    This does the same as fix_patches() and insert_cover_letter() but each
+    file is written only once, directly in its final form.
 
     Args:
-        fname (str): Input / output filename of the cover letter file
+        series (Series): The Series object
+        cover (tuple): (filename, text) of the cover letter, or None
+        patches (list of tuple): (filename, text) of each patch, as returned
+            by gitutil.format_patch_stream()
+        keep_change_id (bool): Keep the Change-Id tag.
+
+    Returns:
+        tuple:
+            str: Filename of the cover letter, or None if none
+            list of str: Filename of each patch file
+    """
+    fnames = []
+    for count, (fname, text) in enumerate(patches):
+        cmt = series.commits[count]
+        cmt.patch = fname
+        cmt.count = count
+        pst = PatchStream(series, keep_change_id=keep_change_id)
+        pst.commit = cmt
+        with open(fname, 'w', encoding='utf-8') as outfd:
+            pst.process_stream(io.StringIO(text, newline=None), outfd)
+        _show_warnings(fname, cmt.warn)
+        fnames.append(fname)
+    count = len(fnames)
+    print('Cleaned %d patch%s' % (count, 'es' if count > 1 else ''))
+
+    cover_fname = None
+    if cover:
+        cover_fname, text = cover
+        with open(cover_fname, 'w', encoding='utf-8') as outfd:
+            lines = io.StringIO(text, newline=None).readlines()
+            outfd.writelines(_make_cover_letter(lines, series, count))
+    return cover_fname, fnames
+
+def _make_cover_letter(lines, series, count):
+    """Insert the required info into the lines of a cover letter
+
+    Args:
+        lines (list of str): Lines of the cover letter, each ending with a
+            newline
         series (Series): Series object
         count (int): Number of patches in the series
-    """
-    fil = open(fname, 'r')
-    lines = fil.readlines()
-    fil.close()
 
-    fil = open(fname, 'w')
+    Yields:
+        str: Each line of the updated cover letter
+    """
     text = series.cover
     prefix = series.GetPatchPrefix()
     for line in lines:
@@ -867,5 +915,20 @@ def insert_cover_letter(fname, series, count):
             # Now the change list
             out = series.MakeChangeLog(None)
             line += '\n' + '\n'.join(out)
-        fil.write(line)
+        yield line
+
+def insert_cover_letter(fname, series, count):
+    """Inserts a cover letter with the required info into patch 0
+
+    Args:
+        fname (str): Input / output filename of the cover letter file
+        series (Series): Series object
+        count (int): Number of patches in the series
+    """
+    fil = open(fname, 'r')
+    lines = fil.readlines()
+    fil.close()
+
+    fil = open(fname, 'w')
+    fil.writelines(_make_cover_letter(lines, series, count))
     fil.close()
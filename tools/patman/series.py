@@ -239,7 +239,7 @@ class Series(dict):
 
     def GetCcForCommit(self, commit, process_tags, warn_on_error,
                        add_maintainers, limit, get_maintainer_script,
-                       all_skips):
+                       all_skips, maintainers_index=None, alias=None):
         """Get the email CCs to use with a particular commit
 
         Uses subject tags and get_maintainers.pl script to find people to cc
@@ -259,21 +259,26 @@ class Series(dict):
             all_skips (set of str): Updated to include the set of bouncing email
                 addresses that were dropped from the output. This is essentially
                 a return value from this function.
+            maintainers_index (MaintainersIndex): Index to use to find the
+                maintainers, or None to run get_maintainer_script
+            alias (dict): Alias dictionary to use, e.g. from
+                gitutil.flatten_aliases() (None to use settings default)
 
         Returns:
             list of str: List of email addresses to cc
         """
         cc = []
         if process_tags:
-            cc += gitutil.build_email_list(commit.tags,
+            cc += gitutil.build_email_list(commit.tags, alias=alias,
                                            warn_on_error=warn_on_error)
-        cc += gitutil.build_email_list(commit.cc_list,
+        cc += gitutil.build_email_list(commit.cc_list, alias=alias,
                                        warn_on_error=warn_on_error)
         if type(add_maintainers) == type(cc):
             cc += add_maintainers
         elif add_maintainers:
             cc += get_maintainer.get_maintainer(get_maintainer_script,
-                                                commit.patch)
+                                                commit.patch,
+                                                index=maintainers_index)
         all_skips |= set(cc) & set(settings.bounces)
         cc = list(set(cc) - set(settings.bounces))
         if limit is not None:
@@ -281,7 +286,8 @@ class Series(dict):
         return cc
 
     def MakeCcFile(self, process_tags, cover_fname, warn_on_error,
-                   add_maintainers, limit, get_maintainer_script):
+                   add_maintainers, limit, get_maintainer_script,
+                   maintainers_index=False, verbose=False):
         """Make a cc file for us to use for per-commit Cc automation
 
         Also stores in self._generated_cc to make ShowActions() faster.
@@ -297,10 +303,20 @@ class Series(dict):
             limit (int): Limit the length of the Cc list (None if no limit)
             get_maintainer_script (str): The file name of the get_maintainer.pl
                 script (or compatible).
+            maintainers_index (bool): True to read the MAINTAINERS files once
+                for the whole series and look up the maintainers for each
+                patch from that, instead of running get_maintainer_script for
+                each patch. See get_maintainer.MaintainersIndex
+            verbose (bool): True to show how long it took to create the file
         Return:
             Filename of temp file created
         """
         col = terminal.Color()
+        start_time = time.monotonic()
+        alias = gitutil.flatten_aliases()
+        index = None
+        if add_maintainers is True and maintainers_index:
+            index = get_maintainer.MaintainersIndex(gitutil.get_top_level())
         # Look for commit tags (of the form 'xxx:' at the start of the subject)
         fname = '/tmp/patman.%d' % os.getpid()
         fd = open(fname, 'w', encoding='utf-8')
@@ -311,7 +327,8 @@ class Series(dict):
                 commit.seq = i
                 commit.future = executor.submit(
                     self.GetCcForCommit, commit, process_tags, warn_on_error,
-                    add_maintainers, limit, get_maintainer_script, all_skips)
+                    add_maintainers, limit, get_maintainer_script, all_skips,
+                    index, alias)
 
             # Show progress any commits that are taking forever
             lastlen = 0
@@ -342,7 +359,8 @@ class Series(dict):
             print(col.build(col.YELLOW, f'Skipping "{x}"'))
 
         if cover_fname:
-            cover_cc = gitutil.build_email_list(self.get('cover_cc', ''))
+            cover_cc = gitutil.build_email_list(self.get('cover_cc', ''),
+                                                alias=alias)
             cover_cc = list(set(cover_cc + all_ccs))
             if limit is not None:
                 cover_cc = cover_cc[:limit]
@@ -350,6 +368,9 @@ class Series(dict):
             print(cover_fname, cc_list, file=fd)
 
         fd.close()
+        if verbose:
+            print('Cc file: %d patches in %.2fs' %
+                  (len(self.commits), time.monotonic() - start_time))
         return fname
 
     def AddChange(self, version, commit, info):
@@ -10,8 +10,13 @@ collected from patchwork.
 
 import collections
 import concurrent.futures
+import hashlib
 from itertools import repeat
+import json
+import os
 import re
+import tempfile
+import threading
 
 import pygit2
 import requests
@@ -31,6 +36,9 @@ RE_PATCH = re.compile(r'(\[(((.*),)?(.*),)?(.*)\]\s)?(.*)$')
 # This decodes the sequence string into a patch number and patch count
 RE_SEQ = re.compile(r'(\d+)/(\d+)')
 
+# Maximum number of patchwork requests to have in flight at once
+MAX_WORKERS = 16
+
 def to_int(vals):
     """Convert a list of strings into integers, using 0 if not an integer
 
@@ -198,9 +206,150 @@ def compare_with_series(series, patches):
 
     return patch_for_commit, commit_for_patch, warnings
 
+class RestApi:
+    """Provides access to the patchwork REST API
+
+    This keeps a pool of connections open to the server, so that they can be
+    reused across requests, possibly from multiple threads.
+
+    If a cache directory is provided, each response is stored there along with
+    its ETag and Last-Modified headers. These are sent with later requests for
+    the same URL, so that the server can respond with '304 Not Modified' rather
+    than sending the data again.
+
+    Properties:
+        cache_dir (str): Directory to use for the cache, or None for no cache
+        session (requests.Session): Session used for all requests
+        requests (int): Number of requests made
+        cached (int): Number of requests satisfied from the cache
+        size (int): Number of bytes of data received from the server
+    """
+    def __init__(self, cache_dir=None, max_connections=MAX_WORKERS):
+        """Set up a new RestApi object
+
+        Args:
+            cache_dir (str): Directory to use for the cache, or None for no
+                cache. This is created if it does not exist
+            max_connections (int): Maximum number of connections to keep open
+                to the server
+        """
+        self.cache_dir = cache_dir
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=max_connections)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.requests = 0
+        self.cached = 0
+        self.size = 0
+        self._lock = threading.Lock()
+
+    def _cache_fname(self, full_url):
+        """Get the cache filename for a URL
+
+        Args:
+            full_url (str): URL to look up
+
+        Returns:
+            str: Filename to use for the cached response
+        """
+        digest = hashlib.sha256(full_url.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, digest + '.json')
+
+    def _read_cache(self, full_url):
+        """Read a cached response
+
+        Args:
+            full_url (str): URL to look up
+
+        Returns:
+            dict: Cached information, or None if there is none. This has keys
+                'url', 'etag', 'last_modified' and 'data'
+        """
+        try:
+            with open(self._cache_fname(full_url), encoding='utf-8') as inf:
+                cached = json.load(inf)
+        except (OSError, ValueError):
+            return None
+        if cached.get('url') != full_url:
+            return None
+        return cached
+
+    def _write_cache(self, full_url, response, data):
+        """Write a response to the cache
+
+        The file is written under a temporary name and then renamed, so that
+        other threads or processes never see a partial file.
+
+        Args:
+            full_url (str): URL which was read
+            response (requests.Response): Response from the server
+            data (dict or list): JSON data from the response
+        """
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if not etag and not last_modified:
+            return
+        cached = {'url': full_url, 'etag': etag,
+                  'last_modified': last_modified, 'data': data}
+        fd, tmpname = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as outf:
+            json.dump(cached, outf)
+        os.replace(tmpname, self._cache_fname(full_url))
+
+    def __call__(self, url, subpath):
+        """Call the patchwork API and return the result as JSON
+
+        Args:
+            url (str): URL of patchwork server, e.g.
+                'https://patchwork.ozlabs.org'
+            subpath (str): URL subpath to use
+
+        Returns:
+            dict: Json result
+
+        Raises:
+            ValueError: the URL could not be read
+        """
+        full_url = '%s/api/1.2/%s' % (url, subpath)
+        cached = self._read_cache(full_url) if self.cache_dir else None
+        headers = {}
+        if cached:
+            if cached['etag']:
+                headers['If-None-Match'] = cached['etag']
+            if cached['last_modified']:
+                headers['If-Modified-Since'] = cached['last_modified']
+        response = self.session.get(full_url, headers=headers)
+        with self._lock:
+            self.requests += 1
+            self.size += len(response.content)
+        if cached and response.status_code == 304:
+            with self._lock:
+                self.cached += 1
+            return cached['data']
+        if response.status_code != 200:
+            raise ValueError("Could not read URL '%s'" % full_url)
+        data = response.json()
+        if self.cache_dir:
+            self._write_cache(full_url, response, data)
+        return data
+
+    def show_stats(self):
+        """Show statistics about the requests made"""
+        terminal.tprint('Patchwork: %d requests, %d from cache, %d bytes' %
+                        (self.requests, self.cached, self.size))
+
+
+# RestApi object used by call_rest_api(), created when first needed
+default_api = None
+
 def call_rest_api(url, subpath):
     """Call the patchwork API and return the result as JSON
 
+    This uses a shared RestApi object without a cache, so that connections are
+    reused between calls.
+
     Args:
         url (str): URL of patchwork server, e.g. 'https://patchwork.ozlabs.org'
         subpath (str): URL subpath to use
@@ -211,11 +360,11 @@ def call_rest_api(url, subpath):
     Raises:
         ValueError: the URL could not be read
     """
-    full_url = '%s/api/1.2/%s' % (url, subpath)
-    response = requests.get(full_url)
-    if response.status_code != 200:
-        raise ValueError("Could not read URL '%s'" % full_url)
-    return response.json()
+    global default_api
+
+    if not default_api:
+        default_api = RestApi()
+    return default_api(url, subpath)
 
 def collect_patches(series, series_id, url, rest_api=call_rest_api):
     """Collect patch information about a series from patchwork
@@ -410,8 +559,9 @@ def create_branch(series, new_rtag_list, branch, dest_branch, overwrite,
     return num_added
 
 def check_patchwork_status(series, series_id, branch, dest_branch, force,
-                           show_comments, url, rest_api=call_rest_api,
-                           test_repo=None):
+                           show_comments, url, rest_api=None,
+                           test_repo=None, cache_dir=None, verbose=False,
+                           max_workers=MAX_WORKERS):
     """Check the status of a series on Patchwork
 
     This finds review tags and comments for a series in Patchwork, displaying
@@ -426,9 +576,16 @@ def check_patchwork_status(series, series_id, branch, dest_branch, force,
         show_comments (bool): True to show the comments on each patch
         url (str): URL of patchwork server, e.g. 'https://patchwork.ozlabs.org'
         rest_api (function): API function to call to access Patchwork, for
-            testing
+            testing, or None to create a RestApi object
         test_repo (pygit2.Repository): Repo to use (use None unless testing)
+        cache_dir (str): Directory to use to cache patchwork responses, or None
+            for no cache
+        verbose (bool): True to show statistics about the requests made
+        max_workers (int): Maximum number of patchwork requests to have in
+            flight at once
     """
+    if not rest_api:
+        rest_api = RestApi(cache_dir, max_workers)
     patches = collect_patches(series, series_id, url, rest_api)
     col = terminal.Color()
     count = len(series.commits)
@@ -441,7 +598,8 @@ def check_patchwork_status(series, series_id, branch, dest_branch, force,
 
     patch_list = [patch_for_commit.get(c) for c in range(len(series.commits))]
 
-    with concurrent.futures.ThreadPoolExecutor(max_workers=16) as executor:
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers) as executor:
         futures = executor.map(
             find_new_responses, repeat(new_rtag_list), repeat(review_list),
             range(count), series.commits, patch_list, repeat(url),
@@ -449,6 +607,8 @@ def check_patchwork_status(series, series_id, branch, dest_branch, force,
     for fresponse in futures:
         if fresponse:
             raise fresponse.exception()
+    if verbose and isinstance(rest_api, RestApi):
+        rest_api.show_stats()
 
     num_to_add = 0
     for seq, cmt in enumerate(series.commits):
@@ -7,6 +7,7 @@
 #
 
 import os
+import shutil
 import tempfile
 import unittest
 
@@ -413,6 +414,37 @@ index 0000000..2234c87
         self.assertEqual(result.lines, 62)
         os.remove(inf)
 
+    def test_cache(self):
+        """Test caching of checkpatch results"""
+        inf = self.setup_data('no-signoff')
+        cache_dir = tempfile.mkdtemp(prefix='patman.')
+        try:
+            result = checkpatch.check_patch(inf, cache_dir=cache_dir)
+            self.assertFalse(result.cached)
+            self.assertEqual(1, len(os.listdir(cache_dir)))
+
+            # A different commit hash in the first line should not matter
+            with open(inf, encoding='utf-8') as fd:
+                data = fd.read()
+            with open(inf, 'w', encoding='utf-8') as fd:
+                fd.write(data.replace('4924887af52713cabea78420eff03badea8f0035',
+                                      '0123456789abcdef0123456789abcdef01234567'))
+            result2 = checkpatch.check_patch(inf, cache_dir=cache_dir)
+            self.assertTrue(result2.cached)
+            self.assertEqual(result.stdout, result2.stdout)
+            self.assertEqual(result.problems, result2.problems)
+            self.assertEqual(1, result2.errors)
+
+            # Any other change means that checkpatch must run again
+            with open(inf, 'a', encoding='utf-8') as fd:
+                fd.write('\n')
+            result3 = checkpatch.check_patch(inf, cache_dir=cache_dir)
+            self.assertFalse(result3.cached)
+            self.assertEqual(2, len(os.listdir(cache_dir)))
+        finally:
+            shutil.rmtree(cache_dir)
+            os.remove(inf)
+
     def check_single_message(self, pm, msg, pmtype = 'warning'):
         """Helper function to run checkpatch and check the result
 
@@ -18,6 +18,6 @@ if __name__ == "__main__":
 
     result = test_util.run_test_suites(
         'u_boot_pylib', False, False, False, None, None, None,
-        ['terminal'])
+        ['terminal', 'u_boot_pylib.test_util'])
 
     sys.exit(0 if result.wasSuccessful() else 1)
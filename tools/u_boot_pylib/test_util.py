@@ -6,9 +6,14 @@
 from contextlib import contextmanager
 import doctest
 import glob
+import heapq
+import inspect
+import json
 import multiprocessing
 import os
+import statistics
 import sys
+import time
 import unittest
 
 from u_boot_pylib import command
@@ -134,8 +139,32 @@ class FullTextTestResult(unittest.TextTestResult):
     """
     def __init__(self, stream, descriptions, verbosity):
         self.verbosity = verbosity
+        self.durations = {}
+        self._clock = None
+        self._start_time = None
         super().__init__(stream, descriptions, verbosity)
 
+    def time(self, a_datetime):
+        """Called with the time reported by a concurrent test process
+
+        When tests run concurrently, each test is reported after it finishes,
+        with this called before startTest() to give the start time and again
+        afterwards to give the finish time.
+        """
+        self._clock = a_datetime.timestamp()
+
+    def _now(self):
+        """Get the current time, in seconds"""
+        return time.monotonic() if self._clock is None else self._clock
+
+    def startTest(self, test):
+        self._start_time = self._now()
+        super().startTest(test)
+
+    def stopTest(self, test):
+        self.durations[test.id()] = self._now() - self._start_time
+        super().stopTest(test)
+
     def printErrors(self):
         "Called by TestRunner after test run to summarize the tests"
         # The parent class doesn't keep unexpected successes in the same
@@ -158,8 +187,105 @@ class FullTextTestResult(unittest.TextTestResult):
         super().addSkip(test, reason)
 
 
+def _iterate_tests(suite):
+    """Iterate through all the tests in a suite
+
+    Args:
+        suite (unittest.TestSuite): Suite to iterate through
+
+    Yields:
+        unittest.TestCase: Each test in turn
+    """
+    for test in suite:
+        if isinstance(test, unittest.TestSuite):
+            yield from _iterate_tests(test)
+        else:
+            yield test
+
+
+def read_test_timings(fname):
+    """Read the test durations recorded by a previous run
+
+    Args:
+        fname (str): Filename to read
+
+    Returns:
+        dict: Test durations:
+            key (str): Test ID, e.g. 'binman.ftest.TestFunctional.testSimple'
+            value (float): Duration in seconds
+    """
+    if not os.path.exists(fname):
+        return {}
+    with open(fname, encoding='utf-8') as inf:
+        try:
+            return json.load(inf)
+        except ValueError:
+            return {}
+
+
+def partition_tests_by_cost(suite, count, timings):
+    """Split tests into groups with roughly the same total running time
+
+    This uses the 'longest processing time' method: tests are taken in order
+    of decreasing cost and each is added to the group with the lowest total.
+    Tests with no recorded timing are assumed to take the median time. Within
+    each group the tests stay in their original order, so that tests from the
+    same class remain together.
+
+    Args:
+        suite (unittest.TestSuite): Suite containing the tests to split
+        count (int): Number of groups to create
+        timings (dict): Test durations, as returned by read_test_timings()
+
+    Returns:
+        list of list of unittest.TestCase: Tests for each group
+
+    >>> class Test(unittest.TestCase):
+    ...     def test_a(self): pass
+    ...     def test_b(self): pass
+    ...     def test_c(self): pass
+    >>> suite = unittest.TestLoader().loadTestsFromTestCase(Test)
+    >>> timings = {test.id(): cost for test, cost in zip(suite, [3, 1, 2])}
+    >>> groups = partition_tests_by_cost(suite, 2, timings)
+    >>> [[test._testMethodName for test in group] for group in groups]
+    [['test_a'], ['test_b', 'test_c']]
+    """
+    tests = list(_iterate_tests(suite))
+    default = statistics.median(timings.values()) if timings else 1
+    costs = [timings.get(test.id(), default) for test in tests]
+    order = sorted(range(len(tests)), key=lambda seq: -costs[seq])
+
+    loads = [(0, group) for group in range(count)]
+    members = [[] for _ in range(count)]
+    for seq in order:
+        load, group = heapq.heappop(loads)
+        members[group].append(seq)
+        heapq.heappush(loads, (load + costs[seq], group))
+    return [[tests[seq] for seq in sorted(group)] for group in members]
+
+
+def _fork_for_tests(processes, partition_func):
+    """Set up forking test processes using a particular partition function
+
+    Args:
+        processes (int): Number of processes to use
+        partition_func (function): Function to split the tests into groups
+
+    Returns:
+        Function to pass to ConcurrentTestSuite
+    """
+    if 'partition_func' in inspect.signature(fork_for_tests).parameters:
+        return fork_for_tests(processes, partition_func=partition_func)
+
+    # Older versions of concurrencytest always use their partition_tests()
+    import concurrencytest
+    concurrencytest.partition_tests = partition_func
+    return fork_for_tests(processes)
+
+
 def run_test_suites(toolname, debug, verbosity, test_preserve_dirs, processes,
-                    test_name, toolpath, class_and_module_list):
+                    test_name, toolpath, class_and_module_list,
+                    timing_fname=None):
     """Run a series of test suites and collect the results
 
     Args:
@@ -176,6 +302,10 @@ def run_test_suites(toolname, debug, verbosity, test_preserve_dirs, processes,
         toolpath: List of paths to use for tools
         class_and_module_list: List of test classes (type class) and module
            names (type str) to run
+        timing_fname (str): File used to record how long each test takes, or
+           None. If provided, the durations from the previous run are used to
+           balance the tests between processes, so they all finish at about
+           the same time. The file is then updated with the new durations.
     """
     sys.argv = [sys.argv[0]]
     if debug:
@@ -194,9 +324,16 @@ def run_test_suites(toolname, debug, verbosity, test_preserve_dirs, processes,
         resultclass=FullTextTestResult,
     )
 
+    timings = read_test_timings(timing_fname) if timing_fname else {}
     if use_concurrent and processes != 1:
-        suite = ConcurrentTestSuite(suite,
-                fork_for_tests(processes or multiprocessing.cpu_count()))
+        processes = processes or multiprocessing.cpu_count()
+        if timing_fname:
+            def partition(suite, count):
+                return partition_tests_by_cost(suite, count, timings)
+            make_tests = _fork_for_tests(processes, partition)
+        else:
+            make_tests = fork_for_tests(processes)
+        suite = ConcurrentTestSuite(suite, make_tests)
 
     for module in class_and_module_list:
         if isinstance(module, str) and (not test_name or test_name == module):
@@ -222,7 +359,20 @@ def run_test_suites(toolname, debug, verbosity, test_preserve_dirs, processes,
             suite.addTests(loader.loadTestsFromTestCase(module))
 
     print(f" Running {toolname} tests ".center(70, "="))
+    start = time.monotonic()
     result = runner.run(suite)
     print()
 
+    if timing_fname:
+        elapsed = time.monotonic() - start
+        durations = result.durations
+        if durations:
+            slowest = max(durations, key=durations.get)
+            print('Test time %.1fs, wall time %.1fs, slowest %s (%.1fs)' %
+                  (sum(durations.values()), elapsed, slowest,
+                   durations[slowest]))
+        timings.update(durations)
+        with open(timing_fname, 'w', encoding='utf-8') as outf:
+            json.dump(timings, outf, indent=1, sort_keys=True)
+
     return result